@@ -0,0 +1,193 @@
+"""Time the pure-python serialization paths, and gate on a baseline run.
+
+    python benchmarks/bench_serialization.py [--sizes 1000,10000,100000]
+        [--baseline benchmarks/baseline.json] [--tolerance 0.25] [--save]
+
+Runs on in-memory shops from datagen.py, no database needed: rows shaped like
+what the ORM hands to pydantic, with coordinates as postgres' hex EWKB. Each
+case reports its median over `--repeat` runs, and the peak memory allocated
+while it runs, traced in a separate run since tracemalloc slows everything down.
+
+With `--save` the results become the new baseline. Otherwise the exit status
+is 1 if any case got slower than the baseline by more than `--tolerance`, or
+allocates more than `--memory-tolerance` extra at peak. Times are compared as
+the median ratio to a fixed reference workload, timed right before each run of
+the case, which takes out most of the difference between machines and of the
+machine's load drifting. Cases under `MIN_GATED_SECONDS` are too noisy to gate
+on time, only on memory. The baseline isn't committed: make it in the same job
+as the comparison, from the base branch, e.g.
+
+    git checkout origin/main && python benchmarks/bench_serialization.py --save
+    git checkout - && python benchmarks/bench_serialization.py
+"""
+import argparse
+import gc
+import json
+import statistics
+import struct
+import sys
+import timeit
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+from geoalchemy2 import WKBElement
+from pydantic import parse_obj_as
+
+from datagen import generate
+from somethingcoffee.core.pagination import CursorPage
+from somethingcoffee.domain.shops.schemas import ShopDB, ShopDBFull
+from somethingcoffee.domain.shops.utils import geojsonify
+from somethingcoffee.ui.configs import template_config
+
+BASELINE = Path(__file__).with_name("baseline.json")
+MIN_GATED_SECONDS = 0.01
+EWKB_POINT = struct.Struct("<BIIdd")  # little endian, type with srid flag, srid, x, y
+REFERENCE_ROWS = [
+    {"id": i, "name": f"shop {i}", "tags": [str(j) for j in range(i % 8)]}
+    for i in range(10_000)
+]
+TOJSON = template_config.engine_instance.engine.from_string("{{ shops | tojson }}")
+
+
+def orm_rows(n: int) -> list[SimpleNamespace]:
+    """`n` shops as attribute bags, like `Shop` instances with their tags loaded."""
+    dataset = generate(n, seed=0)
+    tags = {tag["id"]: SimpleNamespace(**tag) for tag in dataset.tags}
+    tags_of: dict[Any, list[SimpleNamespace]] = {}
+    for link in dataset.links:
+        tags_of.setdefault(link["shop_id"], []).append(tags[link["tag_id"]])
+    rows = []
+    for shop in dataset.shops:
+        lon, lat = map(float, shop["coordinates"][6:-1].split())
+        ewkb = EWKB_POINT.pack(1, 0x20000001, 4326, lon, lat).hex()
+        rows.append(
+            SimpleNamespace(
+                **{
+                    **shop,
+                    "coordinates": WKBElement(ewkb, srid=4326, extended=True),
+                    "tags": tags_of.get(shop["id"], []),
+                }
+            )
+        )
+    return rows
+
+
+def cases(n: int) -> dict[str, Callable[[], Any]]:
+    rows = orm_rows(n)
+    shops = parse_obj_as(list[ShopDBFull], rows)
+    page = CursorPage[ShopDBFull](items=shops, limit=n, next_cursor=None)
+    coordinates = [row.coordinates for row in rows]
+    return {
+        "parse_obj_as": lambda: parse_obj_as(list[ShopDBFull], rows),
+        "to_coords": lambda: [ShopDB.to_coords(v) for v in coordinates],
+        "page_json": lambda: page.json().encode(),
+        "geojsonify": lambda: geojsonify(shops),
+        # how pages used to embed whole tables, before they paged server side
+        "jinja_tojson": lambda: TOJSON.render(shops=shops),
+    }
+
+
+def reference() -> Any:
+    """Plain python work that the code under test doesn't change."""
+    return json.dumps(sorted(REFERENCE_ROWS, key=lambda row: row["name"]))
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> dict[str, float]:
+    times, ratios = [], []
+    for _ in range(repeat):
+        gc.collect()
+        unit = timeit.timeit(reference, number=1)
+        seconds = timeit.timeit(fn, number=1)
+        times.append(seconds)
+        ratios.append(seconds / unit)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": statistics.median(times),
+        "ratio": statistics.median(ratios),
+        "peak_bytes": peak,
+    }
+
+
+def regressions(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+    memory_tolerance: float,
+) -> list[str]:
+    found = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        gated = max(result["seconds"], before["seconds"]) >= MIN_GATED_SECONDS
+        if gated and result["ratio"] > before["ratio"] * (1 + tolerance):
+            found.append(
+                f"{name}: {result['ratio']:.2f}x the reference, "
+                f"was {before['ratio']:.2f}x"
+            )
+        if result["peak_bytes"] > before["peak_bytes"] * (1 + memory_tolerance):
+            found.append(
+                f"{name}: {result['peak_bytes'] / 1e6:.1f} MB peak, "
+                f"was {before['peak_bytes'] / 1e6:.1f} MB"
+            )
+    return found
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--only", help="comma separated case names")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--repeat", type=int, default=15, help="runs per case, a third at 100k"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, default=0.1)
+    parser.add_argument("--save", action="store_true", help="write a new baseline")
+    args = parser.parse_args(argv)
+
+    results: dict[str, dict[str, float]] = {}
+    for n in (int(size) for size in args.sizes.split(",")):
+        for name, fn in cases(n).items():
+            if args.only and name not in args.only.split(","):
+                continue
+            key = f"{name}/{n}"
+            repeat = args.repeat if n <= 10_000 else max(3, args.repeat // 3)
+            results[key] = measure(fn, repeat)
+            print(
+                f"{key:>24}: {results[key]['seconds'] * 1000:9.1f} ms "
+                f"{results[key]['ratio']:7.2f}x "
+                f"{results[key]['peak_bytes'] / 1e6:8.1f} MB",
+                file=sys.stderr,
+            )
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        saved = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        args.baseline.write_text(json.dumps({**saved, **results}, indent=2) + "\n")
+        return 0
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; run with --save", file=sys.stderr)
+        return 1
+    found = regressions(
+        results,
+        json.loads(args.baseline.read_text()),
+        args.tolerance,
+        args.memory_tolerance,
+    )
+    for regression in found:
+        print(f"regressed: {regression}", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
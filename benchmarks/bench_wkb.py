@@ -0,0 +1,46 @@
+"""Compare `wkb_to_coords` against the old shapely-based decoding.
+
+    python benchmarks/bench_wkb.py [n]
+"""
+import random
+import sys
+import timeit
+
+import shapely
+from geoalchemy2 import WKBElement
+from geoalchemy2.shape import to_shape
+from shapely.geometry import Point
+
+from somethingcoffee.domain.shops.schemas import Coordinates, wkb_to_coords
+
+
+def shapely_to_coords(v: WKBElement) -> Coordinates:
+    p = to_shape(v)
+    return Coordinates(lon=p.x, lat=p.y)
+
+
+def main(n: int = 10_000) -> None:
+    rng = random.Random(0)
+    # rows come back from postgres as hex EWKB
+    points = [
+        WKBElement(
+            shapely.to_wkb(
+                shapely.set_srid(
+                    Point(rng.uniform(-180, 180), rng.uniform(-90, 90)), 4326
+                ),
+                hex=True,
+                include_srid=True,
+            ),
+            srid=4326,
+            extended=True,
+        )
+        for _ in range(n)
+    ]
+
+    for name, fn in (("shapely", shapely_to_coords), ("struct", wkb_to_coords)):
+        best = min(timeit.repeat(lambda: [fn(p) for p in points], number=1, repeat=5))
+        print(f"{name:>8}: {best * 1000:8.1f} ms  ({best / n * 1e6:.2f} us/point)")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
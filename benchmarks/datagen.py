@@ -0,0 +1,207 @@
+"""Seed the database in DB_URL with a deterministic synthetic dataset.
+
+    python benchmarks/datagen.py [n_shops] [--tags 300] [--seed 0] [--reset]
+
+Shops cluster in neighbourhoods of real cities, a few big cities holding most
+of them, and carry 0-10 tags each, skewed towards popular tags. The same
+arguments give the same rows, ids included, so before/after runs see identical
+data. Refuses to touch a database that already has shops unless `--reset`.
+"""
+import argparse
+import asyncio
+import itertools
+import math
+import random
+import sys
+import uuid
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import delete, func, insert, select
+
+from somethingcoffee.core.database import engine
+from somethingcoffee.domain.shops.models import Shop, shop_tag
+from somethingcoffee.domain.tags.models import Tag
+
+# biggest first; city weights fall off as 1 / rank
+CITIES = [
+    ("Tokyo", "Japan", 139.69, 35.69),
+    ("New York", "United States", -73.99, 40.73),
+    ("London", "United Kingdom", -0.12, 51.51),
+    ("Seoul", "South Korea", 126.98, 37.57),
+    ("Melbourne", "Australia", 144.96, -37.81),
+    ("Paris", "France", 2.35, 48.86),
+    ("Los Angeles", "United States", -118.25, 34.05),
+    ("Berlin", "Germany", 13.40, 52.52),
+    ("Taipei", "Taiwan", 121.56, 25.04),
+    ("San Francisco", "United States", -122.42, 37.77),
+    ("Sydney", "Australia", 151.21, -33.87),
+    ("Osaka", "Japan", 135.50, 34.69),
+    ("Seattle", "United States", -122.33, 47.61),
+    ("Amsterdam", "Netherlands", 4.90, 52.37),
+    ("Copenhagen", "Denmark", 12.57, 55.68),
+    ("Oslo", "Norway", 10.75, 59.91),
+    ("Portland", "United States", -122.68, 45.52),
+    ("Toronto", "Canada", -79.38, 43.65),
+    ("Mexico City", "Mexico", -99.13, 19.43),
+    ("Bogota", "Colombia", -74.07, 4.71),
+    ("Sao Paulo", "Brazil", -46.63, -23.55),
+    ("Singapore", "Singapore", 103.82, 1.35),
+    ("Bangkok", "Thailand", 100.50, 13.76),
+    ("Ho Chi Minh City", "Vietnam", 106.70, 10.78),
+    ("Addis Ababa", "Ethiopia", 38.76, 9.03),
+    ("Nairobi", "Kenya", 36.82, -1.29),
+    ("Cape Town", "South Africa", 18.42, -33.92),
+    ("Dublin", "Ireland", -6.26, 53.35),
+    ("Vienna", "Austria", 16.37, 48.21),
+    ("Stockholm", "Sweden", 18.07, 59.33),
+    ("Reykjavik", "Iceland", -21.94, 64.15),
+    ("Wellington", "New Zealand", 174.78, -41.29),
+]
+NEIGHBOURHOODS = 6  # per city
+CITY_SPREAD_KM = 6  # of neighbourhoods around the centre
+NEIGHBOURHOOD_SPREAD_KM = 0.6  # of shops around their neighbourhood
+KM_PER_DEGREE = 111.32
+
+SCOPES = {
+    "amenity": ["wifi", "outlets", "seating", "patio", "parking", "restroom"],
+    "offering": ["oatmilk", "pastries", "decaf", "tea", "beans", "brunch"],
+    "brew": ["espresso", "pourover", "aeropress", "siphon", "coldbrew", "batch"],
+    "roast": ["light", "medium", "dark", "single origin", "blend", "natural"],
+    "vibe": ["quiet", "busy", "laptop friendly", "cozy", "minimal", "dog friendly"],
+}
+ADJECTIVES = ["little", "blue", "golden", "quiet", "northern", "wild", "copper", "slow"]
+NOUNS = ["bean", "cup", "roastery", "kettle", "press", "grinder", "crema", "drip"]
+STREETS = ["Main", "Station", "Market", "River", "Park", "Mill", "Church", "Harbour"]
+BATCH_SIZE = 2000
+
+
+@dataclass
+class Dataset:
+    tags: list[dict[str, Any]]
+    shops: list[dict[str, Any]]
+    links: list[dict[str, Any]]
+
+
+def zipf_weights(n: int) -> list[float]:
+    return [1 / rank for rank in range(1, n + 1)]
+
+
+def cumulative(weights: Sequence[float]) -> list[float]:
+    return list(itertools.accumulate(weights))
+
+
+def generate(n_shops: int, n_tags: int = 300, seed: int = 0) -> Dataset:
+    rng = random.Random(seed)
+
+    def new_id() -> uuid.UUID:
+        return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+    words = [(scope, word) for scope, names in SCOPES.items() for word in names]
+    tags = []
+    for i in range(n_tags):
+        scope, word = words[i % len(words)]
+        # the first round uses plain words, later rounds number them
+        name = word if i < len(words) else f"{word} {i // len(words)}"
+        tags.append({"id": new_id(), "scope": scope, "name": name})
+    tag_weights = cumulative(zipf_weights(n_tags))
+
+    neighbourhoods = []
+    for city, country, lon, lat in CITIES:
+        for _ in range(NEIGHBOURHOODS):
+            neighbourhoods.append(
+                (city, country, *jitter(rng, lon, lat, CITY_SPREAD_KM))
+            )
+    # a city's neighbourhoods share its weight
+    city_weights = cumulative(
+        [weight for weight in zipf_weights(len(CITIES)) for _ in range(NEIGHBOURHOODS)]
+    )
+
+    shops, links = [], []
+    for i, (city, country, lon, lat) in enumerate(
+        rng.choices(neighbourhoods, cum_weights=city_weights, k=n_shops)
+    ):
+        lon, lat = jitter(rng, lon, lat, NEIGHBOURHOOD_SPREAD_KM)
+        shop_id = new_id()
+        shops.append(
+            {
+                "id": shop_id,
+                "name": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}",
+                "country": country,
+                "city": city,
+                "address": f"{rng.randint(1, 400)} {rng.choice(STREETS)} St",
+                "coordinates": f"Point({lon:.6f} {lat:.6f})",
+                "roaster": rng.choice([None, f"{rng.choice(NOUNS)} roasters"]),
+                "hours_of_operation": "7am-5pm",
+                "website": f"https://example.com/shops/{i}",
+                "gmaps_link": None,
+                "description": " ".join(rng.choices(NOUNS + ADJECTIVES, k=12)),
+            }
+        )
+        chosen: set[int] = set()
+        wanted = rng.randint(0, 10)
+        while len(chosen) < wanted:
+            chosen.update(
+                rng.choices(
+                    range(n_tags), cum_weights=tag_weights, k=wanted - len(chosen)
+                )
+            )
+        links.extend({"shop_id": shop_id, "tag_id": tags[t]["id"]} for t in chosen)
+    return Dataset(tags=tags, shops=shops, links=links)
+
+
+def jitter(
+    rng: random.Random, lon: float, lat: float, spread_km: float
+) -> tuple[float, float]:
+    """A normally distributed point around `lon, lat`, `spread_km` either way."""
+    lat = max(min(lat + rng.gauss(0, spread_km / KM_PER_DEGREE), 89.9), -89.9)
+    scale = KM_PER_DEGREE * math.cos(math.radians(lat))
+    lon = (lon + rng.gauss(0, spread_km / scale) + 180) % 360 - 180
+    return lon, lat
+
+
+def batched(rows: Sequence[Any], size: int = BATCH_SIZE) -> Iterator[Sequence[Any]]:
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+async def load(dataset: Dataset, reset: bool) -> None:
+    async with engine.begin() as conn:
+        existing = await conn.scalar(select(func.count()).select_from(Shop))
+        if existing and not reset:
+            sys.exit(f"the database already has {existing} shops; pass --reset")
+        if reset:
+            await conn.execute(delete(shop_tag))
+            await conn.execute(delete(Shop))
+            await conn.execute(delete(Tag))
+        for table, rows in (
+            (Tag, dataset.tags),
+            (Shop, dataset.shops),
+            (shop_tag, dataset.links),
+        ):
+            for batch in batched(rows):
+                await conn.execute(insert(table), batch)
+        await conn.exec_driver_sql("ANALYZE shop, tag, shop_tag")
+    await engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("shops", type=int, nargs="?", default=10_000)
+    parser.add_argument("--tags", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--reset", action="store_true", help="delete every shop and tag first"
+    )
+    args = parser.parse_args(argv)
+    dataset = generate(args.shops, args.tags, args.seed)
+    asyncio.run(load(dataset, args.reset))
+    print(
+        f"seeded {len(dataset.shops)} shops, {len(dataset.tags)} tags, "
+        f"{len(dataset.links)} links"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""Drive every API and view route at a fixed concurrency and report latencies.
+
+    python benchmarks/loadtest.py [--requests 200] [--concurrency 10]
+        [--only shops:list,tags:get] [--seed 0] [--output results.json]
+
+Runs the app in-process over httpx's ASGI transport, against the database in
+DB_URL seeded by datagen.py, so the numbers include the client's share of the
+event loop but no network. Routes run one after another; the writes create,
+update and then delete their own rows, leaving the dataset as it was. Prints
+JSON with throughput and p50/p95/p99 latency per route. APP_* and CACHE_*
+settings apply as usual, e.g. CACHE_ENABLED=false for uncached numbers. Needs
+the `benchmarks` extra (pip install -e ".[benchmarks]").
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+from geoalchemy2 import Geometry
+from sqlalchemy import Float, cast, delete, func, select
+
+from somethingcoffee.core.application import app
+from somethingcoffee.core.database import engine
+from somethingcoffee.domain.shops.models import Shop, shop_tag
+from somethingcoffee.domain.tags.models import Tag
+
+PREFIX = "loadtest"  # names of everything the write routes create
+SAMPLE_SIZE = 1000  # shops sampled for ids and points
+# routes that send the whole dataset; capped so a run stays short
+HEAVY_REQUESTS = 5
+
+# (url, httpx request kwargs); None when there's nothing left to request
+Request = tuple[str, dict[str, Any]] | None
+
+
+@dataclass
+class Context:
+    """Ids and values sampled from the database, and rows made by the writes."""
+
+    rng: random.Random
+    shop_ids: list[str]
+    points: list[tuple[float, float]]
+    cities: list[str]
+    tag_ids: list[str]
+    tag_names: list[str]
+    created_shops: list[str] = field(default_factory=list)
+    created_tags: list[str] = field(default_factory=list)
+    counter: int = 0
+
+    def point(self) -> tuple[float, float]:
+        return self.rng.choice(self.points)
+
+    def bbox(self, half_width: float) -> str:
+        lon, lat = self.point()
+        corners = (
+            lon - half_width,
+            lat - half_width,
+            lon + half_width,
+            lat + half_width,
+        )
+        return ",".join(map(str, corners))
+
+    def unique(self, kind: str) -> str:
+        self.counter += 1
+        return f"{PREFIX} {kind} {self.counter} {uuid.uuid4().hex[:8]}"
+
+    def shop(self) -> dict[str, Any]:
+        lon, lat = self.point()
+        return {
+            "name": self.unique("shop"),
+            "country": "Nowhere",
+            "city": self.rng.choice(self.cities),
+            "address": "1 Load St",
+            "coordinates": {"lon": lon, "lat": lat},
+            "tag_names": self.rng.sample(self.tag_names, min(3, len(self.tag_names))),
+        }
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    request: Callable[[Context], Request]
+    # called with each successful response, e.g. to keep created ids
+    after: Callable[[Context, httpx.Response], None] | None = None
+    max_requests: int | None = None
+
+
+def tile(lon: float, lat: float, z: int) -> str:
+    n = 2**z
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return f"/api/shops/tiles/{z}/{x}/{y}.mvt"
+
+
+def lonlat(ctx: Context) -> dict[str, float]:
+    lon, lat = ctx.point()
+    return {"lon": lon, "lat": lat}
+
+
+def get(url: str, **params: Any) -> Request:
+    return url, {"params": params}
+
+
+def datatable(url: str, columns: list[str], **params: Any) -> Request:
+    """A DataTables server-side request for the first page, ordered on column 2."""
+    query = {"draw": 1, "start": 0, "length": 10, "search[value]": ""}
+    for i, column in enumerate(columns):
+        query[f"columns[{i}][data]"] = column
+    query.update({"order[0][column]": 2, "order[0][dir]": "asc"})
+    return get(url, **{**query, **params})
+
+
+def bulk_body(ctx: Context) -> Request:
+    lines = []
+    for _ in range(20):
+        shop = ctx.shop()
+        coordinates = shop.pop("coordinates")
+        lines.append(json.dumps({**shop, **coordinates}))
+    content = "\n".join(lines).encode()
+    return "/api/shops/bulk", {"params": {"format": "ndjson"}, "content": content}
+
+
+def keep(
+    ids: Callable[[Context], list[str]]
+) -> Callable[[Context, httpx.Response], None]:
+    return lambda ctx, response: ids(ctx).append(response.json()["id"])
+
+
+def on(ids: Callable[[Context], list[str]], url: str, **kwargs: Any) -> Callable:
+    def request(ctx: Context) -> Request:
+        chosen = ids(ctx)
+        if not chosen:
+            return None
+        target = url.format(id=ctx.rng.choice(chosen))
+        return target, {key: value(ctx) for key, value in kwargs.items()}
+
+    return request
+
+
+def removing(ids: Callable[[Context], list[str]], url: str) -> Callable:
+    def request(ctx: Context) -> Request:
+        chosen = ids(ctx)
+        return (url.format(id=chosen.pop()), {}) if chosen else None
+
+    return request
+
+
+def shops(ctx: Context) -> list[str]:
+    return ctx.shop_ids
+
+
+def tags(ctx: Context) -> list[str]:
+    return ctx.tag_ids
+
+
+def created_shops(ctx: Context) -> list[str]:
+    return ctx.created_shops
+
+
+def created_tags(ctx: Context) -> list[str]:
+    return ctx.created_tags
+
+
+SCENARIOS = [
+    # ShopAPIController
+    Scenario(
+        "shops:list",
+        "GET",
+        lambda ctx: get("/api/shops", limit=ctx.rng.choice([10, 50, 100])),
+    ),
+    Scenario(
+        "shops:list?fields",
+        "GET",
+        lambda ctx: get("/api/shops", limit=100, fields="name,city,coordinates"),
+    ),
+    Scenario(
+        "shops:list?format=ndjson",
+        "GET",
+        lambda ctx: get("/api/shops", format="ndjson"),
+        max_requests=HEAVY_REQUESTS,
+    ),
+    Scenario(
+        "shops:listdwithin",
+        "GET",
+        lambda ctx: get("/api/shops/dwithin", **lonlat(ctx), radius=2000, limit=50),
+    ),
+    Scenario(
+        "shops:search",
+        "GET",
+        lambda ctx: get(
+            "/api/shops/search", q=ctx.rng.choice(["roastery", "kettle", "bean"])
+        ),
+    ),
+    Scenario(
+        "shops:listbbox",
+        "GET",
+        lambda ctx: get("/api/shops/bbox", bbox=ctx.bbox(0.05), limit=50),
+    ),
+    Scenario(
+        "shops:listclusters",
+        "GET",
+        lambda ctx: get("/api/shops/clusters", bbox=ctx.bbox(1), zoom=9),
+    ),
+    Scenario(
+        "shops:listknn",
+        "GET",
+        lambda ctx: get("/api/shops/knn", **lonlat(ctx), k=10),
+    ),
+    Scenario(
+        "shops:listknn?tags",
+        "GET",
+        lambda ctx: get(
+            "/api/shops/knn", **lonlat(ctx), k=10, tags=ctx.rng.choice(ctx.tag_names)
+        ),
+    ),
+    Scenario(
+        "shops:listgeojson",
+        "GET",
+        lambda ctx: get("/api/shops/geojson", limit=100),
+    ),
+    Scenario(
+        "shops:table",
+        "GET",
+        lambda ctx: datatable(
+            "/api/shops/table",
+            ["name", "country", "city", "tags"],
+            **{"search[value]": ctx.rng.choice(ctx.cities)},
+        ),
+    ),
+    Scenario(
+        "shops:table?tags",
+        "GET",
+        lambda ctx: datatable(
+            "/api/shops/table",
+            ["name", "country", "city", "tags"],
+            tags=ctx.rng.choice(ctx.tag_names),
+        ),
+    ),
+    Scenario("shops:tile", "GET", lambda ctx: get(tile(*ctx.point(), 12))),
+    Scenario(
+        "shops:facets",
+        "GET",
+        lambda ctx: get("/api/shops/facets", city=ctx.rng.choice(ctx.cities)),
+    ),
+    Scenario(
+        "shops:export",
+        "GET",
+        lambda ctx: get("/api/shops/export", format="csv"),
+        max_requests=HEAVY_REQUESTS,
+    ),
+    Scenario("shops:get", "GET", on(shops, "/api/shops/{id}")),
+    Scenario("shops:bulk", "POST", bulk_body),
+    Scenario(
+        "shops:create",
+        "POST",
+        lambda ctx: ("/api/shops", {"json": ctx.shop()}),
+        after=keep(created_shops),
+    ),
+    Scenario(
+        "shops:update",
+        "PATCH",
+        on(
+            created_shops,
+            "/api/shops/{id}",
+            json=lambda ctx: {"description": ctx.unique("description")},
+        ),
+    ),
+    Scenario("shops:delete", "DELETE", removing(created_shops, "/api/shops/{id}")),
+    # TagAPIController
+    Scenario("tags:list", "GET", lambda ctx: get("/api/tags", limit=50)),
+    Scenario(
+        "tags:table",
+        "GET",
+        lambda ctx: datatable("/api/tags/table", ["id", "scope", "name", "shop_count"]),
+    ),
+    Scenario("tags:get", "GET", on(tags, "/api/tags/{id}")),
+    Scenario(
+        "tags:create",
+        "POST",
+        lambda ctx: (
+            "/api/tags",
+            {"json": {"scope": PREFIX, "name": ctx.unique("tag")}},
+        ),
+        after=keep(created_tags),
+    ),
+    Scenario(
+        "tags:update",
+        "PATCH",
+        on(
+            created_tags,
+            "/api/tags/{id}",
+            json=lambda ctx: {"name": ctx.unique("tag")},
+        ),
+    ),
+    Scenario("tags:delete", "DELETE", removing(created_tags, "/api/tags/{id}")),
+    # views
+    Scenario("views:home", "GET", lambda ctx: get("/")),
+    Scenario("views:map", "GET", lambda ctx: get("/map"), max_requests=HEAVY_REQUESTS),
+    Scenario("views:map?mode=tiles", "GET", lambda ctx: get("/map", mode="tiles")),
+    Scenario("views:shops", "GET", lambda ctx: get("/shops")),
+    Scenario("views:shop", "GET", on(shops, "/shops/{id}")),
+    Scenario("admin:shops", "GET", lambda ctx: get("/admin/shops/list")),
+    Scenario("admin:shops:create", "GET", lambda ctx: get("/admin/shops/create")),
+    Scenario("admin:shops:edit", "GET", on(shops, "/admin/shops/{id}/edit")),
+    Scenario("admin:tags", "GET", lambda ctx: get("/admin/tags/list")),
+    Scenario("admin:tags:create", "GET", lambda ctx: get("/admin/tags/create")),
+    Scenario("admin:tags:edit", "GET", on(tags, "/admin/tags/{id}/edit")),
+    Scenario("admin:dashboard", "GET", lambda ctx: get("/admin")),
+]
+
+
+async def sample(seed: int) -> Context:
+    geom = cast(Shop.coordinates, Geometry(srid=4326))
+    async with engine.connect() as conn:
+        rows = (
+            await conn.execute(
+                select(
+                    Shop.id,
+                    cast(func.ST_X(geom), Float),
+                    cast(func.ST_Y(geom), Float),
+                    Shop.city,
+                )
+                .order_by(Shop.id)
+                .limit(SAMPLE_SIZE)
+            )
+        ).all()
+        tag_rows = (await conn.execute(select(Tag.id, Tag.name).order_by(Tag.id))).all()
+    if not rows or not tag_rows:
+        sys.exit("no shops or tags to test against; seed with benchmarks/datagen.py")
+    return Context(
+        rng=random.Random(seed),
+        shop_ids=[str(row[0]) for row in rows],
+        points=[(row[1], row[2]) for row in rows],
+        cities=sorted({row[3] for row in rows}),
+        tag_ids=[str(row[0]) for row in tag_rows],
+        tag_names=[row[1] for row in tag_rows],
+    )
+
+
+async def run(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    ctx: Context,
+    requests: int,
+    concurrency: int,
+) -> dict[str, Any]:
+    if scenario.max_requests is not None:
+        requests = min(requests, scenario.max_requests)
+    remaining = iter(range(requests))
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+
+    async def worker() -> None:
+        for _ in remaining:
+            request = scenario.request(ctx)
+            if request is None:
+                return
+            url, kwargs = request
+            start = time.perf_counter()
+            response = await client.request(scenario.method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            status = str(response.status_code)
+            statuses[status] = statuses.get(status, 0) + 1
+            if response.is_success and scenario.after is not None:
+                scenario.after(ctx, response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        **summarize(latencies, elapsed),
+    }
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict[str, float | None]:
+    if not latencies:
+        keys = ("throughput_rps", "mean_ms", "p50_ms", "p95_ms", "p99_ms")
+        return dict.fromkeys(keys)
+    ms = [latency * 1000 for latency in latencies]
+    # the 99 cut points between percentiles; a single sample is every percentile
+    cuts = (
+        statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    )
+    return {
+        "throughput_rps": round(len(ms) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+    }
+
+
+async def cleanup() -> None:
+    """Drop whatever the write routes left behind, e.g. after a failed run."""
+    ours = select(Shop.id).where(Shop.name.startswith(PREFIX))
+    async with engine.begin() as conn:
+        await conn.execute(delete(shop_tag).where(shop_tag.c.shop_id.in_(ours)))
+        await conn.execute(delete(Shop).where(Shop.name.startswith(PREFIX)))
+        tagged = select(Tag.id).where(Tag.name.startswith(PREFIX))
+        await conn.execute(delete(shop_tag).where(shop_tag.c.tag_id.in_(tagged)))
+        await conn.execute(delete(Tag).where(Tag.name.startswith(PREFIX)))
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    scenarios = SCENARIOS
+    if args.only:
+        wanted = set(args.only.split(","))
+        scenarios = [s for s in SCENARIOS if s.name in wanted]
+    ctx = await sample(args.seed)
+    results: dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)  # type: ignore[arg-type]
+    try:
+        async with app.lifespan(), httpx.AsyncClient(
+            transport=transport, base_url="http://loadtest"
+        ) as client:
+            for scenario in scenarios:
+                results[scenario.name] = await run(
+                    client, scenario, ctx, args.requests, args.concurrency
+                )
+                print(f"{scenario.name}: {results[scenario.name]}", file=sys.stderr)
+    finally:
+        await cleanup()
+        await engine.dispose()
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "python": platform.python_version(),
+        },
+        "routes": results,
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="per route")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--only", help="comma separated scenario names")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
@@ -0,0 +1,24 @@
+"""added shop coordinates geometry index
+
+Revision ID: 9c41d7e2b5a8
+Revises: 6f0c2b9e41d7
+Create Date: 2026-10-18 14:22:05.913406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c41d7e2b5a8'
+down_revision = '6f0c2b9e41d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_shop_coordinates_geometry', 'shop', [sa.text('(CAST(coordinates AS geometry(GEOMETRY,4326)))')], unique=False, postgresql_using='gist')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shop_coordinates_geometry', table_name='shop', postgresql_using='gist')
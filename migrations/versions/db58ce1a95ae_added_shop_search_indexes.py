@@ -0,0 +1,32 @@
+"""added shop search indexes
+
+Revision ID: db58ce1a95ae
+Revises: 4524ffa36ec1
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'db58ce1a95ae'
+down_revision = '4524ffa36ec1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('shop', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("setweight(to_tsvector('english', coalesce(name, '')), 'A') || setweight(to_tsvector('english', coalesce(roaster, '')), 'B') || setweight(to_tsvector('english', coalesce(city || ' ' || address, '')), 'C') || setweight(to_tsvector('english', coalesce(description, '')), 'D')", persisted=True), nullable=False))
+    op.create_index('ix_shop_search_vector', 'shop', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_shop_name_trgm', 'shop', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_shop_city_trgm', 'shop', ['city'], unique=False, postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shop_city_trgm', table_name='shop', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'})
+    op.drop_index('ix_shop_name_trgm', table_name='shop', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.drop_index('ix_shop_search_vector', table_name='shop', postgresql_using='gin')
+    op.drop_column('shop', 'search_vector')
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from somethingcoffee.core.cache import cache
+from somethingcoffee.core.database import async_session_factory, engine
+from somethingcoffee.core.notify import notifier
+from somethingcoffee.domain.shops import facets, spatial_index
+from somethingcoffee.domain.shops.bulk import (
+    IMPORT_BATCH_SIZE,
+    export_shops,
+    import_shops,
+    parse_records,
+)
+
+# file extension -> format, when --format isn't given
+FORMATS = {
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".csv": "csv",
+    ".geojson": "geojson",
+    ".json": "geojson",
+}
+
+
+async def import_command(args: argparse.Namespace) -> int:
+    fmt = args.format or FORMATS.get(args.file.suffix)
+    if fmt is None:
+        sys.exit(f"Can't tell the format of {args.file}; pass --format")
+    try:
+        records = parse_records(args.file.read_bytes(), fmt)
+    except ValueError as e:
+        sys.exit(f"Can't read {args.file}: {e}")
+    async with async_session_factory() as session:
+        result = await import_shops(session, records, batch_size=args.batch_size)
+        await session.commit()
+    if result.inserted:
+        # the running app's workers reload everything, as they can't tell what changed
+        await notifier.connect()
+        await cache.invalidate("shops", "tags")
+        await notifier.publish(spatial_index.NOTIFY_CHANNEL, "*")
+        await notifier.publish(facets.NOTIFY_CHANNEL, "shops:*")
+        await notifier.close()
+    await engine.dispose()
+    for error in result.errors:
+        print(f"row {error.row}: {error.error}", file=sys.stderr)
+    print(
+        f"inserted {result.inserted}, skipped {result.skipped}, errors {len(result.errors)}"
+    )
+    return 1 if result.errors else 0
+
+
+async def export_command(args: argparse.Namespace) -> int:
+    out = args.output.open("w", newline="") if args.output else sys.stdout
+    try:
+        async for chunk in export_shops(args.format):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    await engine.dispose()
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="somethingcoffee")
+    commands = parser.add_subparsers(required=True)
+
+    importer = commands.add_parser("import", help="bulk import shops from a file")
+    importer.add_argument("file", type=Path)
+    importer.add_argument("--format", choices=["ndjson", "csv", "geojson"])
+    importer.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    importer.set_defaults(command=import_command)
+
+    exporter = commands.add_parser("export", help="export every shop with its tags")
+    exporter.add_argument(
+        "--format", choices=["csv", "ndjson", "geojsonseq"], default="ndjson"
+    )
+    exporter.add_argument("-o", "--output", type=Path, help="defaults to stdout")
+    exporter.set_defaults(command=export_command)
+
+    args = parser.parse_args(argv)
+    return asyncio.run(args.command(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
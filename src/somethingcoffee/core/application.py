@@ -1,12 +1,29 @@
 from litestar import Litestar
 
 from somethingcoffee import domain
-from somethingcoffee.core.database import sqlalchemy_plugin
-from somethingcoffee.ui.configs import static_files_config, template_config
+from somethingcoffee.core.cache import cache
+from somethingcoffee.core.database import (
+    ReplicaRoutingMiddleware,
+    dispose_replicas,
+    sqlalchemy_plugin,
+)
+from somethingcoffee.core.notify import notifier
+from somethingcoffee.core.profiler import QueryProfilerMiddleware
+from somethingcoffee.core.timing import TimingMiddleware, mark_handled
+from somethingcoffee.domain.shops.spatial_index import shop_index
+from somethingcoffee.ui.configs import (
+    precompile_templates,
+    static_files_config,
+    template_config,
+)
 
 app = Litestar(
     route_handlers=[*domain.routes],
     plugins=[sqlalchemy_plugin],
+    on_startup=[precompile_templates, cache.start, shop_index.start],
+    on_shutdown=[notifier.close, dispose_replicas],
+    middleware=[TimingMiddleware, QueryProfilerMiddleware, ReplicaRoutingMiddleware],
+    after_request=mark_handled,
     template_config=template_config,
     static_files_config=static_files_config,
     debug=True,
@@ -0,0 +1,359 @@
+import hashlib
+import secrets
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Mapping, Sequence
+from dataclasses import asdict, dataclass
+from typing import Any, Protocol
+from urllib.parse import urlencode
+
+from litestar import Request, Response
+from litestar.enums import MediaType
+from litestar.status_codes import HTTP_304_NOT_MODIFIED
+
+from somethingcoffee.core.database import primary_reads
+from somethingcoffee.core.notify import notifier
+from somethingcoffee.core.settings import cache as cache_settings, db
+
+__all__ = [
+    "NOTIFY_CHANNEL",
+    "CacheBackend",
+    "CacheKey",
+    "CacheStats",
+    "MemoryBackend",
+    "RedisBackend",
+    "ResponseCache",
+    "cache",
+    "cached_response",
+]
+
+NOTIFY_CHANNEL = "response_cache"
+NOTIFY_MAX_BYTES = 7000  # pg_notify payloads must stay under 8000 bytes
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+class CacheBackend(Protocol):
+    """Byte store with TTLs plus monotonic version counters.
+
+    Version counters must never be evicted, or stale entries could become
+    reachable again once a counter restarts. The epoch changes whenever the
+    counters do restart, so ETags from before can't match.
+    """
+
+    async def epoch(self) -> str:
+        ...
+
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    async def set(self, key: str, value: bytes, ttl: int | None) -> None:
+        ...
+
+    async def versions(self, scopes: Sequence[str]) -> list[int]:
+        ...
+
+    async def bump(self, scopes: Sequence[str]) -> None:
+        ...
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry TTL, bounded by the total size of its values.
+
+    The epoch and versions are this process's own. Invalidations reach the other
+    workers, but their ETags never match each other's, so with several workers a
+    conditional GET only gets its 304 from the worker that sent the ETag; use the
+    redis backend for revalidation that works across workers.
+    """
+
+    def __init__(self, max_bytes: int, stats: CacheStats) -> None:
+        self.max_bytes = max_bytes
+        self.stats = stats
+        self._entries: OrderedDict[str, tuple[bytes, float | None]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._epoch = secrets.token_hex(8)
+
+    async def epoch(self) -> str:
+        return self._epoch
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            self._drop(key)
+            self.stats.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int | None) -> None:
+        if len(value) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        expires = time.monotonic() + ttl if ttl else None
+        self._entries[key] = (value, expires)
+        self.stats.entries += 1
+        self.stats.bytes += len(value)
+        while self.stats.bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    async def versions(self, scopes: Sequence[str]) -> list[int]:
+        return [self._versions.get(scope, 0) for scope in scopes]
+
+    async def bump(self, scopes: Sequence[str]) -> None:
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def _drop(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self.stats.entries -= 1
+        self.stats.bytes -= len(value)
+
+
+class RedisBackend:
+    """Shared backend, so every worker sees the same entries and versions.
+
+    Memory is bounded by the redis server's own `maxmemory` policy; versions are
+    stored without a TTL and should live in a `noeviction`/`volatile-*` instance.
+    """
+
+    def __init__(self, url: str) -> None:
+        try:
+            from redis.asyncio import Redis
+        except ImportError as e:
+            raise ImportError(
+                "CACHE_BACKEND=redis requires the redis package (pip install redis)"
+            ) from e
+        self._redis = Redis.from_url(url)
+        self._epoch: str | None = None
+
+    async def epoch(self) -> str:
+        if self._epoch is None:
+            await self._redis.set("version:epoch", secrets.token_hex(8), nx=True)
+            self._epoch = (await self._redis.get("version:epoch")).decode()
+        return self._epoch
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._redis.get(f"cache:{key}")
+
+    async def set(self, key: str, value: bytes, ttl: int | None) -> None:
+        await self._redis.set(f"cache:{key}", value, ex=ttl)
+
+    async def versions(self, scopes: Sequence[str]) -> list[int]:
+        if not scopes:
+            return []  # MGET needs at least one key
+        values = await self._redis.mget([f"version:{scope}" for scope in scopes])
+        return [int(v) if v is not None else 0 for v in values]
+
+    async def bump(self, scopes: Sequence[str]) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for scope in scopes:
+                pipe.incr(f"version:{scope}")
+            await pipe.execute()
+
+
+@dataclass
+class CacheKey:
+    key: str
+    epoch: str
+    # one of its scopes changed within the replica pin window
+    recent_write: bool = False
+
+    @property
+    def etag(self) -> str:
+        """Strong ETag; changes whenever a scope the entry depends on is written."""
+        return '"' + hashlib.sha1(f"{self.epoch}/{self.key}".encode()).hexdigest() + '"'
+
+
+class ResponseCache:
+    """Read-through cache of encoded responses.
+
+    Entries are keyed by the current version of every scope they were built
+    from, so writes invalidate by bumping a scope instead of deleting keys.
+    Scopes are `shops`/`tags` for collections and `shop:<id>`/`tag:<id>` for
+    single resources. Versions are tracked even when caching is disabled, since
+    ETags are derived from them.
+
+    Content loaded within `pin_seconds` of one of its scopes changing is read
+    from the primary, as a lagging replica would otherwise get pre-write rows
+    stored, or ETagged, under the new versions. Changes are timed from when this
+    worker first sees them, which is never before the write.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        stats: CacheStats,
+        ttl: int,
+        enabled: bool = True,
+        pin_seconds: float = 0,
+    ) -> None:
+        self.backend = backend
+        self.stats = stats
+        self.ttl = ttl
+        self.enabled = enabled
+        self.pin_seconds = pin_seconds
+        self._changed: dict[str, tuple[int, float]] = {}  # scope -> version, seen at
+
+    async def key(
+        self,
+        name: str,
+        *,
+        scopes: Sequence[str],
+        params: Mapping[str, Any] | None = None,
+    ) -> CacheKey:
+        versions = await self.backend.versions(scopes)
+        query = urlencode(sorted((params or {}).items()))
+        key = f"{name}?{query}@" + ",".join(
+            f"{scope}={version}" for scope, version in zip(scopes, versions)
+        )
+        return CacheKey(
+            key=key,
+            epoch=await self.backend.epoch(),
+            recent_write=self._recent_write(scopes, versions),
+        )
+
+    def _recent_write(self, scopes: Sequence[str], versions: list[int]) -> bool:
+        now = time.monotonic()
+        recent = False
+        for scope, version in zip(scopes, versions):
+            seen = self._changed.get(scope)
+            if seen is None or seen[0] != version:
+                seen = self._changed[scope] = (version, now)
+            recent = recent or now - seen[1] < self.pin_seconds
+        return recent
+
+    async def fetch(
+        self, key: CacheKey, loader: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        if not self.enabled:
+            return await self._load(loader, key.recent_write)
+
+        value = await self.backend.get(key.key)
+        if value is not None:
+            self.stats.hits += 1
+            return value
+        self.stats.misses += 1
+        value = await self._load(loader, key.recent_write)
+        await self.backend.set(key.key, value, self.ttl)
+        return value
+
+    @staticmethod
+    async def _load(loader: Callable[[], Awaitable[bytes]], primary: bool) -> bytes:
+        if not primary:
+            return await loader()
+        with primary_reads():
+            return await loader()
+
+    async def get_or_set(
+        self,
+        name: str,
+        loader: Callable[[], Awaitable[bytes]],
+        *,
+        scopes: Sequence[str],
+        params: Mapping[str, Any] | None = None,
+    ) -> bytes:
+        return await self.fetch(
+            await self.key(name, scopes=scopes, params=params), loader
+        )
+
+    async def invalidate(self, *scopes: str) -> None:
+        if not scopes:
+            return
+        await self.backend.bump(scopes)
+        if isinstance(self.backend, MemoryBackend):
+            for payload in _payloads(scopes):
+                await notifier.publish(NOTIFY_CHANNEL, payload)
+
+    async def start(self) -> None:
+        """Follow other workers' invalidations, when versions live in each process.
+
+        Otherwise a write would only bump the worker that handled it, and the rest
+        would keep serving, and answering 304 to, their old versions.
+        """
+        if isinstance(self.backend, MemoryBackend):
+            await notifier.subscribe(NOTIFY_CHANNEL, self._on_notify)
+
+    async def _on_notify(self, payload: str) -> None:
+        await self.backend.bump([scope for scope in payload.split(",") if scope])
+
+    def snapshot(self) -> dict[str, int]:
+        return asdict(self.stats)
+
+
+def _payloads(scopes: Sequence[str]) -> list[str]:
+    """Comma separated `scopes`, split up to fit in notifications."""
+    payloads, chunk, size = [], [], 0
+    for scope in scopes:
+        if chunk and size + len(scope) + 1 > NOTIFY_MAX_BYTES:
+            payloads.append(",".join(chunk))
+            chunk, size = [], 0
+        chunk.append(scope)
+        size += len(scope) + 1
+    if chunk:
+        payloads.append(",".join(chunk))
+    return payloads
+
+
+def create_cache() -> ResponseCache:
+    stats = CacheStats()
+    backend: CacheBackend
+    if cache_settings.BACKEND == "redis":
+        backend = RedisBackend(cache_settings.REDIS_URL)
+    else:
+        backend = MemoryBackend(cache_settings.MAX_BYTES, stats)
+    return ResponseCache(
+        backend,
+        stats,
+        cache_settings.TTL,
+        cache_settings.ENABLED,
+        pin_seconds=db.REPLICA_PIN_SECONDS,
+    )
+
+
+cache = create_cache()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of `etag` against an If-None-Match header (RFC 9110 13.1.2)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+
+async def cached_response(
+    request: Request,
+    name: str,
+    loader: Callable[[], Awaitable[bytes]],
+    *,
+    scopes: Sequence[str],
+    params: Mapping[str, Any] | None = None,
+    media_type: str = MediaType.JSON,
+) -> Response[bytes]:
+    """Serve `loader`'s content through the cache, answering 304 on a matching ETag.
+
+    A matching request returns before the loader (and its queries) ever run.
+    """
+    key = await cache.key(name, scopes=scopes, params=params)
+    headers = {"ETag": key.etag}
+    if etag_matches(request.headers.get("if-none-match"), key.etag):
+        return Response(b"", status_code=HTTP_304_NOT_MODIFIED, headers=headers)
+    content = await cache.fetch(key, loader)
+    return Response(content, media_type=media_type, headers=headers)
@@ -1,18 +1,238 @@
+import random
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any
+
 from litestar.contrib.sqlalchemy.plugins.init import (
     SQLAlchemyAsyncConfig,
     SQLAlchemyInitPlugin,
 )
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from litestar.datastructures import Cookie, MutableScopeHeaders
+from litestar.types import ASGIApp, Message, Receive, Scope, Send
+from sqlalchemy import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
+from sqlalchemy.sql.dml import UpdateBase
 
+from somethingcoffee.core import settings, timing
+from somethingcoffee.core.profiler import profiler
 from somethingcoffee.core.settings import db
 
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+PIN_COOKIE = "db_primary"
+
+# set per request by `ReplicaRoutingMiddleware`
+reads_from_replica: ContextVar[bool] = ContextVar("reads_from_replica", default=False)
+
+
+@contextmanager
+def primary_reads() -> Iterator[None]:
+    """Read from the primary inside the block, whichever way the request was routed."""
+    token = reads_from_replica.set(False)
+    try:
+        yield
+    finally:
+        reads_from_replica.reset(token)
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0  # connections handed out of the pool
+    timeouts: int = 0  # checkouts that gave up after POOL_TIMEOUT
+    wait_ms: float = 0  # total time spent getting connections, timeouts included
+    max_wait_ms: float = 0
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """Queue pool that times each checkout and counts timeouts."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self) -> "MeteredPool":
+        pool = super().recreate()
+        pool.stats = self.stats  # keep counting across engine.dispose()
+        return pool
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.timeouts += 1
+            raise
+        else:
+            self.stats.checkouts += 1
+        finally:
+            waited = time.perf_counter() - start
+            timing.add("pool", waited)
+            waited *= 1000
+            self.stats.wait_ms += waited
+            self.stats.max_wait_ms = max(self.stats.max_wait_ms, waited)
+        return entry
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),  # negative until the pool fills
+            **asdict(self.stats),
+        }
+
+
+def create_engine(url: str) -> AsyncEngine:
+    """An engine with the pool and statement cache from `DatabaseSettings`."""
+    return create_async_engine(
+        url,
+        poolclass=MeteredPool,
+        pool_size=db.POOL_SIZE,
+        max_overflow=db.MAX_OVERFLOW,
+        pool_timeout=db.POOL_TIMEOUT,
+        pool_recycle=db.POOL_RECYCLE,
+        pool_pre_ping=db.POOL_PRE_PING,
+        connect_args={
+            # sqlalchemy's cache of asyncpg prepared statements, and asyncpg's own
+            "prepared_statement_cache_size": db.STATEMENT_CACHE_SIZE,
+            "statement_cache_size": db.STATEMENT_CACHE_SIZE,
+        },
+    )
+
+
+engine = create_engine(db.URL)
+replica_engines = [create_engine(url) for url in db.REPLICA_URLS]
+for _engine in (engine, *replica_engines):
+    timing.time_engine(_engine.sync_engine)
+    if settings.app.PROFILE_QUERIES:
+        profiler.instrument(_engine.sync_engine)
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica while `reads_from_replica` is set.
+
+    Each session sticks to one replica. Flushes and DML go to the primary (`bind`),
+    and so does everything after them, so a session reads its own writes.
+
+    Also times executes and flushes as the "orm" phase, less their SQL and
+    connection checkouts.
+    """
+
+    replicas: Sequence[Engine] = [e.sync_engine for e in replica_engines]
+    _replica: Engine | None = None
+    _wrote = False
+    _timing = False
+
+    def execute(self, *args: Any, **kw: Any) -> Any:
+        return self._timed(super().execute, *args, **kw)
+
+    def flush(self, *args: Any, **kw: Any) -> None:
+        self._timed(super().flush, *args, **kw)
+
+    def _timed(self, method: Any, *args: Any, **kw: Any) -> Any:
+        timings = timing.current()
+        # loaders and autoflush execute from inside; count the outermost call
+        if timings is None or self._timing:
+            return method(*args, **kw)
+        self._timing = True
+        before = timings.get("sql", 0.0) + timings.get("pool", 0.0)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kw)
+        finally:
+            self._timing = False
+            inner = timings.get("sql", 0.0) + timings.get("pool", 0.0) - before
+            elapsed = time.perf_counter() - start - inner
+            timing.add("orm", max(elapsed, 0.0))
+
+    def get_bind(self, mapper: Any = None, *, clause: Any = None, **kw: Any) -> Any:
+        if self._flushing or isinstance(clause, UpdateBase):
+            self._wrote = True
+        if self.replicas and reads_from_replica.get() and not self._wrote:
+            if self._replica is None:
+                self._replica = random.choice(self.replicas)
+            return self._replica
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
 # create engine and session_maker manually to allow for expire_on_commit=False
-engine = create_async_engine(db.URL)
 async_session_factory: async_sessionmaker[AsyncSession] = async_sessionmaker(
     engine,
     expire_on_commit=False,  # ensures joined attributes are available after commit
+    sync_session_class=RoutingSession,
+)
+# for state that must not lag behind writes, like the in-process indexes
+primary_session_factory: async_sessionmaker[AsyncSession] = async_sessionmaker(
+    engine, expire_on_commit=False
 )
 
+
+class ReplicaRoutingMiddleware:
+    """Route a request's reads to the replicas if it's safe to.
+
+    Safe methods read from a replica, unless the client wrote within the last
+    `REPLICA_PIN_SECONDS`: successful writes set a short-lived cookie that pins
+    the client's reads to the primary until replicas have caught up. Cache fills of
+    data written within that window read from the primary too, see `ResponseCache`.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not replica_engines:
+            await self.app(scope, receive, send)
+            return
+        safe = scope["method"] in SAFE_METHODS
+        pinned = any(
+            part.strip().startswith(f"{PIN_COOKIE}=")
+            for name, value in scope["headers"]
+            if name == b"cookie"
+            for part in value.decode("latin-1").split(";")
+        )
+
+        async def pin(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = Cookie(
+                    key=PIN_COOKIE,
+                    value="1",
+                    max_age=db.REPLICA_PIN_SECONDS,
+                    httponly=True,
+                    samesite="lax",
+                )
+                MutableScopeHeaders.from_message(message).add(
+                    "set-cookie", cookie.to_header(header="")
+                )
+            await send(message)
+
+        token = reads_from_replica.set(safe and not pinned)
+        try:
+            await self.app(scope, receive, send if safe else pin)
+        finally:
+            reads_from_replica.reset(token)
+
+
+def pool_snapshot(target: AsyncEngine = engine) -> dict[str, float]:
+    """Live pool counters for one of this worker's engines, the primary by default."""
+    return target.pool.snapshot()  # type: ignore[attr-defined]
+
+
+async def dispose_replicas() -> None:
+    # the plugin only disposes the primary
+    for replica in replica_engines:
+        await replica.dispose()
+
+
 # setup sqla config and pass it to plugin
 sqlalchemy_config = SQLAlchemyAsyncConfig(
     engine_instance=engine,
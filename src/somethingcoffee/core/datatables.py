@@ -0,0 +1,247 @@
+import re
+from collections.abc import Awaitable, Callable, Mapping
+from dataclasses import dataclass, field
+from typing import Any, Generic, Literal, TypeVar
+
+from litestar import Request, Response
+from litestar.enums import MediaType
+from pydantic import parse_obj_as
+from pydantic.generics import GenericModel
+from sqlalchemy import ColumnElement, Select, String, cast, false, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from somethingcoffee.core.pagination import MAX_LIMIT
+from somethingcoffee.core.timing import phase
+
+__all__ = [
+    "DataTablesColumn",
+    "DataTablesPage",
+    "DataTablesParams",
+    "query_table",
+    "table_response",
+]
+
+T = TypeVar("T")
+S = TypeVar("S", bound=Select)
+
+COLUMN_PARAM = re.compile(r"columns\[(\d+)\]\[(\w+)\](?:\[(\w+)\])?")
+ORDER_PARAM = re.compile(r"order\[(\d+)\]\[(\w+)\]")
+
+
+# field names are the protocol's, see https://datatables.net/manual/server-side
+class DataTablesPage(GenericModel, Generic[T]):
+    draw: int
+    recordsTotal: int
+    recordsFiltered: int
+    data: list[T]
+    error: str | None = None
+
+
+@dataclass
+class DataTablesColumn:
+    data: str
+    searchable: bool = True
+    orderable: bool = True
+    search: str = ""
+
+
+@dataclass
+class DataTablesParams:
+    """A DataTables server-side processing request.
+
+    Columns are referred to by their `data` name, which has to be one of the
+    `columns` a table is queried with before it can be ordered or searched on.
+    """
+
+    draw: int = 0
+    start: int = 0
+    length: int = 10
+    search: str = ""
+    columns: list[DataTablesColumn] = field(default_factory=list)
+    order: list[tuple[int, Literal["asc", "desc"]]] = field(default_factory=list)
+
+    @classmethod
+    def parse(cls, query: Mapping[str, str]) -> "DataTablesParams":
+        """Read the bracketed query parameters DataTables sends, e.g. `order[0][dir]`."""
+        columns: dict[int, dict[str, str]] = {}
+        order: dict[int, dict[str, str]] = {}
+        for key, value in query.items():
+            if m := COLUMN_PARAM.fullmatch(key):
+                index, name, sub = m.groups()
+                if sub is None or (name, sub) == ("search", "value"):
+                    columns.setdefault(int(index), {})[name] = value
+            elif m := ORDER_PARAM.fullmatch(key):
+                index, name = m.groups()
+                order.setdefault(int(index), {})[name] = value
+
+        length = _int(query, "length", 10)
+        if length == -1:  # "All"
+            length = MAX_LIMIT
+        if length < 1:
+            raise ValueError(f"Invalid length supplied: {length}")
+        start = _int(query, "start", 0)
+        if start < 0:
+            raise ValueError(f"Invalid start supplied: {start}")
+
+        params = cls(
+            draw=_int(query, "draw", 0),
+            start=start,
+            length=min(length, MAX_LIMIT),
+            search=query.get("search[value]", "").strip(),
+            columns=[
+                DataTablesColumn(
+                    data=column.get("data", ""),
+                    searchable=column.get("searchable", "true") == "true",
+                    orderable=column.get("orderable", "true") == "true",
+                    search=column.get("search", "").strip(),
+                )
+                for _, column in sorted(columns.items())
+            ],
+        )
+        for _, item in sorted(order.items()):
+            index, direction = item.get("column", ""), item.get("dir", "asc")
+            if not index.isdigit() or int(index) >= len(params.columns):
+                raise ValueError(f"Invalid order column supplied: {index}")
+            if direction not in ("asc", "desc"):
+                raise ValueError(f"Invalid order direction supplied: {direction}")
+            params.order.append((int(index), direction))
+        return params
+
+    def filter(self, statement: S, columns: Mapping[str, ColumnElement[Any]]) -> S:
+        """Apply the global and per column searches, as case insensitive substrings.
+
+        Every word of the global search has to be found in one of the searchable
+        text columns; ids, numbers and counts can only be searched on their own.
+        Columns that aren't in `columns`, like action buttons, can't be searched.
+        """
+        searchable = [
+            columns[column.data]
+            for column in self.columns
+            if column.searchable
+            and column.data in columns
+            and isinstance(columns[column.data].type, String)
+        ]
+        for word in self.search.split():
+            statement = statement.where(
+                or_(*(_contains(c, word) for c in searchable))
+                if searchable
+                else false()
+            )
+        for column in self.columns:
+            if not column.search:
+                continue
+            if not column.searchable or column.data not in columns:
+                raise ValueError(f"Column can't be searched: {column.data}")
+            statement = statement.where(
+                _contains(_text(columns[column.data]), column.search)
+            )
+        return statement
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.search.split()) or any(c.search for c in self.columns)
+
+    def page(
+        self,
+        statement: S,
+        columns: Mapping[str, ColumnElement[Any]],
+        key: ColumnElement[Any],
+    ) -> S:
+        """Order `statement` by the requested columns, then `key`, and slice a page."""
+        order = []
+        for index, direction in self.order:
+            column = self.columns[index]
+            if not column.orderable or column.data not in columns:
+                raise ValueError(f"Column can't be ordered: {column.data}")
+            expression = columns[column.data]
+            order.append(expression.desc() if direction == "desc" else expression.asc())
+        return statement.order_by(*order, key).offset(self.start).limit(self.length)
+
+
+def _int(query: Mapping[str, str], name: str, default: int) -> int:
+    value = query.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} supplied: {value}")
+
+
+def _text(expression: ColumnElement[Any]) -> ColumnElement[Any]:
+    # casting text columns would keep their trigram indexes from being used
+    if isinstance(expression.type, String):
+        return expression
+    return cast(expression, String)
+
+
+def _contains(expression: ColumnElement[Any], value: str) -> ColumnElement[bool]:
+    # one literal pattern, rather than '%' || value || '%', for the planner
+    escaped = value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+    return expression.ilike(f"%{escaped}%", escape="/")
+
+
+async def _count(session: AsyncSession, statement: Select) -> int:
+    query = select(func.count()).select_from(statement.order_by(None).subquery())
+    return (await session.execute(query)).scalar_one()
+
+
+async def query_table(
+    session: AsyncSession,
+    statement: Select,
+    params: DataTablesParams,
+    columns: Mapping[str, ColumnElement[Any]],
+    key: ColumnElement[Any],
+    narrow: Callable[[Select], Select] | None = None,
+) -> tuple[int, int, list[Any]]:
+    """The total and filtered counts of `statement`, and the requested page of it.
+
+    `narrow` applies filters of the table's own, besides the protocol's searches;
+    those count towards `recordsFiltered` too. The counts are only run over
+    `statement`'s rows, not its loader options.
+    """
+    filtered_statement = params.filter(statement, columns)
+    if narrow is not None:
+        filtered_statement = narrow(filtered_statement)
+    total = await _count(session, statement)
+    filtered = (
+        await _count(session, filtered_statement)
+        if params.filtered or narrow is not None
+        else total
+    )
+    rows = await session.scalars(params.page(filtered_statement, columns, key))
+    return total, filtered, list(rows)
+
+
+async def table_response(
+    request: Request,
+    schema: type[T],
+    load: Callable[[DataTablesParams], Awaitable[tuple[int, int, list[Any]]]],
+) -> Response[bytes]:
+    """Answer a DataTables request with `load`'s rows as `schema`.
+
+    Bad parameters are reported in `error`, which DataTables shows to the user,
+    rather than as a failed request.
+    """
+    try:
+        params = DataTablesParams.parse(request.query_params)
+        total, filtered, rows = await load(params)
+    except ValueError as e:
+        draw = request.query_params.get("draw", "0")
+        page = DataTablesPage[schema](
+            draw=int(draw) if draw.isdigit() else 0,
+            recordsTotal=0,
+            recordsFiltered=0,
+            data=[],
+            error=str(e),
+        )
+    else:
+        with phase("validate"):
+            page = DataTablesPage[schema](
+                draw=params.draw,
+                recordsTotal=total,
+                recordsFiltered=filtered,
+                data=parse_obj_as(list[schema], rows),
+            )
+    with phase("encode"):
+        return Response(page.json().encode(), media_type=MediaType.JSON)
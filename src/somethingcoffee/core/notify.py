@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import secrets
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from somethingcoffee.core import settings
+from somethingcoffee.core.database import engine
+
+__all__ = ["Notifier", "notifier"]
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str], Awaitable[None]]
+
+
+class Notifier:
+    """Postgres LISTEN/NOTIFY shared by a worker's in-process indexes.
+
+    Holds one dedicated asyncpg connection, opened by the first `subscribe`.
+    Payloads are tagged with a per-process token so a worker skips its own
+    notifications; it has already applied those writes.
+    """
+
+    def __init__(self) -> None:
+        self._connection: Any = None
+        self._handlers: dict[str, Handler] = {}
+        self._token = secrets.token_hex(8)
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        """Open the connection without listening, to publish from e.g. the CLI."""
+        if not settings.app.LISTEN_NOTIFY:
+            return
+        async with self._lock:
+            await self._connect()
+
+    async def _connect(self) -> None:
+        if self._connection is None:
+            import asyncpg
+
+            dsn = engine.url.set(drivername="postgresql").render_as_string(
+                hide_password=False
+            )
+            self._connection = await asyncpg.connect(dsn)
+
+    async def subscribe(self, channel: str, handler: Handler) -> None:
+        if not settings.app.LISTEN_NOTIFY:
+            return
+        async with self._lock:
+            await self._connect()
+            if channel not in self._handlers:
+                await self._connection.add_listener(channel, self._dispatch)
+            self._handlers[channel] = handler
+
+    async def publish(self, channel: str, payload: str) -> None:
+        if self._connection is not None:
+            await self._connection.execute(
+                "SELECT pg_notify($1, $2)", channel, f"{self._token}:{payload}"
+            )
+
+    def _dispatch(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        token, _, payload = payload.partition(":")
+        if token == self._token or channel not in self._handlers:
+            return
+        task = asyncio.get_running_loop().create_task(self._handlers[channel](payload))
+        task.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("notification handler failed", exc_info=task.exception())
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+            self._handlers.clear()
+
+
+notifier = Notifier()
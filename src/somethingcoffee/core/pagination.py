@@ -0,0 +1,115 @@
+import base64
+import json
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any, Generic, TypeVar
+
+from litestar.exceptions import ValidationException
+from litestar.params import Parameter
+from pydantic.generics import GenericModel
+from sqlalchemy import ColumnElement, Select, literal, tuple_
+
+__all__ = [
+    "CursorPage",
+    "KeysetParams",
+    "provide_keyset_params",
+    "encode_cursor",
+    "decode_cursor",
+    "cursor_values",
+    "keyset",
+    "next_cursor",
+]
+
+T = TypeVar("T")
+S = TypeVar("S", bound=Select)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class CursorPage(GenericModel, Generic[T]):
+    items: list[T]
+    limit: int
+    next_cursor: str | None
+
+
+@dataclass
+class KeysetParams:
+    limit: int
+    cursor: str | None
+
+
+async def provide_keyset_params(
+    limit: int = Parameter(
+        default=DEFAULT_LIMIT,
+        description="Maximum number of items to return.",
+        ge=1,
+        le=MAX_LIMIT,
+    ),
+    cursor: str
+    | None = Parameter(
+        default=None,
+        description="Opaque cursor from a previous page's `next_cursor`.",
+    ),
+) -> KeysetParams:
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except ValueError as e:
+            raise ValidationException(str(e))
+    return KeysetParams(limit=limit, cursor=cursor)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([str(v) if not isinstance(v, (int, float)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except ValueError:
+        raise ValueError(f"Invalid cursor supplied: {cursor}")
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor supplied: {cursor}")
+    return values
+
+
+def cursor_values(params: KeysetParams, types: Sequence[type]) -> list[Any] | None:
+    """`params.cursor`'s values as `types`, or a 400 if they don't fit the keys."""
+    if params.cursor is None:
+        return None
+    try:
+        values = decode_cursor(params.cursor)
+        if len(values) != len(types):
+            raise ValueError
+        return [type_(v) for type_, v in zip(types, values)]
+    except (AttributeError, TypeError, ValueError):
+        raise ValidationException(f"Invalid cursor supplied: {params.cursor}")
+
+
+def keyset(
+    statement: S, order: Sequence[ColumnElement[Any]], params: KeysetParams
+) -> S:
+    """Order `statement` by `order` and seek past `params.cursor`.
+
+    One extra row is fetched so `next_cursor` can tell whether another page exists.
+    """
+    values = cursor_values(params, [c.type.python_type for c in order])
+    if values is not None:
+        statement = statement.where(
+            tuple_(*order)
+            > tuple_(*(literal(v, type_=c.type) for c, v in zip(order, values)))
+        )
+    return statement.order_by(*order).limit(params.limit + 1)
+
+
+def next_cursor(
+    rows: list[Any], params: KeysetParams, key: Any
+) -> tuple[list[Any], str | None]:
+    """Trim the lookahead row and build the cursor for the following page."""
+    if len(rows) <= params.limit:
+        return rows, None
+    rows = rows[: params.limit]
+    return rows, encode_cursor(key(rows[-1]))
@@ -0,0 +1,210 @@
+import logging
+import re
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any
+
+from litestar.types import ASGIApp, Receive, Scope, Send
+from sqlalchemy import Engine, event
+
+from somethingcoffee.core import settings
+from somethingcoffee.core.timing import route_label
+
+__all__ = [
+    "QueryProfiler",
+    "QueryProfilerMiddleware",
+    "RequestQueries",
+    "RouteQueries",
+    "SlowQuery",
+    "profiler",
+    "shape",
+]
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDERS = re.compile(r"\$\d+|%s|%\(\w+\)s|\?")
+PLACEHOLDER_LISTS = re.compile(r"\(\?(?:, \?)*\)")
+# EXPLAIN ANALYZE runs the statement again, so only plain reads qualify
+READ_ONLY = re.compile(
+    r"\s*(SELECT|WITH)\b(?!.*\b(INSERT|UPDATE|DELETE)\b)", re.I | re.S
+)
+
+
+@lru_cache(maxsize=1024)
+def shape(statement: str) -> str:
+    """`statement` with placeholders, and `IN` lists of any length, made alike."""
+    return PLACEHOLDER_LISTS.sub(
+        "(...)", PLACEHOLDERS.sub("?", " ".join(statement.split()))
+    )
+
+
+@dataclass
+class RequestQueries:
+    route: str
+    count: int = 0
+    seconds: float = 0.0
+    shapes: Counter[str] = field(default_factory=Counter)
+
+
+@dataclass
+class RouteQueries:
+    requests: int = 0
+    queries: int = 0
+    seconds: float = 0.0
+    max_queries: int = 0
+    # statement shapes run REPEATED_QUERY_THRESHOLD+ times in a request, and the most
+    repeated: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class SlowQuery:
+    at: datetime
+    route: str
+    ms: float
+    statement: str
+    plan: str
+
+
+# set per request by `QueryProfilerMiddleware`
+_queries: ContextVar[RequestQueries | None] = ContextVar("queries", default=None)
+
+
+class QueryProfiler:
+    """Per-route query counts and times, N+1 detection and slow query plans.
+
+    Statements are grouped by `shape`, so a loop issuing the same query with
+    different parameters shows up as one shape run many times. Plans of slow
+    reads are captured with `EXPLAIN (ANALYZE, BUFFERS)` on the same connection,
+    inside a savepoint, into a ring buffer; a shape already in the buffer isn't
+    explained again.
+    """
+
+    def __init__(self, slow_ms: float, repeat_threshold: int, log_size: int) -> None:
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        self.routes: dict[str, RouteQueries] = {}
+        self.slow: deque[SlowQuery] = deque(maxlen=log_size)
+
+    def instrument(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profile_start = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_profile_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        queries = _queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += elapsed
+            queries.shapes[shape(statement)] += 1
+        if (
+            elapsed * 1000 >= self.slow_ms
+            and not executemany
+            and READ_ONLY.match(statement)
+            and not any(shape(s.statement) == shape(statement) for s in self.slow)
+        ):
+            plan = self._explain(conn, statement, parameters)
+            if plan is not None:
+                self.slow.append(
+                    SlowQuery(
+                        at=datetime.now(timezone.utc),
+                        route=queries.route if queries else "-",
+                        ms=elapsed * 1000,
+                        statement=statement,
+                        plan=plan,
+                    )
+                )
+
+    @staticmethod
+    def _explain(conn: Any, statement: str, parameters: Any) -> str | None:
+        # a cursor of its own: the statement's rows haven't been fetched yet
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute("SAVEPOINT query_profiler")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                return "\n".join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT query_profiler")
+                cursor.execute("RELEASE SAVEPOINT query_profiler")
+        except Exception:
+            # the plan is nice to have; never fail the request over it
+            logger.warning("couldn't explain slow query", exc_info=True)
+            return None
+        finally:
+            cursor.close()
+
+    def record(self, queries: RequestQueries) -> None:
+        stats = self.routes.setdefault(queries.route, RouteQueries())
+        stats.requests += 1
+        stats.queries += queries.count
+        stats.seconds += queries.seconds
+        stats.max_queries = max(stats.max_queries, queries.count)
+        for statement, count in queries.shapes.items():
+            if count < self.repeat_threshold:
+                continue
+            if statement not in stats.repeated:
+                logger.warning(
+                    "possible N+1 in %s, a statement ran %d times: %s",
+                    queries.route,
+                    count,
+                    statement,
+                )
+            stats.repeated[statement] = max(stats.repeated.get(statement, 0), count)
+
+    def snapshot(self) -> dict[str, Any]:
+        routes = sorted(self.routes.items(), key=lambda item: -item[1].queries)
+        return {
+            "routes": [
+                {
+                    "route": route,
+                    "requests": stats.requests,
+                    "queries_per_request": stats.queries / stats.requests,
+                    "max_queries": stats.max_queries,
+                    "ms_per_request": stats.seconds * 1000 / stats.requests,
+                    "repeated": stats.repeated,
+                }
+                for route, stats in routes
+            ],
+            "slow": [asdict(query) for query in reversed(self.slow)],
+        }
+
+    def clear(self) -> None:
+        self.routes.clear()
+        self.slow.clear()
+
+
+profiler = QueryProfiler(
+    slow_ms=settings.app.SLOW_QUERY_MS,
+    repeat_threshold=settings.app.REPEATED_QUERY_THRESHOLD,
+    log_size=settings.app.SLOW_QUERY_LOG,
+)
+
+
+class QueryProfilerMiddleware:
+    """Collect each request's queries into `profiler`, if APP_PROFILE_QUERIES."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.app.PROFILE_QUERIES:
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries(route_label(scope))
+        token = _queries.set(queries)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _queries.reset(token)
+            profiler.record(queries)
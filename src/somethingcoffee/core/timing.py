@@ -0,0 +1,245 @@
+import time
+from bisect import bisect_left
+from collections.abc import Iterator
+from contextvars import ContextVar
+from typing import Any
+
+from litestar import Response
+from litestar.datastructures import MutableScopeHeaders
+from litestar.types import ASGIApp, Message, Receive, Scope, Send
+from sqlalchemy import Engine, event
+
+from somethingcoffee.core import settings
+
+__all__ = [
+    "Histogram",
+    "TimingMiddleware",
+    "add",
+    "current",
+    "mark_handled",
+    "metrics",
+    "phase",
+    "time_engine",
+]
+
+# phases recorded for the current request, in seconds; None outside of one
+_timings: ContextVar[dict[str, float] | None] = ContextVar("timings", default=None)
+
+HANDLED = "_handled"  # when the handler returned, set by `mark_handled`
+# phases that run inside the handler, and so are taken out of "app"
+HANDLER_PHASES = ("pool", "sql", "orm", "validate", "geojson", "encode")
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def current() -> dict[str, float] | None:
+    """The current request's phases so far, in seconds."""
+    return _timings.get()
+
+
+def add(name: str, seconds: float) -> None:
+    """Add `seconds` to the current request's `name` phase, if in a request."""
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+class phase:
+    """Time the block as `name`: `with phase("validate"): ...`."""
+
+    __slots__ = ("name", "timings", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.timings = _timings.get()
+        if self.timings is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.timings is not None:
+            elapsed = time.perf_counter() - self.start
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+
+
+def time_engine(engine: Engine) -> None:
+    """Record time spent in the driver, per statement, as "sql"."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._timing_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_timing_start", None)
+        if start is not None:
+            add("sql", time.perf_counter() - start)
+
+
+def mark_handled(response: Response) -> Response:
+    """App `after_request` hook: what follows the handler is encoding."""
+    timings = _timings.get()
+    if timings is not None:
+        timings[HANDLED] = time.perf_counter()
+    return response
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the prometheus sense, over `BUCKETS`."""
+
+    __slots__ = ("counts", "sum")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+def _labels(**labels: str) -> str:
+    escaped = (
+        (k, v.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for k, v in labels.items()
+    )
+    return ",".join(f'{k}="{v}"' for k, v in escaped)
+
+
+class Metrics:
+    """This worker's request and phase latency histograms, per route."""
+
+    def __init__(self) -> None:
+        self.requests: dict[tuple[str, str, str], Histogram] = {}
+        self.phases: dict[tuple[str, str], Histogram] = {}
+
+    def observe(
+        self, method: str, route: str, status: int, total: float, phases: dict
+    ) -> None:
+        key = (method, route, str(status))
+        if (histogram := self.requests.get(key)) is None:
+            histogram = self.requests[key] = Histogram()
+        histogram.observe(total)
+        for name, seconds in phases.items():
+            if (histogram := self.phases.get((route, name))) is None:
+                histogram = self.phases[(route, name)] = Histogram()
+            histogram.observe(seconds)
+
+    def render(self) -> str:
+        """Everything, in the prometheus text exposition format."""
+        lines: list[str] = []
+        self._render(
+            lines,
+            "http_request_duration_seconds",
+            "Time from request to response start, per route.",
+            (
+                (_labels(method=m, route=r, status=s), h)
+                for (m, r, s), h in sorted(self.requests.items())
+            ),
+        )
+        self._render(
+            lines,
+            "http_request_phase_duration_seconds",
+            "Time spent per phase of handling a request, per route.",
+            (
+                (_labels(route=r, phase=p), h)
+                for (r, p), h in sorted(self.phases.items())
+            ),
+        )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render(
+        lines: list[str], name: str, help: str, series: Iterator[tuple[str, Histogram]]
+    ) -> None:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in series:
+            cumulative = 0
+            for le, count in zip((*map(str, BUCKETS), "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+    def clear(self) -> None:
+        self.requests.clear()
+        self.phases.clear()
+
+
+metrics = Metrics()
+
+
+def route_label(scope: Scope) -> str:
+    handler = scope.get("route_handler")
+    if handler is None:
+        return "unmatched"
+    # handler names look like "shops:list"; the rest fall back to the function
+    return handler.name or handler.handler_name
+
+
+def split_phases(timings: dict[str, float], start: float, end: float) -> None:
+    """Fill in "app" and "encode" around the measured phases, in place.
+
+    "app" is the handler's own time, anything it did outside a named phase.
+    "encode" adds serializing the returned response, less template rendering, to
+    whatever the handler encoded itself.
+    """
+    handled = timings.pop(HANDLED, end)
+    inner = sum(timings.get(name, 0.0) for name in HANDLER_PHASES)
+    timings["app"] = max(handled - start - inner, 0.0)
+    encoding = max(end - handled - timings.get("render", 0.0), 0.0)
+    timings["encode"] = timings.get("encode", 0.0) + encoding
+
+
+class TimingMiddleware:
+    """Time each request by phase, for `Server-Timing` and `/metrics`.
+
+    The phases come from `phase` blocks and the SQL event hooks while the
+    request runs. The header goes out with the response start, covering
+    everything up to it; the histograms are fed once the body is sent, so
+    phases of a streamed body are counted there but not in the header.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings: dict[str, float] = {}
+        start = time.perf_counter()
+        status = 500
+        headed = 0.0
+
+        async def send_timed(message: Message) -> None:
+            nonlocal status, headed
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headed = time.perf_counter()
+                split_phases(timings, start, headed)
+                if settings.app.SERVER_TIMING:
+                    entries = [
+                        f"{name};dur={seconds * 1000:.2f}"
+                        for name, seconds in timings.items()
+                    ]
+                    entries.append(f"total;dur={(headed - start) * 1000:.2f}")
+                    MutableScopeHeaders.from_message(message).add(
+                        "server-timing", ", ".join(entries)
+                    )
+            await send(message)
+
+        token = _timings.set(timings)
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _timings.reset(token)
+            if not headed:
+                headed = time.perf_counter()
+                split_phases(timings, start, headed)
+            metrics.observe(
+                scope["method"], route_label(scope), status, headed - start, timings
+            )
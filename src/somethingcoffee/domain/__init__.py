@@ -12,4 +12,7 @@ routes: list[ControllerRouterHandler] = [
     home.routes.home_page,
     home.routes.map_page,
     home.routes.admin_dash,
+    home.routes.pool_stats,
+    home.routes.query_profile,
+    home.routes.prometheus_metrics,
 ]
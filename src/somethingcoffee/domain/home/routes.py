@@ -1,18 +1,41 @@
-from litestar import get
+import json
+from typing import Any, Literal
+
+from litestar import Request, Response, get
+from litestar.params import Parameter
 from litestar.response import Template
 from pydantic import parse_obj_as
+from pydantic.json import pydantic_encoder
+from sqlalchemy import select
 
-from somethingcoffee.domain.shops.schemas import ShopDBFull
+from somethingcoffee.core import settings
+from somethingcoffee.core.cache import cache
+from somethingcoffee.core.database import pool_snapshot, replica_engines
+from somethingcoffee.core.profiler import profiler
+from somethingcoffee.core.timing import metrics
+from somethingcoffee.domain.shops.schemas import ShopSummary
 from somethingcoffee.domain.shops.dependencies import ShopRepository, provide_shop_repo
-from somethingcoffee.domain.shops.utils import geojsonify
+from somethingcoffee.domain.shops.utils import (
+    feature_collection_sql,
+    feature_sql,
+    geojsonify,
+    htmlsafe_json,
+)
+from somethingcoffee.ui.configs import cached_page
 
 
 @get(
     path="/",
     include_in_schema=False,
 )
-async def home_page() -> Template:
-    return Template(template_name="views/home.html.jinja")
+async def home_page(request: Request) -> Response[bytes]:
+    async def load() -> dict[str, Any]:
+        return {}
+
+    # no data behind it, so only a template change makes it stale
+    return await cached_page(
+        request, "pages:home", "views/home.html.jinja", load, scopes=()
+    )
 
 
 @get(
@@ -22,11 +45,27 @@ async def home_page() -> Template:
 )
 async def map_page(
     shop_repo: ShopRepository,
+    mode: Literal["geojson", "tiles", "clusters"] = Parameter(
+        default="geojson",
+        description="Inline every shop as GeoJSON, or load tiles/clusters for the viewport.",
+    ),
 ) -> Template:
-    shops = parse_obj_as(list[ShopDBFull], await shop_repo.list())
-    shops_geojson = geojsonify(shops)
+    if mode != "geojson":
+        # fetched by the client as the viewport changes; nothing to inline
+        return Template(template_name="views/map.html.jinja", context={"mode": mode})
+
+    async def load() -> bytes:
+        if settings.app.GEOJSON_IN_DB:
+            query = feature_collection_sql(select(feature_sql().label("feature")))
+            return (await shop_repo.session.execute(query)).scalar_one().encode()
+        rows = await shop_repo.list_rows(shop_repo.select_fields(("coordinates",)))
+        shops = parse_obj_as(list[ShopSummary], rows)
+        return json.dumps(geojsonify(shops), default=pydantic_encoder).encode()
+
+    shops_geojson = await cache.get_or_set("shops:map", load, scopes=("shops",))
     return Template(
-        template_name="views/map.html.jinja", context={"shops_geojson": shops_geojson}
+        template_name="views/map.html.jinja",
+        context={"mode": mode, "shops_geojson": htmlsafe_json(shops_geojson.decode())},
     )
 
 
@@ -35,4 +74,46 @@ async def map_page(
     include_in_schema=False,
 )
 async def admin_dash() -> Template:
-    return Template(template_name="admin/admin-dashboard.html.jinja")
+    return Template(
+        template_name="admin/admin-dashboard.html.jinja",
+        context={
+            "cache_stats": cache.snapshot(),
+            "pool_stats": pool_snapshot(),
+            "query_profile": profiler.snapshot()
+            if settings.app.PROFILE_QUERIES
+            else None,
+        },
+    )
+
+
+@get(
+    path="/admin/pool",
+    include_in_schema=False,
+)
+async def pool_stats() -> dict[str, Any]:
+    # this worker's connection pools, for sizing DB_POOL_SIZE / DB_MAX_OVERFLOW
+    stats: dict[str, Any] = pool_snapshot()
+    if replica_engines:
+        stats["replicas"] = [pool_snapshot(replica) for replica in replica_engines]
+    return stats
+
+
+@get(
+    path="/admin/queries",
+    include_in_schema=False,
+)
+async def query_profile() -> dict[str, Any]:
+    # this worker's queries per route, likely N+1s and slow query plans
+    return profiler.snapshot()
+
+
+@get(
+    path="/metrics",
+    include_in_schema=False,
+)
+async def prometheus_metrics() -> Response[str]:
+    # per-worker latency histograms; scrape every worker, or run one per pod
+    return Response(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
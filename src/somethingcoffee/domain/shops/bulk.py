@@ -0,0 +1,314 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any, Literal
+from uuid import UUID, uuid4
+
+from geoalchemy2 import Geometry
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import Select, String, cast, func, insert, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from somethingcoffee.core.database import async_session_factory
+from somethingcoffee.domain.shops.models import Shop, shop_tag
+from somethingcoffee.domain.shops.schemas import ShopCreate
+from somethingcoffee.domain.shops.utils import (
+    STREAM_BATCH_SIZE,
+    STREAM_MEDIA_TYPES,
+    ungeojsonify,
+)
+from somethingcoffee.domain.tags.models import Tag
+
+__all__ = [
+    "IMPORT_BATCH_SIZE",
+    "ImportFormat",
+    "BulkRowError",
+    "BulkImportResult",
+    "parse_records",
+    "import_shops",
+    "ExportFormat",
+    "EXPORT_FIELDS",
+    "EXPORT_MEDIA_TYPES",
+    "export_statement",
+    "export_shops",
+]
+
+IMPORT_BATCH_SIZE = 500
+CSV_TAG_SEPARATOR = ";"
+
+ImportFormat = Literal["ndjson", "csv", "geojson"]
+ExportFormat = Literal["csv", "ndjson", "geojsonseq"]
+EXPORT_MEDIA_TYPES: dict[str, str] = {"csv": "text/csv", **STREAM_MEDIA_TYPES}
+
+# export columns, in the layout `parse_records` reads back
+EXPORT_FIELDS = (
+    "id",
+    "name",
+    "country",
+    "city",
+    "address",
+    "lon",
+    "lat",
+    "roaster",
+    "hours_of_operation",
+    "website",
+    "gmaps_link",
+    "description",
+    "tag_names",
+)
+
+
+class BulkRowError(BaseModel):
+    row: int  # 1-based line (ndjson, csv) or feature index (geojson)
+    error: str
+
+
+class BulkImportResult(BaseModel):
+    inserted: int
+    skipped: int  # a shop with the same name already exists
+    errors: list[BulkRowError]
+
+
+def parse_records(content: bytes, fmt: ImportFormat) -> Iterator[tuple[int, Any]]:
+    """Yield `(row, record)` pairs, with the exception as the record if a row can't be read.
+
+    Raises ValueError straight away if the file as a whole can't be read, i.e. it
+    isn't UTF-8 or isn't a GeoJSON FeatureCollection.
+    """
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise ValueError(f"File isn't UTF-8: {e}")
+    if fmt == "ndjson":
+        return _ndjson_records(text)
+    if fmt == "csv":
+        return _csv_records(text)
+    try:
+        collection = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Invalid GeoJSON: {e}")
+    if (
+        not isinstance(collection, dict)
+        or collection.get("type") != "FeatureCollection"
+    ):
+        raise ValueError("Expected a GeoJSON FeatureCollection")
+    features = collection.get("features", [])
+    if not isinstance(features, list):
+        raise ValueError("Expected a list of GeoJSON features")
+    return _geojson_records(features)
+
+
+def _ndjson_records(text: str) -> Iterator[tuple[int, Any]]:
+    for row, line in enumerate(text.splitlines(), start=1):
+        if line.strip():
+            try:
+                yield row, json.loads(line)
+            except ValueError as e:
+                yield row, e
+
+
+def _csv_records(text: str) -> Iterator[tuple[int, Any]]:
+    # header is row 1
+    for row, record in enumerate(csv.DictReader(io.StringIO(text)), start=2):
+        try:
+            yield row, _from_csv(record)
+        except (KeyError, ValueError) as e:
+            yield row, e
+
+
+def _geojson_records(features: list[Any]) -> Iterator[tuple[int, Any]]:
+    for row, feature in enumerate(features, start=1):
+        try:
+            yield row, ungeojsonify(feature)
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            yield row, e
+
+
+def _from_csv(record: dict[str, str]) -> dict[str, Any]:
+    record = {k: v for k, v in record.items() if v != ""}
+    tag_names = record.pop("tag_names", "")
+    coordinates = {"lon": record.pop("lon"), "lat": record.pop("lat")}
+    return {
+        **record,
+        "coordinates": coordinates,
+        "tag_names": [n.strip() for n in tag_names.split(CSV_TAG_SEPARATOR) if n],
+    }
+
+
+async def import_shops(
+    session: AsyncSession,
+    records: Iterator[tuple[int, Any]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> BulkImportResult:
+    """Insert shops and their `shop_tag` rows in multi-row batches.
+
+    Shops whose name already exists are skipped. Rows that fail validation, name an
+    unknown tag or are rejected by the database are reported, and the rest still load.
+    The caller commits.
+    """
+    errors: list[BulkRowError] = []
+    shops: list[tuple[int, ShopCreate]] = []
+    seen: set[str] = set()
+    for row, record in records:
+        if isinstance(record, Exception):
+            errors.append(BulkRowError(row=row, error=str(record)))
+            continue
+        try:
+            shop = ShopCreate.parse_obj(record)
+        except ValidationError as e:
+            errors.append(BulkRowError(row=row, error=str(e)))
+            continue
+        if shop.name in seen:
+            errors.append(BulkRowError(row=row, error=f"Duplicate name {shop.name}"))
+            continue
+        seen.add(shop.name)
+        shops.append((row, shop))
+
+    # every referenced tag in one query
+    names = {name for _, shop in shops for name in shop.tag_names}
+    tag_ids: dict[str, UUID] = dict(
+        (await session.execute(select(Tag.name, Tag.id).where(Tag.name.in_(names))))
+        .tuples()
+        .all()
+    )
+    valid: list[tuple[int, ShopCreate]] = []
+    for row, shop in shops:
+        unknown = [name for name in shop.tag_names if name not in tag_ids]
+        if unknown:
+            errors.append(
+                BulkRowError(row=row, error=f"Unknown tags: {', '.join(unknown)}")
+            )
+        else:
+            valid.append((row, shop))
+
+    inserted = skipped = 0
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start : start + batch_size]
+        try:
+            async with session.begin_nested():
+                count = await _insert_batch(session, batch, tag_ids)
+            inserted += count
+            skipped += len(batch) - count
+        except DBAPIError:
+            # find the offending rows one by one
+            for row, shop in batch:
+                try:
+                    async with session.begin_nested():
+                        count = await _insert_batch(session, [(row, shop)], tag_ids)
+                    inserted += count
+                    skipped += 1 - count
+                except DBAPIError as e:
+                    errors.append(BulkRowError(row=row, error=str(e.orig)))
+
+    errors.sort(key=lambda e: e.row)
+    return BulkImportResult(inserted=inserted, skipped=skipped, errors=errors)
+
+
+async def _insert_batch(
+    session: AsyncSession,
+    batch: Sequence[tuple[int, ShopCreate]],
+    tag_ids: dict[str, UUID],
+) -> int:
+    values = []
+    for _, shop in batch:
+        dd = shop.dict(exclude={"tag_names"})
+        coords = dd.pop("coordinates")
+        values.append(
+            {
+                **dd,
+                "id": uuid4(),
+                "coordinates": f"Point({coords['lon']} {coords['lat']})",
+            }
+        )
+    statement = (
+        pg_insert(Shop)
+        .values(values)
+        .on_conflict_do_nothing(index_elements=[Shop.name])
+        .returning(Shop.name, Shop.id)
+    )
+    shop_ids = dict((await session.execute(statement)).tuples().all())
+
+    links = [
+        {"shop_id": shop_ids[shop.name], "tag_id": tag_ids[name]}
+        for _, shop in batch
+        if shop.name in shop_ids
+        for name in dict.fromkeys(shop.tag_names)
+    ]
+    if links:
+        await session.execute(insert(shop_tag), links)
+    return len(shop_ids)
+
+
+def export_statement() -> Select:
+    """Every shop as plain columns, with its tag names aggregated by postgres."""
+    geom = cast(Shop.coordinates, Geometry(srid=4326))
+    tag_names = func.array_remove(
+        func.array_agg(aggregate_order_by(Tag.name, Tag.name)), None
+    )
+    return (
+        select(
+            cast(Shop.id, String).label("id"),
+            Shop.name,
+            Shop.country,
+            Shop.city,
+            Shop.address,
+            func.ST_X(geom).label("lon"),
+            func.ST_Y(geom).label("lat"),
+            Shop.roaster,
+            Shop.hours_of_operation,
+            Shop.website,
+            Shop.gmaps_link,
+            Shop.description,
+            tag_names.label("tag_names"),
+        )
+        .outerjoin(shop_tag, shop_tag.c.shop_id == Shop.id)
+        .outerjoin(Tag, Tag.id == shop_tag.c.tag_id)
+        .group_by(Shop.id)
+        .order_by(Shop.name)
+    )
+
+
+async def export_shops(fmt: ExportFormat) -> AsyncIterator[str]:
+    """Encode the whole catalogue a batch at a time off a server-side cursor.
+
+    Rows are written straight from the tuples, without ORM entities or schemas, so
+    memory stays flat however many shops there are. Uses its own session like
+    `stream_shops`.
+    """
+    async with async_session_factory() as session:
+        result = await session.stream(
+            export_statement().execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(EXPORT_FIELDS)
+        async for partition in result.partitions():
+            for row in partition:
+                if fmt == "csv":
+                    writer.writerow([*row[:-1], CSV_TAG_SEPARATOR.join(row.tag_names)])
+                    continue
+                record = row._asdict()
+                if fmt == "ndjson":
+                    record["coordinates"] = {
+                        "lon": record.pop("lon"),
+                        "lat": record.pop("lat"),
+                    }
+                    buffer.write(json.dumps(record) + "\n")
+                else:
+                    coordinates = [record.pop("lon"), record.pop("lat")]
+                    feature = {
+                        "type": "Feature",
+                        "properties": record,
+                        "geometry": {"type": "Point", "coordinates": coordinates},
+                    }
+                    # RFC 8142: record separator, JSON text, line feed
+                    buffer.write("\x1e" + json.dumps(feature) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if fmt == "csv" and buffer.tell():
+            yield buffer.getvalue()  # header of an empty export
@@ -1,24 +1,153 @@
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from geoalchemy2 import Geometry
 from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
+from litestar.exceptions import ValidationException
+from litestar.params import Parameter
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from somethingcoffee.domain.shops.models import Shop
-from typing import Any
+from sqlalchemy import ColumnElement, Row, Select, cast, exists, func, select
+from sqlalchemy.orm import noload, selectinload
+from sqlalchemy.sql.base import ExecutableOption
+from somethingcoffee.domain.shops.models import Shop, shop_tag
+from somethingcoffee.domain.tags.models import Tag
+from typing import Any, Literal, TypeVar
 
 __all__ = [
+    "SHOP_FIELDS",
+    "SHOP_TABLE_COLUMNS",
     "ShopRepository",
     "provide_shop_repo",
+    "provide_shop_fields",
+    "TagFilter",
+    "provide_tag_filter",
 ]
 
+S = TypeVar("S", bound=Select)
+
+# columns that can be projected with `?fields=`
+SHOP_FIELDS = (
+    "id",
+    "name",
+    "country",
+    "city",
+    "address",
+    "coordinates",
+    "roaster",
+    "hours_of_operation",
+    "website",
+    "gmaps_link",
+    "description",
+)
+
+_geom = cast(Shop.coordinates, Geometry(srid=4326))
+
+# what the shop tables can order and search on, by DataTables column `data`
+SHOP_TABLE_COLUMNS: dict[str, ColumnElement[Any]] = {
+    "id": Shop.id,
+    "name": Shop.name,
+    "country": Shop.country,
+    "city": Shop.city,
+    "coordinates.lon": func.ST_X(_geom),
+    "coordinates.lat": func.ST_Y(_geom),
+}
+
 
 class ShopRepository(SQLAlchemyAsyncRepository[Shop]):
     """Shop Repository"""
 
     model_type = Shop
 
+    # relationship loading per endpoint, instead of the models' recursive selectin
+    load_profiles: dict[str, Sequence[ExecutableOption]] = {
+        # ShopDB
+        "bare": (noload(Shop.tags),),
+        # ShopDBFull; tags come without their own shops
+        "tags": (selectinload(Shop.tags).noload(Tag.shops),),
+    }
+
+    def profile(self, name: str) -> Select:
+        """The repository statement with the loading profile `name` applied."""
+        return self.statement.options(*self.load_profiles[name])
+
+    @classmethod
+    def select_fields(cls, fields: Iterable[str]) -> Select:
+        """Select only `fields` as plain rows, skipping entity and relationship loading.
+
+        `id` and `name` are always selected since keyset pagination orders on them.
+        """
+        unknown = set(fields) - set(SHOP_FIELDS)
+        if unknown:
+            raise ValueError(
+                f"Unknown shop fields supplied: {', '.join(sorted(unknown))}"
+            )
+        columns = dict.fromkeys(["id", "name", *fields])
+        return select(*(getattr(cls.model_type, field) for field in columns))
+
+    async def list_rows(self, statement: Select) -> list[Row[Any]]:
+        return list((await self.session.execute(statement)).all())
+
 
 async def provide_shop_repo(db_session: AsyncSession) -> ShopRepository:
     return ShopRepository(
         statement=select(Shop),
         session=db_session,
     )
+
+
+async def provide_shop_fields(
+    fields: str
+    | None = Parameter(
+        default=None,
+        description=(
+            "Comma separated shop fields to return, e.g. `name,coordinates`. "
+            "Only those columns are loaded, and tags are left out."
+        ),
+    ),
+) -> list[str] | None:
+    if fields is None:
+        return None
+    names = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = set(names) - set(SHOP_FIELDS)
+    if unknown:
+        raise ValidationException(
+            f"Unknown shop fields supplied: {', '.join(sorted(unknown))}; "
+            f"expected any of {', '.join(SHOP_FIELDS)}"
+        )
+    return names
+
+
+@dataclass
+class TagFilter:
+    names: list[str]
+    match: Literal["any", "all"]
+
+    def apply(self, statement: S) -> S:
+        """Keep shops with any/all of the tags, as a correlated subquery on `shop_tag`.
+
+        Filtering in the same statement keeps spatial index scans (including KNN
+        ordering) usable. The `shop_tag` primary key serves the per shop check, and
+        `ix_shop_tag_tag_id_shop_id` lets the planner start from the tags instead.
+        """
+        names = list(dict.fromkeys(self.names))
+        tagged = shop_tag.join(Tag, Tag.id == shop_tag.c.tag_id)
+        criteria = (shop_tag.c.shop_id == Shop.id, Tag.name.in_(names))
+        if self.match == "any":
+            return statement.where(exists().select_from(tagged).where(*criteria))
+        count = select(func.count()).select_from(tagged).where(*criteria)
+        return statement.where(count.scalar_subquery() == len(names))
+
+
+async def provide_tag_filter(
+    tags: list[str]
+    | None = Parameter(
+        default=None,
+        description="Only shops with these tag names; repeat for several tags.",
+    ),
+    tags_match: Literal["any", "all"] = Parameter(
+        default="any",
+        description="Whether shops need `any` or `all` of `tags`.",
+    ),
+) -> TagFilter | None:
+    if not tags:
+        return None
+    return TagFilter(names=tags, match=tags_match)
@@ -0,0 +1,332 @@
+import asyncio
+import logging
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from functools import reduce
+from operator import or_
+from uuid import UUID
+
+import numpy as np
+from geoalchemy2 import Geometry
+from sqlalchemy import Select, cast, func, select
+
+from somethingcoffee.core.database import primary_session_factory
+from somethingcoffee.core.notify import notifier
+from somethingcoffee.domain.shops.dependencies import TagFilter
+from somethingcoffee.domain.shops.models import Shop, shop_tag
+from somethingcoffee.domain.shops.schemas import ShopFacets, TagFacet
+from somethingcoffee.domain.shops.spatial_index import bbox_envelope, within_bbox
+from somethingcoffee.domain.tags.models import Tag
+
+__all__ = ["FacetIndex", "facet_index"]
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "shop_facets"
+
+
+@dataclass
+class FacetTag:
+    id: UUID
+    scope: str
+    name: str
+    bits: int  # bit i is set when the shop with ordinal i has the tag
+
+
+def pack(mask: np.ndarray) -> int:
+    """A boolean array as a bitmap, element i as bit i."""
+    return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+class FacetIndex:
+    """Per-tag and per-city bitmaps over shop ordinals, for facet counts.
+
+    Every shop gets a small integer ordinal, reused after deletes so the bitmaps
+    stay dense. Bitmaps are python ints, so filtering is `&` and counting is
+    `int.bit_count`. Built on first use and kept up to date by the shop and tag
+    write handlers through `refresh_shops` and `refresh_tags`.
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self._lock = asyncio.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._ordinals: dict[UUID, int] = {}
+        self._free: list[int] = []
+        self._live = 0
+        self._city_of: list[str | None] = []
+        self._lon = np.full(0, np.nan)
+        self._lat = np.full(0, np.nan)
+        self._cities: dict[str, int] = {}
+        self._tags: dict[UUID, FacetTag] = {}
+        self._names: dict[str, FacetTag] = {}
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def load(
+        self,
+        shops: Sequence[tuple[UUID, str, float, float]],
+        tags: Iterable[tuple[UUID, str, str]],
+        links: Iterable[tuple[UUID, UUID]],
+    ) -> None:
+        """Replace everything with `(id, city, lon, lat)` shops, `(id, scope, name)`
+        tags and `(shop_id, tag_id)` links, building each bitmap in one go."""
+        self._reset()
+        self._ordinals = {shop[0]: i for i, shop in enumerate(shops)}
+        self._city_of = [shop[1] for shop in shops]
+        self._lon = np.fromiter((shop[2] for shop in shops), float, len(shops))
+        self._lat = np.fromiter((shop[3] for shop in shops), float, len(shops))
+        self._live = (1 << len(shops)) - 1
+        cities = np.array(self._city_of, dtype=object)
+        for city in set(self._city_of):
+            self._cities[city] = pack(cities == city)
+        members: dict[UUID, list[UUID]] = {}
+        for shop_id, tag_id in links:
+            members.setdefault(tag_id, []).append(shop_id)
+        for tag_id, scope, name in tags:
+            self.set_tag(tag_id, scope, name, members.get(tag_id, ()))
+
+    # shops
+
+    def set_shop(
+        self, shop_id: UUID, city: str, lon: float, lat: float, tag_ids: Iterable[UUID]
+    ) -> None:
+        i = self._ordinals.get(shop_id)
+        if i is None:
+            i = self._ordinals[shop_id] = self._allocate()
+        else:
+            self._clear(i)
+        bit = 1 << i
+        self._live |= bit
+        self._city_of[i] = city
+        self._cities[city] = self._cities.get(city, 0) | bit
+        self._lon[i], self._lat[i] = lon, lat
+        for tag_id in tag_ids:
+            if tag_id in self._tags:
+                self._tags[tag_id].bits |= bit
+
+    def discard_shop(self, shop_id: UUID) -> None:
+        i = self._ordinals.pop(shop_id, None)
+        if i is not None:
+            self._clear(i)
+            self._free.append(i)
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        i = len(self._city_of)
+        self._city_of.append(None)
+        if i >= len(self._lon):
+            grow = np.full(max(64, len(self._lon)), np.nan)
+            self._lon = np.concatenate([self._lon, grow])
+            self._lat = np.concatenate([self._lat, grow])
+        return i
+
+    def _clear(self, i: int) -> None:
+        keep = ~(1 << i)
+        self._live &= keep
+        city = self._city_of[i]
+        if city is not None:
+            self._cities[city] &= keep
+            if not self._cities[city]:
+                del self._cities[city]
+        self._city_of[i] = None
+        self._lon[i] = self._lat[i] = np.nan
+        for tag in self._tags.values():
+            tag.bits &= keep
+
+    # tags
+
+    def set_tag(
+        self, tag_id: UUID, scope: str, name: str, shop_ids: Iterable[UUID]
+    ) -> None:
+        mask = np.zeros(len(self._city_of), bool)
+        mask[[self._ordinals[s] for s in shop_ids if s in self._ordinals]] = True
+        self.discard_tag(tag_id)
+        tag = self._tags[tag_id] = FacetTag(tag_id, scope, name, pack(mask))
+        self._names[name] = tag
+
+    def discard_tag(self, tag_id: UUID) -> None:
+        tag = self._tags.pop(tag_id, None)
+        if tag is not None and self._names.get(tag.name) is tag:
+            del self._names[tag.name]
+
+    # loading
+
+    @staticmethod
+    def _shops_statement() -> Select:
+        geom = cast(Shop.coordinates, Geometry(srid=4326))
+        return select(
+            Shop.id,
+            Shop.city,
+            func.ST_X(geom).label("lon"),
+            func.ST_Y(geom).label("lat"),
+        )
+
+    async def ensure(self) -> None:
+        """Build from the database unless already built, and follow other workers."""
+        if self.ready:
+            return
+        async with self._lock:
+            if self.ready:
+                return
+            await self._load_shops(None)
+            await notifier.subscribe(NOTIFY_CHANNEL, self._on_notify)
+            self.ready = True
+            logger.info(
+                "facet index ready with %d shops, %d tags", len(self), len(self._tags)
+            )
+
+    async def refresh_shops(self, shop_ids: Iterable[UUID] | None = None) -> None:
+        """Reload `shop_ids` (everything if `None`), here and in other workers."""
+        await self._refresh("shops", shop_ids)
+
+    async def refresh_tags(self, tag_ids: Iterable[UUID]) -> None:
+        """Reload `tag_ids`, here and in other workers."""
+        await self._refresh("tags", tag_ids)
+
+    async def _refresh(self, kind: str, ids: Iterable[UUID] | None) -> None:
+        ids = None if ids is None else list(ids)
+        async with self._lock:
+            # not built yet: the first query reads the fresh rows anyway
+            if not self.ready:
+                return
+            await self._reload(kind, ids)
+        payload = "*" if ids is None else ",".join(str(i) for i in ids)
+        await notifier.publish(NOTIFY_CHANNEL, f"{kind}:{payload}")
+
+    async def _on_notify(self, payload: str) -> None:
+        kind, _, ids = payload.partition(":")
+        async with self._lock:
+            if self.ready:
+                await self._reload(
+                    kind, None if ids == "*" else [UUID(i) for i in ids.split(",") if i]
+                )
+
+    async def _reload(self, kind: str, ids: list[UUID] | None) -> None:
+        if kind == "shops":
+            await self._load_shops(ids)
+        elif ids is not None:
+            await self._load_tags(ids)
+
+    async def _load_shops(self, shop_ids: list[UUID] | None) -> None:
+        shops = self._shops_statement()
+        links = select(shop_tag.c.shop_id, shop_tag.c.tag_id)
+        if shop_ids is not None:
+            shops = shops.where(Shop.id.in_(shop_ids))
+            links = links.where(shop_tag.c.shop_id.in_(shop_ids))
+        async with primary_session_factory() as session:
+            tag_rows = []
+            if shop_ids is None:
+                tag_rows = (
+                    await session.execute(select(Tag.id, Tag.scope, Tag.name))
+                ).all()
+            shop_rows = (await session.execute(shops)).all()
+            link_rows = (await session.execute(links)).all()
+
+        if shop_ids is None:
+            self.load(shop_rows, tag_rows, link_rows)
+            return
+        tag_ids: dict[UUID, list[UUID]] = {}
+        for shop_id, tag_id in link_rows:
+            tag_ids.setdefault(shop_id, []).append(tag_id)
+        found = set()
+        for shop_id, city, lon, lat in shop_rows:
+            self.set_shop(shop_id, city, lon, lat, tag_ids.get(shop_id, ()))
+            found.add(shop_id)
+        for shop_id in shop_ids:
+            if shop_id not in found:
+                self.discard_shop(shop_id)
+
+    async def _load_tags(self, tag_ids: list[UUID]) -> None:
+        async with primary_session_factory() as session:
+            tags = (
+                await session.execute(
+                    select(Tag.id, Tag.scope, Tag.name).where(Tag.id.in_(tag_ids))
+                )
+            ).all()
+            links = (
+                await session.execute(
+                    select(shop_tag.c.tag_id, shop_tag.c.shop_id).where(
+                        shop_tag.c.tag_id.in_(tag_ids)
+                    )
+                )
+            ).all()
+        members: dict[UUID, list[UUID]] = {}
+        for tag_id, shop_id in links:
+            members.setdefault(tag_id, []).append(shop_id)
+        found = {tag_id: (scope, name) for tag_id, scope, name in tags}
+        for tag_id in tag_ids:
+            if tag_id in found:
+                self.set_tag(tag_id, *found[tag_id], members.get(tag_id, ()))
+            else:
+                self.discard_tag(tag_id)
+
+    # queries
+
+    def counts(
+        self,
+        in_bbox: str | None = None,
+        city: str | None = None,
+        tag_filter: TagFilter | None = None,
+        shop_ids: Iterable[UUID] | None = None,
+    ) -> ShopFacets:
+        """Facet counts over the shops matching every given filter.
+
+        `shop_ids` narrows to shops matched elsewhere, like a bbox too wide or
+        inverted for `in_bbox`, which raises ValueError on those.
+        """
+        selected = self._live
+        if shop_ids is not None:
+            ordinals = [self._ordinals.get(shop_id) for shop_id in shop_ids]
+            mask = np.zeros(len(self._lon), bool)
+            mask[[i for i in ordinals if i is not None]] = True
+            selected &= pack(mask)
+        if city is not None:
+            selected &= self._cities.get(city, 0)
+        if in_bbox is not None:
+            envelope = bbox_envelope(in_bbox)
+            if envelope is None:
+                raise ValueError("bbox must be less than 180 degrees wide")
+            bbox, (x1, y1, x2, y2) = envelope
+            lon, lat = self._lon, self._lat
+            # cheap envelope test first; free ordinals hold NaN, which is never inside
+            (near,) = np.nonzero((lon >= x1) & (lon <= x2) & (lat >= y1) & (lat <= y2))
+            mask = np.zeros(len(lon), bool)
+            mask[near] = within_bbox(bbox, lon[near], lat[near])
+            selected &= pack(mask)
+        if tag_filter is not None:
+            bitmaps = [
+                tag.bits if (tag := self._names.get(name)) else 0
+                for name in tag_filter.names
+            ]
+            if tag_filter.match == "any":
+                selected &= reduce(or_, bitmaps, 0)
+            else:
+                selected = reduce(lambda a, b: a & b, bitmaps, selected)
+
+        tags = sorted(self._tags.values(), key=lambda tag: (tag.scope, tag.name))
+        scopes: dict[str, int] = {}
+        for tag in tags:
+            scopes[tag.scope] = scopes.get(tag.scope, 0) | tag.bits
+        return ShopFacets(
+            total=selected.bit_count(),
+            scopes={
+                scope: (selected & bits).bit_count() for scope, bits in scopes.items()
+            },
+            tags=[
+                TagFacet(
+                    id=tag.id,
+                    scope=tag.scope,
+                    name=tag.name,
+                    count=(selected & tag.bits).bit_count(),
+                )
+                for tag in tags
+            ],
+        )
+
+
+facet_index = FacetIndex()
@@ -2,14 +2,27 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 from geoalchemy2 import Geography
 from litestar.contrib.sqlalchemy.base import UUIDBase
-from sqlalchemy import Column, ForeignKey, String, Table
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import Column, Computed, ForeignKey, Index, String, Table, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Mapped, mapped_column, query_expression, relationship
 
 if TYPE_CHECKING:
     from somethingcoffee.domain.tags.models import Tag
 
 
-__all__ = ["Shop", "shop_tag"]
+__all__ = ["Shop", "shop_tag", "SEARCH_CONFIG"]
+
+SEARCH_CONFIG = "english"
+# weighted by how much a hit in the column says about the shop
+SEARCH_VECTOR_SQL = " || ".join(
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({columns}, '')), '{weight}')"
+    for columns, weight in (
+        ("name", "A"),
+        ("roaster", "B"),
+        ("city || ' ' || address", "C"),
+        ("description", "D"),
+    )
+)
 
 
 shop_tag = Table(
@@ -17,10 +30,35 @@ shop_tag = Table(
     UUIDBase.metadata,
     Column("shop_id", ForeignKey("shop.id"), primary_key=True),
     Column("tag_id", ForeignKey("tag.id"), primary_key=True),
+    # the primary key covers lookups by shop; this one covers lookups by tag
+    Index("ix_shop_tag_tag_id_shop_id", "tag_id", "shop_id"),
 )
 
 
 class Shop(UUIDBase):
+    __table_args__ = (
+        # planar lookups (tiles, clusters) on the cast used by `utils.shop_geometry`
+        Index(
+            "ix_shop_coordinates_geometry",
+            text("(CAST(coordinates AS geometry(GEOMETRY,4326)))"),
+            postgresql_using="gist",
+        ),
+        Index("ix_shop_search_vector", "search_vector", postgresql_using="gin"),
+        # trigram indexes for typo tolerant search
+        Index(
+            "ix_shop_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_shop_city_trgm",
+            "city",
+            postgresql_using="gin",
+            postgresql_ops={"city": "gin_trgm_ops"},
+        ),
+    )
+
     name: Mapped[str] = mapped_column(String(), unique=True)
     country: Mapped[str]
     city: Mapped[str]
@@ -38,6 +76,11 @@ class Shop(UUIDBase):
     website: Mapped[str | None]
     gmaps_link: Mapped[str | None]
     description: Mapped[str | None]
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True), deferred=True
+    )
+    # only populated by the dwithin and knn queries
+    distance_m: Mapped[float | None] = query_expression()
 
     tags: Mapped[list[Tag]] = relationship(
         secondary=shop_tag,
@@ -25,13 +25,9 @@ class ShopAdminController(Controller):
     )
     async def admin_shops_table(
         self,
-        shop_repo: ShopRepository,
     ) -> Template:
-        shops = parse_obj_as(list[ShopDBFull], await shop_repo.list())
-        return Template(
-            template_name="admin/admin-shop-table.html.jinja",
-            context={"shops": shops},
-        )
+        # rows come from /api/shops/table
+        return Template(template_name="admin/admin-shop-table.html.jinja")
 
     @get(
         path="/create",
@@ -43,7 +39,7 @@ class ShopAdminController(Controller):
     ) -> Template:
         return Template(
             template_name="admin/admin-shop-create.html.jinja",
-            context={"tags": await tag_repo.list()},
+            context={"tags": await tag_repo.list(statement=tag_repo.profile("bare"))},
         )
 
     @get(
@@ -59,8 +55,14 @@ class ShopAdminController(Controller):
             description="The shop to retrieve",
         ),
     ) -> Template:
-        shop = parse_obj_as(ShopDBFull, await shop_repo.get(shop_id))
+        shop = parse_obj_as(
+            ShopDBFull,
+            await shop_repo.get(shop_id, statement=shop_repo.profile("tags")),
+        )
         return Template(
             template_name="admin/admin-shop-edit.html.jinja",
-            context={"shop": shop, "tags": await tag_repo.list()},
+            context={
+                "shop": shop,
+                "tags": await tag_repo.list(statement=tag_repo.profile("bare")),
+            },
         )
@@ -1,19 +1,47 @@
-from typing import Any
+import json
+from typing import Any, Literal
 from uuid import UUID
-from geoalchemy2 import WKTElement
 
-from litestar import Controller, delete, get, patch, post
+from litestar import Controller, Request, Response, delete, get, patch, post
 from litestar.di import Provide
+from litestar.enums import MediaType
+from litestar.exceptions import NotFoundException, ValidationException
 from litestar.params import Parameter
+from litestar.response import Stream
 from litestar.contrib.repository.filters import CollectionFilter
-from sqlalchemy import select, func
+from sqlalchemy import Select, String, case, cast, select, func
 
 from pydantic import parse_obj_as
+from pydantic.json import pydantic_encoder
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from somethingcoffee.core import settings
+from somethingcoffee.core.cache import cache, cached_response
+from somethingcoffee.core.datatables import DataTablesPage, query_table, table_response
+from somethingcoffee.core.pagination import (
+    CursorPage,
+    KeysetParams,
+    keyset,
+    next_cursor,
+    provide_keyset_params,
+)
+from somethingcoffee.domain.shops.bulk import (
+    EXPORT_MEDIA_TYPES,
+    BulkImportResult,
+    ExportFormat,
+    ImportFormat,
+    export_shops,
+    import_shops,
+    parse_records,
+)
+from somethingcoffee.domain.shops.facets import facet_index
 from somethingcoffee.domain.shops.dependencies import (
+    SHOP_TABLE_COLUMNS,
     ShopRepository,
+    TagFilter,
+    provide_shop_fields,
     provide_shop_repo,
+    provide_tag_filter,
 )
 
 from somethingcoffee.domain.tags.dependencies import (
@@ -21,10 +49,96 @@ from somethingcoffee.domain.tags.dependencies import (
     provide_tag_repo,
 )
 
-from somethingcoffee.domain.shops.schemas import ShopCreate, ShopUpdate, ShopDBFull
+from somethingcoffee.domain.shops.schemas import (
+    ShopCluster,
+    ShopCreate,
+    ShopUpdate,
+    ShopDBFull,
+    ShopDBNear,
+    ShopFacets,
+    ShopSummary,
+    ShopSummaryNear,
+)
 from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.shops.spatial_index import (
+    bbox_envelope,
+    load_indexed,
+    seek,
+    shop_index,
+)
 
-from somethingcoffee.domain.shops.utils import geojsonify
+from somethingcoffee.domain.shops.utils import (
+    STREAM_MEDIA_TYPES,
+    bbox_to_polygon,
+    collect_features,
+    distance_from,
+    encode_page,
+    feature_sql,
+    geography_point,
+    geojsonify,
+    near_statement,
+    nearest,
+    search_terms,
+    shop_geometry,
+    stream_shops,
+    tile_bounds,
+    world_envelope,
+)
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MVT_LAYER = "shops"
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+CLUSTER_CELLS_PER_TILE = 4  # grid cells along one 256px tile edge
+
+
+def tile_query(z: int, x: int, y: int) -> Select:
+    """The shops of tile z/x/y, encoded as one MVT layer."""
+    envelope = func.ST_TileEnvelope(z, x, y)
+    # a planar filter, grown by the render buffer so symbols on tile edges aren't
+    # clipped; as geography, the envelope's edges would bow off the tile
+    bounds = func.ST_MakeEnvelope(*tile_bounds(z, x, y, MVT_BUFFER / MVT_EXTENT), 4326)
+    features = (
+        select(
+            cast(Shop.id, String).label("id"),
+            Shop.name,
+            func.ST_AsMVTGeom(
+                func.ST_Transform(shop_geometry, 3857),
+                envelope,
+                MVT_EXTENT,
+                MVT_BUFFER,
+                True,
+            ).label("geom"),
+        )
+        .where(shop_geometry.intersects(bounds))
+        .subquery("tile")
+    )
+    return select(func.ST_AsMVT(features.table_valued(), MVT_LAYER, MVT_EXTENT, "geom"))
+
+
+def cluster_query(in_bbox: str, zoom: int) -> Select:
+    """Shops in the bbox grouped into grid cells, with their counts and centroids."""
+    # snap to a grid whose cells cover a fixed screen area, so the number of
+    # clusters depends on the viewport and not on how many shops it holds
+    cell_size = 360 / (2**zoom * CLUSTER_CELLS_PER_TILE)
+    count = func.count().label("count")
+    return (
+        select(
+            count,
+            func.avg(func.ST_X(shop_geometry)).label("lon"),
+            func.avg(func.ST_Y(shop_geometry)).label("lat"),
+            case((count == 1, func.min(cast(Shop.id, String))), else_=None).label(
+                "shop_id"
+            ),
+        )
+        .where(shop_geometry.intersects(world_envelope(in_bbox)))
+        .group_by(func.ST_SnapToGrid(shop_geometry, cell_size))
+    )
+
+
+def use_index(tag_filter: TagFilter | None) -> bool:
+    # the index only knows points, not tags
+    return shop_index.ready and tag_filter is None
 
 
 class ShopAPIController(Controller):
@@ -34,6 +148,9 @@ class ShopAPIController(Controller):
     dependencies = {
         "shop_repo": Provide(provide_shop_repo),
         "tag_repo": Provide(provide_tag_repo),
+        "keyset_params": Provide(provide_keyset_params),
+        "shop_fields": Provide(provide_shop_fields),
+        "tag_filter": Provide(provide_tag_filter),
     }
 
     # list shops
@@ -44,8 +161,92 @@ class ShopAPIController(Controller):
         summary="List all shops.",
         tags=["shops"],
     )
-    async def list_shops(self, shop_repo: ShopRepository) -> list[ShopDBFull]:
-        return parse_obj_as(list[ShopDBFull], await shop_repo.list())
+    async def list_shops(
+        self,
+        request: Request,
+        shop_repo: ShopRepository,
+        keyset_params: KeysetParams,
+        shop_fields: list[str] | None,
+        fmt: Literal["json", "geojsonseq", "ndjson"] = Parameter(
+            query="format",
+            default="json",
+            description="`json` for a page of shops, or stream every shop as GeoJSONSeq/NDJSON.",
+        ),
+    ) -> Response[CursorPage[ShopDBFull]]:
+        if fmt == "geojsonseq":
+            # a feature only needs the point and a few properties
+            statement = shop_repo.select_fields(("coordinates",))
+            return Stream(
+                stream_shops(statement.order_by(Shop.name, Shop.id), fmt),
+                media_type=STREAM_MEDIA_TYPES[fmt],
+            )
+        if fmt == "ndjson":
+            statement = shop_repo.profile("tags").order_by(Shop.name, Shop.id)
+            return Stream(
+                stream_shops(statement, fmt), media_type=STREAM_MEDIA_TYPES[fmt]
+            )
+
+        async def load() -> bytes:
+            if shop_fields is None:
+                query = keyset(
+                    shop_repo.profile("tags"), (Shop.name, Shop.id), keyset_params
+                )
+                shops = await shop_repo.list(statement=query)
+            else:
+                query = keyset(
+                    shop_repo.select_fields(shop_fields),
+                    (Shop.name, Shop.id),
+                    keyset_params,
+                )
+                shops = await shop_repo.list_rows(query)
+            shops, cursor = next_cursor(
+                shops, keyset_params, key=lambda shop: (shop.name, shop.id)
+            )
+            return encode_page(shops, keyset_params.limit, cursor, shop_fields)
+
+        return await cached_response(
+            request,
+            "shops:list",
+            load,
+            scopes=("shops",),
+            params={
+                "limit": keyset_params.limit,
+                "cursor": keyset_params.cursor or "",
+                "fields": ",".join(shop_fields) if shop_fields is not None else "",
+            },
+        )
+
+    # page through shops for a server-side DataTables table
+    @get(
+        path="/table",
+        operation_id="ShopTable",
+        name="shops:table",
+        summary="Page, order and search shops for a DataTables table.",
+        description=(
+            "Implements the DataTables server-side processing protocol: `draw`, "
+            "`start`, `length`, `search[value]`, `order[i][column|dir]` and "
+            "`columns[i][data|searchable|orderable|search][value]`. Shops can be "
+            "narrowed further with `tags`."
+        ),
+        tags=["shops"],
+    )
+    async def shop_table(
+        self,
+        request: Request,
+        shop_repo: ShopRepository,
+        tag_filter: TagFilter | None,
+    ) -> Response[DataTablesPage[ShopDBFull]]:
+        async def load(params):
+            return await query_table(
+                shop_repo.session,
+                shop_repo.profile("tags"),
+                params,
+                SHOP_TABLE_COLUMNS,
+                Shop.id,
+                narrow=tag_filter.apply if tag_filter is not None else None,
+            )
+
+        return await table_response(request, ShopDBFull, load)
 
     # list shops within distance of central point
     @get(
@@ -58,6 +259,9 @@ class ShopAPIController(Controller):
     async def list_shops_dwithin(
         self,
         db_session: AsyncSession,
+        keyset_params: KeysetParams,
+        shop_fields: list[str] | None,
+        tag_filter: TagFilter | None,
         lon: float = Parameter(
             float,
             title="centroid-lon",
@@ -73,15 +277,139 @@ class ShopAPIController(Controller):
             title="radius",
             description="The radius distance in meters around the centroid to include.",
         ),
-    ) -> list[ShopDBFull]:
-        point = WKTElement(f"Point({lon} {lat})")
-        query = select(Shop).where(func.ST_Dwithin(Shop.coordinates, point, radius))
+        use_spheroid: bool = Parameter(
+            default=True,
+            description="Measure on the WGS84 spheroid, or on a sphere when `false` (cheaper, within 0.5%).",
+        ),
+    ) -> Response[CursorPage[ShopDBNear]]:
+        hits = (
+            shop_index.dwithin(lon, lat, radius, use_spheroid)
+            if use_index(tag_filter)
+            else None
+        )
+        if hits is not None:
+            page, cursor = seek(
+                hits, lambda hit: (hit[0], str(hit[1].id)), keyset_params
+            )
+            rows = await load_indexed(
+                db_session,
+                [shop for _, shop in page],
+                shop_fields,
+                distances=[distance for distance, _ in page],
+            )
+            return Response(
+                encode_page(rows, keyset_params.limit, cursor, shop_fields, near=True),
+                media_type=MediaType.JSON,
+            )
 
-        instances = list((await db_session.execute(query)).scalars())
-        for instance in instances:
-            db_session.expunge(instance)
+        point = geography_point(lon, lat)
+        distance = distance_from(point, use_spheroid)
+        statement = near_statement(shop_fields, distance).where(
+            func.ST_DWithin(Shop.coordinates, point, radius, use_spheroid)
+        )
+        if tag_filter is not None:
+            statement = tag_filter.apply(statement)
+        query = keyset(statement, (distance, Shop.id), keyset_params)
 
-        return parse_obj_as(list[ShopDBFull], instances)
+        result = await db_session.execute(query)
+        rows, cursor = next_cursor(
+            list(result.scalars() if shop_fields is None else result.all()),
+            keyset_params,
+            key=lambda row: (row.distance_m, row.id),
+        )
+        if shop_fields is None:
+            for instance in rows:
+                db_session.expunge(instance)
+
+        return Response(
+            encode_page(rows, keyset_params.limit, cursor, shop_fields, near=True),
+            media_type=MediaType.JSON,
+        )
+
+    # search shops
+    @get(
+        path="/search",
+        operation_id="SearchShops",
+        name="shops:search",
+        summary="Search shops by name, city, address, roaster and description.",
+        description=(
+            "Ranked full-text search, with trigram matching on name and city to "
+            "tolerate typos. Optionally limited to a `bbox`, or to `radius` meters "
+            "around `lon`/`lat`."
+        ),
+        tags=["shops"],
+    )
+    async def search_shops(
+        self,
+        db_session: AsyncSession,
+        keyset_params: KeysetParams,
+        shop_fields: list[str] | None,
+        tag_filter: TagFilter | None,
+        q: str = Parameter(
+            title="query",
+            description="Search terms; supports quoted phrases, `or` and `-word`.",
+            min_length=1,
+        ),
+        in_bbox: str
+        | None = Parameter(
+            query="bbox",
+            default=None,
+            description="Extents of bounding box. (format: minx,miny,maxx,maxy)",
+        ),
+        lon: float
+        | None = Parameter(default=None, description="Longitude of centroid."),
+        lat: float
+        | None = Parameter(default=None, description="Latitude of centroid."),
+        radius: float
+        | None = Parameter(
+            default=None, description="Radius in meters around the centroid."
+        ),
+    ) -> Response[CursorPage[ShopDBFull]]:
+        matches, rank = search_terms(q)
+        if shop_fields is None:
+            statement = select(Shop, rank.label("rank")).options(
+                *ShopRepository.load_profiles["tags"]
+            )
+        else:
+            statement = ShopRepository.select_fields(shop_fields).add_columns(
+                rank.label("rank")
+            )
+        statement = statement.where(matches)
+        if tag_filter is not None:
+            statement = tag_filter.apply(statement)
+        if in_bbox is not None:
+            statement = statement.where(
+                Shop.coordinates.intersects(bbox_to_polygon(in_bbox))
+            )
+        proximity = (lon, lat, radius)
+        if any(v is not None for v in proximity):
+            if any(v is None for v in proximity):
+                raise ValidationException(
+                    "lon, lat and radius must be supplied together"
+                )
+            statement = statement.where(
+                func.ST_Dwithin(Shop.coordinates, geography_point(lon, lat), radius)
+            )
+        # best match first
+        query = keyset(statement, (-rank, Shop.id), keyset_params)
+
+        rows, cursor = next_cursor(
+            list((await db_session.execute(query)).all()),
+            keyset_params,
+            key=lambda row: (
+                -row.rank,
+                row.Shop.id if shop_fields is None else row.id,
+            ),
+        )
+        if shop_fields is None:
+            rows = [row.Shop for row in rows]
+            for instance in rows:
+                db_session.expunge(instance)
+
+        return Response(
+            encode_page(rows, keyset_params.limit, cursor, shop_fields),
+            media_type=MediaType.JSON,
+        )
 
     # list intersect with bbox
     @get(
@@ -94,27 +422,84 @@ class ShopAPIController(Controller):
     async def list_shops_bbox(
         self,
         db_session: AsyncSession,
+        keyset_params: KeysetParams,
+        shop_fields: list[str] | None,
+        tag_filter: TagFilter | None,
         in_bbox: str = Parameter(
             title="bbox",
             description="Extents of bounding box. (format: minx,miny,maxx,maxy)",
         ),
-    ) -> list[ShopDBFull]:
-        try:
-            p1x, p1y, p2x, p2y = (float(n) for n in in_bbox.split(","))
-        except ValueError:
-            raise ValueError(f"Invalid bbox string supplied for parameter {in_bbox}")
+    ) -> Response[CursorPage[ShopDBFull]]:
+        hits = shop_index.bbox(in_bbox) if use_index(tag_filter) else None
+        if hits is not None:
+            page, cursor = seek(
+                hits, lambda shop: (shop.name, str(shop.id)), keyset_params
+            )
+            rows = await load_indexed(db_session, page, shop_fields)
+            return Response(
+                encode_page(rows, keyset_params.limit, cursor, shop_fields),
+                media_type=MediaType.JSON,
+            )
 
-        bbox = WKTElement(
-            f"POLYGON(({p1x} {p1y},{p1x} {p2y},{p2x} {p2y},{p2x} {p1y},{p1x} {p1y}))",
-            srid=4326,
+        bbox = bbox_to_polygon(in_bbox)
+        if shop_fields is None:
+            statement = select(Shop).options(*ShopRepository.load_profiles["tags"])
+        else:
+            statement = ShopRepository.select_fields(shop_fields)
+        statement = statement.where(Shop.coordinates.intersects(bbox))
+        if tag_filter is not None:
+            statement = tag_filter.apply(statement)
+        # code point order, so pages agree with the spatial index
+        query = keyset(statement, (Shop.name.collate("C"), Shop.id), keyset_params)
+
+        result = await db_session.execute(query)
+        rows, cursor = next_cursor(
+            list(result.scalars() if shop_fields is None else result.all()),
+            keyset_params,
+            key=lambda shop: (shop.name, shop.id),
         )
-        query = select(Shop).where(Shop.coordinates.intersects(bbox))
+        if shop_fields is None:
+            for instance in rows:
+                db_session.expunge(instance)
 
-        instances = list((await db_session.execute(query)).scalars())
-        for instance in instances:
-            db_session.expunge(instance)
+        return Response(
+            encode_page(rows, keyset_params.limit, cursor, shop_fields),
+            media_type=MediaType.JSON,
+        )
 
-        return parse_obj_as(list[ShopDBFull], instances)
+    # list marker clusters inside bbox
+    @get(
+        path="/clusters",
+        operation_id="ListShopClusters",
+        name="shops:listclusters",
+        summary="List shop marker clusters inside a bounding box at a zoom level.",
+        tags=["shops"],
+    )
+    async def list_shop_clusters(
+        self,
+        db_session: AsyncSession,
+        in_bbox: str = Parameter(
+            query="bbox",
+            title="bbox",
+            description="Extents of bounding box. (format: minx,miny,maxx,maxy)",
+        ),
+        zoom: int = Parameter(
+            title="zoom",
+            description="Map zoom level; clusters get finer as it increases.",
+            ge=0,
+            le=30,
+        ),
+    ) -> list[ShopCluster]:
+        query = cluster_query(in_bbox, zoom)
+        rows = (await db_session.execute(query)).all()
+        return [
+            ShopCluster(
+                count=row.count,
+                coordinates={"lon": row.lon, "lat": row.lat},
+                shop_id=row.shop_id,
+            )
+            for row in rows
+        ]
 
     # list k-nearest-neighbors of central point
     @get(
@@ -127,6 +512,8 @@ class ShopAPIController(Controller):
     async def list_shops_knn(
         self,
         db_session: AsyncSession,
+        shop_fields: list[str] | None,
+        tag_filter: TagFilter | None,
         lon: float = Parameter(
             title="centroid-lon",
             description="Longitude coordinate of centroid.",
@@ -138,17 +525,56 @@ class ShopAPIController(Controller):
         k: int = Parameter(
             title="k", description="Number of nearest neighbors to include."
         ),
-    ) -> list[ShopDBFull]:
-        point = WKTElement(f"Point({lon} {lat})", srid=4326)
-        query = (
-            select(Shop).order_by(Shop.coordinates.distance_centroid(point)).limit(k)
-        )
+        max_distance: float
+        | None = Parameter(
+            default=None,
+            description="Leave out shops further than this many meters.",
+        ),
+        use_spheroid: bool = Parameter(
+            default=True,
+            description="Measure on the WGS84 spheroid, or on a sphere when `false` (cheaper, within 0.5%).",
+        ),
+    ) -> Response[list[ShopDBNear]]:
+        if use_index(tag_filter):
+            hits = shop_index.knn(lon, lat, k, max_distance, use_spheroid)
+            rows = await load_indexed(
+                db_session,
+                [shop for _, shop in hits],
+                shop_fields,
+                distances=[distance for distance, _ in hits],
+            )
+        else:
+            point = geography_point(lon, lat)
+            statement = near_statement(shop_fields, distance_from(point, use_spheroid))
+            if tag_filter is not None:
+                # the KNN index scan still drives the ordering; tags are checked per row
+                statement = tag_filter.apply(statement)
+            if max_distance is not None:
+                statement = statement.where(
+                    func.ST_DWithin(Shop.coordinates, point, max_distance, use_spheroid)
+                )
+            query = nearest(statement, point, k, use_spheroid)
 
-        instances = list((await db_session.execute(query)).scalars())
-        for instance in instances:
-            db_session.expunge(instance)
+            result = await db_session.execute(query)
+            rows = list(result.scalars() if shop_fields is None else result.all())
+            if shop_fields is None:
+                for instance in rows:
+                    db_session.expunge(instance)
 
-        return parse_obj_as(list[ShopDBFull], instances)
+        if shop_fields is not None:
+            shops = parse_obj_as(list[ShopSummaryNear], rows)
+            return Response(
+                json.dumps(
+                    [
+                        shop.dict(include={"id", "distance_m", *shop_fields})
+                        for shop in shops
+                    ],
+                    default=pydantic_encoder,
+                ).encode(),
+                media_type=MediaType.JSON,
+            )
+
+        return Response(parse_obj_as(list[ShopDBNear], rows), media_type=MediaType.JSON)
 
     # list shops - geojson
     @get(
@@ -160,9 +586,177 @@ class ShopAPIController(Controller):
     )
     async def list_shops_geojson(
         self,
+        request: Request,
         shop_repo: ShopRepository,
-    ) -> dict[str, Any]:
-        return geojsonify(parse_obj_as(list[ShopDBFull], await shop_repo.list()))
+        keyset_params: KeysetParams,
+        fmt: Literal["geojson", "geojsonseq", "ndjson"] = Parameter(
+            query="format",
+            default="geojson",
+            description="`geojson` for a page of features, or stream every shop as GeoJSONSeq/NDJSON.",
+        ),
+    ) -> Response[dict[str, Any]]:
+        if fmt == "geojsonseq":
+            statement = shop_repo.select_fields(("coordinates",))
+            return Stream(
+                stream_shops(statement.order_by(Shop.name, Shop.id), fmt),
+                media_type=STREAM_MEDIA_TYPES[fmt],
+            )
+        if fmt == "ndjson":
+            statement = shop_repo.profile("tags").order_by(Shop.name, Shop.id)
+            return Stream(
+                stream_shops(statement, fmt), media_type=STREAM_MEDIA_TYPES[fmt]
+            )
+
+        async def load() -> bytes:
+            if settings.app.GEOJSON_IN_DB:
+                # features are encoded by postgres; only join them here
+                query = keyset(
+                    select(Shop.name, Shop.id, feature_sql().label("feature")),
+                    (Shop.name, Shop.id),
+                    keyset_params,
+                )
+                rows, cursor = next_cursor(
+                    list((await shop_repo.session.execute(query)).all()),
+                    keyset_params,
+                    key=lambda row: (row.name, row.id),
+                )
+                return collect_features(
+                    [row.feature for row in rows],
+                    limit=keyset_params.limit,
+                    next_cursor=cursor,
+                )
+
+            query = keyset(
+                shop_repo.select_fields(("coordinates",)),
+                (Shop.name, Shop.id),
+                keyset_params,
+            )
+            rows, cursor = next_cursor(
+                await shop_repo.list_rows(query),
+                keyset_params,
+                key=lambda row: (row.name, row.id),
+            )
+            geojson = geojsonify(parse_obj_as(list[ShopSummary], rows))
+            # foreign members, as allowed by RFC 7946 section 6.1
+            geojson.update({"limit": keyset_params.limit, "next_cursor": cursor})
+            return json.dumps(geojson, default=pydantic_encoder).encode()
+
+        return await cached_response(
+            request,
+            "shops:geojson",
+            load,
+            scopes=("shops",),
+            params={"limit": keyset_params.limit, "cursor": keyset_params.cursor or ""},
+        )
+
+    # vector tile of shops (for lazily loaded map layers)
+    @get(
+        path="/tiles/{z:int}/{x:int}/{tile:str}",
+        operation_id="GetShopsTile",
+        name="shops:tile",
+        summary="Get a Mapbox Vector Tile of shops. (format: /tiles/{z}/{x}/{y}.mvt)",
+        tags=["shops"],
+        media_type=MVT_MEDIA_TYPE,
+    )
+    async def get_shops_tile(
+        self,
+        db_session: AsyncSession,
+        z: int = Parameter(title="zoom", description="Zoom level of the tile."),
+        x: int = Parameter(title="x", description="Column of the tile."),
+        tile: str = Parameter(title="y", description="Row of the tile, as `{y}.mvt`."),
+    ) -> Response[bytes]:
+        try:
+            y = int(tile.removesuffix(".mvt"))
+        except ValueError:
+            raise NotFoundException(f"Invalid tile {z}/{x}/{tile}")
+        if not (0 <= z <= 30 and 0 <= x < 2**z and 0 <= y < 2**z):
+            raise NotFoundException(f"Tile {z}/{x}/{y} out of range")
+
+        query = tile_query(z, x, y)
+        mvt = (await db_session.execute(query)).scalar_one()
+        return Response(content=bytes(mvt or b""), media_type=MVT_MEDIA_TYPE)
+
+    # tag facet counts
+    @get(
+        path="/facets",
+        operation_id="ShopFacets",
+        name="shops:facets",
+        summary="Count shops per tag and per tag scope, within a bbox, city and tags.",
+        tags=["shops"],
+    )
+    async def shop_facets(
+        self,
+        db_session: AsyncSession,
+        tag_filter: TagFilter | None,
+        in_bbox: str
+        | None = Parameter(
+            query="bbox",
+            default=None,
+            description="Extents of bounding box. (format: minx,miny,maxx,maxy)",
+        ),
+        city: str | None = Parameter(default=None, description="Exact city name."),
+    ) -> ShopFacets:
+        try:
+            envelope = bbox_envelope(in_bbox) if in_bbox is not None else None
+        except ValueError as e:
+            raise ValidationException(str(e))
+        await facet_index.ensure()
+        if in_bbox is None or envelope is not None:
+            return facet_index.counts(in_bbox, city, tag_filter)
+        # too wide or inverted for the index; match what /bbox's SQL returns
+        shop_ids = await db_session.scalars(
+            select(Shop.id).where(Shop.coordinates.intersects(bbox_to_polygon(in_bbox)))
+        )
+        return facet_index.counts(None, city, tag_filter, shop_ids=shop_ids)
+
+    # bulk import shops
+    @post(
+        path="/bulk",
+        operation_id="BulkImportShops",
+        name="shops:bulk",
+        summary="Import many shops from NDJSON, CSV or a GeoJSON FeatureCollection.",
+        description=(
+            "NDJSON rows and GeoJSON properties take the `ShopCreate` fields. CSV uses "
+            "`lon`/`lat` columns and `;` separated `tag_names`. Shops whose name "
+            "already exists are skipped; bad rows are reported without failing the rest."
+        ),
+        tags=["shops"],
+    )
+    async def bulk_import_shops(
+        self,
+        request: Request,
+        db_session: AsyncSession,
+        fmt: ImportFormat = Parameter(query="format", default="ndjson"),
+    ) -> BulkImportResult:
+        try:
+            records = parse_records(await request.body(), fmt)
+        except ValueError as e:
+            raise ValidationException(str(e))
+        result = await import_shops(db_session, records)
+        await db_session.commit()
+        if result.inserted:
+            await cache.invalidate("shops", "tags")
+            await shop_index.refresh()
+            await facet_index.refresh_shops()
+        return result
+
+    # export every shop (for snapshots and backups)
+    @get(
+        path="/export",
+        operation_id="ExportShops",
+        name="shops:export",
+        summary="Stream the whole shop catalogue, with tag names, as CSV, NDJSON or GeoJSONSeq.",
+        tags=["shops"],
+    )
+    async def export_all_shops(
+        self,
+        fmt: ExportFormat = Parameter(query="format", default="ndjson"),
+    ) -> Stream:
+        return Stream(
+            export_shops(fmt),
+            media_type=EXPORT_MEDIA_TYPES[fmt],
+            headers={"Content-Disposition": f'attachment; filename="shops.{fmt}"'},
+        )
 
     # get shop by id
     @get(
@@ -174,13 +768,30 @@ class ShopAPIController(Controller):
     )
     async def get_shop(
         self,
+        request: Request,
         shop_repo: ShopRepository,
         shop_id: UUID = Parameter(
             title="Shop ID",
             description="The shop to retrieve",
         ),
-    ) -> ShopDBFull:
-        return parse_obj_as(ShopDBFull, await shop_repo.get(shop_id))
+    ) -> Response[ShopDBFull]:
+        async def load() -> bytes:
+            return (
+                parse_obj_as(
+                    ShopDBFull,
+                    await shop_repo.get(shop_id, statement=shop_repo.profile("tags")),
+                )
+                .json()
+                .encode()
+            )
+
+        return await cached_response(
+            request,
+            "shops:get",
+            load,
+            scopes=(f"shop:{shop_id}",),
+            params={"id": shop_id},
+        )
 
     # create shop
     @post(
@@ -200,7 +811,10 @@ class ShopAPIController(Controller):
         dd.update(
             {
                 "coordinates": f"Point({dd['coordinates']['lon']} {dd['coordinates']['lat']})",
-                "tags": await tag_repo.list(CollectionFilter("name", dd["tag_names"]))
+                "tags": await tag_repo.list(
+                    CollectionFilter("name", dd["tag_names"]),
+                    statement=tag_repo.profile("bare"),
+                )
                 if len(dd["tag_names"]) > 0
                 else [],
             }
@@ -208,6 +822,10 @@ class ShopAPIController(Controller):
         del dd["tag_names"]
         obj = await shop_repo.add(Shop(**dd))
         await shop_repo.session.commit()
+        # tag listings embed their shops
+        await cache.invalidate("shops", *(["tags"] if obj.tags else []))
+        await shop_index.refresh([obj.id])
+        await facet_index.refresh_shops([obj.id])
         return parse_obj_as(ShopDBFull, obj)
 
     # update shop by id
@@ -234,15 +852,26 @@ class ShopAPIController(Controller):
             dd[
                 "coordinates"
             ] = f"Point({dd['coordinates']['lon']} {dd['coordinates']['lat']})"
+        # the shop and its tags go in the session without the tags' own shops, so
+        # the models' selectin defaults don't load those during the update
+        await shop_repo.get(shop_id, statement=shop_repo.profile("tags"))
         if "tag_names" in dd:
             dd["tags"] = (
-                (await tag_repo.list(CollectionFilter("name", dd["tag_names"])))
+                (
+                    await tag_repo.list(
+                        CollectionFilter("name", dd["tag_names"]),
+                        statement=tag_repo.profile("bare"),
+                    )
+                )
                 if len(dd["tag_names"]) > 0
                 else []
             )
             del dd["tag_names"]
         obj = await shop_repo.update(Shop(**dd))
         await shop_repo.session.commit()
+        await cache.invalidate("shops", f"shop:{shop_id}", "tags")
+        await shop_index.refresh([shop_id])
+        await facet_index.refresh_shops([shop_id])
         return parse_obj_as(ShopDBFull, obj)
 
     # delete shop by id
@@ -261,5 +890,9 @@ class ShopAPIController(Controller):
             description="The shop to delete",
         ),
     ) -> None:
+        await shop_repo.get(shop_id, statement=shop_repo.profile("tags"))
         _ = await shop_repo.delete(shop_id)
         await shop_repo.session.commit()
+        await cache.invalidate("shops", f"shop:{shop_id}", "tags")
+        await shop_index.refresh([shop_id])
+        await facet_index.refresh_shops([shop_id])
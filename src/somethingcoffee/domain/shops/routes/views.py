@@ -1,8 +1,8 @@
+from typing import Any
 from uuid import UUID
-from litestar import Controller, get
+from litestar import Controller, Request, Response, get
 from litestar.di import Provide
 from litestar.params import Parameter
-from litestar.response import Template
 
 from pydantic import parse_obj_as
 
@@ -11,6 +11,7 @@ from somethingcoffee.domain.shops.dependencies import (
     provide_shop_repo,
 )
 from somethingcoffee.domain.shops.schemas import ShopDBFull
+from somethingcoffee.ui.configs import cached_page
 
 
 class ShopWebController(Controller):
@@ -24,19 +25,39 @@ class ShopWebController(Controller):
     @get(path="", include_in_schema=False)
     async def shop_list_page(
         self,
-        shop_repo: ShopRepository,
-    ) -> Template:
-        shops = parse_obj_as(list[ShopDBFull], await shop_repo.list())
-        return Template("views/shop-list.html.jinja", context={"shops": shops})
+        request: Request,
+    ) -> Response[bytes]:
+        # the table pages through /api/shops/table itself
+        async def load() -> dict[str, Any]:
+            return {}
+
+        return await cached_page(
+            request,
+            "pages:shops",
+            "views/shop-list.html.jinja",
+            load,
+            scopes=(),
+        )
 
     @get(path="/{shop_id:uuid}", include_in_schema=False)
     async def shop_details_page(
         self,
+        request: Request,
         shop_repo: ShopRepository,
         shop_id: UUID = Parameter(
             title="Shop ID",
             description="The shop to retrieve",
         ),
-    ) -> Template:
-        shop = parse_obj_as(ShopDBFull, await shop_repo.get(shop_id))
-        return Template("views/shop-details.html.jinja", context={"shop": shop})
+    ) -> Response[bytes]:
+        async def load() -> dict[str, Any]:
+            shop = await shop_repo.get(shop_id, statement=shop_repo.profile("tags"))
+            return {"shop": parse_obj_as(ShopDBFull, shop)}
+
+        return await cached_page(
+            request,
+            "pages:shop",
+            "views/shop-details.html.jinja",
+            load,
+            scopes=(f"shop:{shop_id}",),
+            params={"id": shop_id},
+        )
@@ -1,4 +1,5 @@
 from __future__ import annotations
+import struct
 from geoalchemy2 import WKBElement, shape
 from pydantic import BaseModel, UUID4, validator, HttpUrl
 from shapely.geometry import Point
@@ -11,6 +12,12 @@ __all__ = [
     "ShopUpdate",
     "ShopDB",
     "ShopDBFull",
+    "ShopDBNear",
+    "ShopSummary",
+    "ShopSummaryNear",
+    "ShopCluster",
+    "TagFacet",
+    "ShopFacets",
 ]
 
 
@@ -51,21 +58,52 @@ class ShopUpdate(BaseModel):
     tag_names: list[str] | None
 
 
+# 2D points are all we store, so read their x/y straight out of the (E)WKB bytes
+# instead of building a shapely geometry per row
+WKB_POINT = 1
+EWKB_SRID_POINT = 0x20000000 | WKB_POINT
+WKB_HEADER = {"<": struct.Struct("<I"), ">": struct.Struct(">I")}
+WKB_XY = {"<": struct.Struct("<dd"), ">": struct.Struct(">dd")}
+
+
+def decode_wkb_point(data: bytes | str) -> tuple[float, float] | None:
+    """Read x/y from a 2D (E)WKB point, or `None` if it is anything else."""
+    if isinstance(data, str):
+        data = bytes.fromhex(data)
+    if len(data) == 21:
+        offset = 5
+    elif len(data) == 25:
+        offset = 9  # EWKB, srid follows the type
+    else:
+        return None
+    order = "<" if data[0] == 1 else ">"
+    (geom_type,) = WKB_HEADER[order].unpack_from(data, 1)
+    if geom_type != (WKB_POINT if offset == 5 else EWKB_SRID_POINT):
+        return None
+    return WKB_XY[order].unpack_from(data, offset)
+
+
+def wkb_to_coords(v):
+    if isinstance(v, WKBElement):
+        xy = decode_wkb_point(v.data)
+        if xy is not None:
+            # already floats, nothing to validate
+            return Coordinates.construct(lon=xy[0], lat=xy[1])
+        p = shape.to_shape(v)  # convert WKBElement to shapely Point
+        if p and isinstance(p, Point):
+            return Coordinates(lon=p.x, lat=p.y)
+        else:
+            raise TypeError("couldn't convert returned WKB element to shapely Point")
+    else:
+        return v
+
+
 class ShopDB(ShopBase):
     id: UUID4
 
     @validator("coordinates", pre=True)
     def to_coords(cls, v):
-        if isinstance(v, WKBElement):
-            p = shape.to_shape(v)  # convert WKBElement to shapely Point
-            if p and isinstance(p, Point):
-                return Coordinates(lon=p.x, lat=p.y)
-            else:
-                raise TypeError(
-                    "couldn't convert returned WKB element to shapely Point"
-                )
-        else:
-            return v
+        return wkb_to_coords(v)
 
     class Config:
         orm_mode = True
@@ -76,3 +114,53 @@ from somethingcoffee.domain.tags.schemas import TagDB  # noqa: E402
 
 class ShopDBFull(ShopDB):
     tags: list[TagDB]
+
+
+class ShopDBNear(ShopDBFull):
+    distance_m: float  # from the query point
+
+
+class ShopSummary(BaseModel):
+    """A shop with only some of its columns loaded; see `ShopRepository.select_fields`."""
+
+    id: UUID4
+    name: str | None
+    country: str | None
+    city: str | None
+    address: str | None
+    coordinates: Coordinates | None
+    roaster: str | None
+    hours_of_operation: str | None
+    website: HttpUrl | None
+    gmaps_link: HttpUrl | None
+    description: str | None
+
+    @validator("coordinates", pre=True)
+    def to_coords(cls, v):
+        return wkb_to_coords(v)
+
+    class Config:
+        orm_mode = True
+
+
+class ShopSummaryNear(ShopSummary):
+    distance_m: float
+
+
+class ShopCluster(BaseModel):
+    count: int
+    coordinates: Coordinates  # centroid of the clustered shops
+    shop_id: UUID4 | None  # only set when the cluster holds a single shop
+
+
+class TagFacet(BaseModel):
+    id: UUID4
+    scope: str
+    name: str
+    count: int  # matching shops with this tag
+
+
+class ShopFacets(BaseModel):
+    total: int  # matching shops
+    scopes: dict[str, int]  # matching shops with any tag of the scope
+    tags: list[TagFacet]
@@ -0,0 +1,443 @@
+import logging
+import math
+from collections.abc import Callable, Iterable, Sequence
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, TypeVar
+from uuid import UUID
+
+import numpy as np
+import shapely
+from geoalchemy2 import Geometry
+from shapely import STRtree
+from sqlalchemy import Select, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from somethingcoffee.core import settings
+from somethingcoffee.core.database import primary_session_factory
+from somethingcoffee.core.notify import notifier
+from somethingcoffee.core.pagination import KeysetParams, cursor_values, next_cursor
+from somethingcoffee.domain.shops.dependencies import ShopRepository
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.shops.schemas import Coordinates
+from somethingcoffee.domain.shops.utils import (
+    MIN_CURVATURE_RADIUS,
+    SPHERE_RADIUS,
+    SPHEROID_SLACK,
+    WGS84_A,
+    WGS84_B,
+    WGS84_F,
+    parse_bbox,
+)
+
+__all__ = [
+    "INDEX_FIELDS",
+    "IndexedShop",
+    "ShopIndex",
+    "shop_index",
+    "bbox_envelope",
+    "within_bbox",
+    "seek",
+    "load_indexed",
+]
+
+T = TypeVar("T")
+Box = tuple[float, float, float, float]  # x1, y1, x2, y2
+
+logger = logging.getLogger(__name__)
+
+# fields the index can serve by itself, without loading rows
+INDEX_FIELDS = frozenset({"id", "name", "coordinates"})
+NOTIFY_CHANNEL = "shop_index"
+REPACK_THRESHOLD = 1024  # changed shops to collect before rebuilding the tree
+
+
+@dataclass
+class IndexedShop:
+    id: UUID
+    name: str
+    lon: float
+    lat: float
+
+
+class ShopIndex:
+    """In-process spatial index over shop points, mirroring the PostGIS queries.
+
+    Points live in compact arrays packed into an STRtree. Shops written since the
+    last pack are kept aside in `_dirty` and checked by brute force, until there are
+    enough of them to repack. Queries return `IndexedShop`s in the same order as the
+    SQL they replace, or `None` when the index can't answer and the database should.
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self._shops: dict[UUID, IndexedShop] = {}
+        self._dirty: set[UUID] = set()
+        self._packed: list[IndexedShop] = []
+        self._tree = STRtree([])
+
+    def __len__(self) -> int:
+        return len(self._shops)
+
+    # building and refreshing
+
+    def load(self, shops: Iterable[IndexedShop]) -> None:
+        self._shops = {shop.id: shop for shop in shops}
+        self._pack()
+        self.ready = True
+
+    def upsert(self, shop: IndexedShop) -> None:
+        self._shops[shop.id] = shop
+        self._mark(shop.id)
+
+    def discard(self, shop_id: UUID) -> None:
+        if self._shops.pop(shop_id, None) is not None:
+            self._mark(shop_id)
+
+    def _mark(self, shop_id: UUID) -> None:
+        self._dirty.add(shop_id)
+        if len(self._dirty) >= REPACK_THRESHOLD:
+            self._pack()
+
+    def _pack(self) -> None:
+        self._packed = list(self._shops.values())
+        lon = np.fromiter((s.lon for s in self._packed), float, len(self._packed))
+        lat = np.fromiter((s.lat for s in self._packed), float, len(self._packed))
+        self._tree = STRtree(shapely.points(lon, lat))
+        self._dirty.clear()
+
+    @staticmethod
+    def statement() -> Select:
+        geom = cast(Shop.coordinates, Geometry(srid=4326))
+        return select(
+            Shop.id,
+            Shop.name,
+            func.ST_X(geom).label("lon"),
+            func.ST_Y(geom).label("lat"),
+        )
+
+    async def rebuild(self) -> None:
+        async with primary_session_factory() as session:
+            rows = (await session.execute(self.statement())).all()
+        self.load(IndexedShop(*row) for row in rows)
+
+    async def refresh(self, shop_ids: Iterable[UUID] | None = None) -> None:
+        """Reload `shop_ids` (everything if `None`) and tell other workers to as well."""
+        if not self.ready:
+            return
+        await self._reload(shop_ids)
+        ids = "*" if shop_ids is None else ",".join(str(i) for i in shop_ids)
+        await notifier.publish(NOTIFY_CHANNEL, ids)
+
+    async def _reload(self, shop_ids: Iterable[UUID] | None) -> None:
+        if shop_ids is None:
+            await self.rebuild()
+            return
+        shop_ids = list(shop_ids)
+        async with primary_session_factory() as session:
+            rows = (
+                await session.execute(self.statement().where(Shop.id.in_(shop_ids)))
+            ).all()
+        found = {row.id: IndexedShop(*row) for row in rows}
+        for shop_id in shop_ids:
+            if shop_id in found:
+                self.upsert(found[shop_id])
+            else:
+                self.discard(shop_id)
+
+    async def start(self) -> None:
+        """Build from the database and follow other workers' writes."""
+        if not settings.app.SPATIAL_INDEX:
+            return
+        await self.rebuild()
+        await notifier.subscribe(NOTIFY_CHANNEL, self._on_notify)
+        logger.info("shop index ready with %d shops", len(self))
+
+    async def _on_notify(self, ids: str) -> None:
+        await self._reload(
+            None if ids == "*" else [UUID(i) for i in ids.split(",") if i]
+        )
+
+    # queries
+
+    def _candidates(
+        self, boxes: list[Box]
+    ) -> tuple[list[IndexedShop], np.ndarray, np.ndarray]:
+        """Shops whose point falls in any of `boxes`, as (shops, lons, lats)."""
+        hits = np.unique(
+            np.concatenate(
+                [self._tree.query(shapely.box(*box)) for box in boxes]
+                or [np.empty(0, int)]
+            )
+        )
+        shops = [
+            shop
+            for shop in (self._packed[i] for i in hits)
+            if shop.id not in self._dirty
+        ]
+        for shop_id in self._dirty:
+            shop = self._shops.get(shop_id)
+            if shop is not None and any(
+                x1 <= shop.lon <= x2 and y1 <= shop.lat <= y2
+                for x1, y1, x2, y2 in boxes
+            ):
+                shops.append(shop)
+        lon = np.fromiter((s.lon for s in shops), float, len(shops))
+        lat = np.fromiter((s.lat for s in shops), float, len(shops))
+        return shops, lon, lat
+
+    def bbox(self, in_bbox: str) -> list[IndexedShop] | None:
+        """Shops intersecting the bbox polygon, ordered by (name, id).
+
+        The polygon's edges are great circles, as they are for geography in PostGIS,
+        so its north and south edges bow towards the poles.
+        """
+        envelope = bbox_envelope(in_bbox)
+        if envelope is None:
+            return None
+        bbox, box = envelope
+        shops, lon, lat = self._candidates([box])
+        inside = within_bbox(bbox, lon, lat)
+        return sorted(
+            (shop for shop, keep in zip(shops, inside) if keep),
+            key=lambda shop: (shop.name, shop.id),
+        )
+
+    def _around(
+        self, lon: float, lat: float, radius: float
+    ) -> tuple[list[IndexedShop], np.ndarray, np.ndarray, bool]:
+        """Shops surely including all within `radius` meters, and whether that's
+        every shop."""
+        boxes = _radius_boxes(lon, lat, radius)
+        if boxes is not None:
+            return *self._candidates(boxes), False
+        shops = list(self._shops.values())
+        lons = np.fromiter((s.lon for s in shops), float, len(shops))
+        lats = np.fromiter((s.lat for s in shops), float, len(shops))
+        return shops, lons, lats, True
+
+    def dwithin(
+        self, lon: float, lat: float, radius: float, use_spheroid: bool = True
+    ) -> list[tuple[float, IndexedShop]] | None:
+        """(distance, shop) within `radius` meters, nearest first."""
+        boxes = _radius_boxes(lon, lat, radius)
+        if boxes is None:
+            return None
+        shops, lons, lats = self._candidates(boxes)
+        measure = spheroid_distance if use_spheroid else sphere_distance
+        distances = measure(lon, lat, lons, lats)
+        return sorted(
+            ((float(d), shop) for d, shop in zip(distances, shops) if d <= radius),
+            key=lambda pair: (pair[0], pair[1].id),
+        )
+
+    def knn(
+        self,
+        lon: float,
+        lat: float,
+        k: int,
+        max_distance: float | None = None,
+        use_spheroid: bool = True,
+    ) -> list[tuple[float, IndexedShop]]:
+        """(distance, shop) for the `k` nearest shops, like `nearest` in SQL."""
+        k = min(k, len(self._shops))
+        if k <= 0:
+            return []
+        radius = 1000.0 if max_distance is None else min(1000.0, max_distance)
+        while True:
+            shops, lons, lats, everything = self._around(lon, lat, radius)
+            distances = sphere_distance(lon, lat, lons, lats)
+            # everything within `radius` was seen, so k hits there are the k nearest
+            found = everything or (distances <= radius).sum() >= k
+            if found or radius == max_distance:
+                break
+            radius *= 4
+            if max_distance is not None:
+                radius = min(radius, max_distance)
+        order = np.argsort(distances, kind="stable")[:k]
+        if use_spheroid:
+            # the k nearest on the sphere bound how far the k nearest on the
+            # spheroid can be; short of k, anything up to `max_distance` may do
+            bound = float(distances[order[-1]]) if found else radius
+            shops, lons, lats, _ = self._around(lon, lat, bound * SPHEROID_SLACK)
+            distances = spheroid_distance(lon, lat, lons, lats)
+            order = np.lexsort(([str(s.id) for s in shops], distances))[:k]
+        pairs = [(float(distances[i]), shops[i]) for i in order]
+        if max_distance is not None:
+            pairs = [pair for pair in pairs if pair[0] <= max_distance]
+        return pairs
+
+
+def bbox_envelope(in_bbox: str) -> tuple[Box, Box] | None:
+    """The parsed bbox and a lon/lat box covering its great-circle polygon, or
+    `None` for a bbox that's empty or 180 degrees wide or more."""
+    x1, y1, x2, y2 = parse_bbox(in_bbox)
+    if not (x1 < x2 and 0 < x2 - x1 < 180 and y1 < y2):
+        return None
+    half = math.radians(x2 - x1) / 2
+    bulge = [
+        math.degrees(math.atan(math.tan(math.radians(y)) / math.cos(half)))
+        for y in (y1, y2)
+    ]
+    return (x1, y1, x2, y2), (x1, min(y1, *bulge), x2, max(y2, *bulge))
+
+
+def within_bbox(bbox: Box, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Mask of the points inside the bbox polygon, whose edges are great circles."""
+    x1, y1, x2, y2 = bbox
+    lo, hi = _edge_lat(x1, x2, y1, lon), _edge_lat(x1, x2, y2, lon)
+    return (lon >= x1) & (lon <= x2) & (lat >= lo) & (lat <= hi)
+
+
+def _edge_lat(x1: float, x2: float, y: float, lon: np.ndarray) -> np.ndarray:
+    """Latitude at `lon` of the great circle from (x1, y) to (x2, y)."""
+    l1, l2, lam = math.radians(x1), math.radians(x2), np.radians(lon)
+    weight = (np.sin(l2 - lam) + np.sin(lam - l1)) / math.sin(l2 - l1)
+    return np.degrees(np.arctan(math.tan(math.radians(y)) * weight))
+
+
+def _radius_boxes(lon: float, lat: float, radius: float) -> list[Box] | None:
+    """Lon/lat boxes surely covering `radius` meters around a point, or `None` if
+    that is most of the globe."""
+    dlat = math.degrees(radius / MIN_CURVATURE_RADIUS)
+    if abs(lat) + dlat >= 89 or dlat >= 45:
+        return None
+    dlon = min(dlat / math.cos(math.radians(abs(lat) + dlat)), 180)
+    if dlon >= 180:
+        return [(-180, lat - dlat, 180, lat + dlat)]
+    x1, x2 = lon - dlon, lon + dlon
+    boxes = [(max(x1, -180), lat - dlat, min(x2, 180), lat + dlat)]
+    # wrap around the antimeridian
+    if x1 < -180:
+        boxes.append((x1 + 360, lat - dlat, 180, lat + dlat))
+    if x2 > 180:
+        boxes.append((-180, lat - dlat, x2 - 360, lat + dlat))
+    return boxes
+
+
+def sphere_distance(
+    lon: float, lat: float, lons: np.ndarray, lats: np.ndarray
+) -> np.ndarray:
+    """Haversine distance in meters on postgis' sphere."""
+    p1, p2 = math.radians(lat), np.radians(lats)
+    dp, dl = p2 - p1, np.radians(lons - lon)
+    h = np.sin(dp / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * SPHERE_RADIUS * np.arcsin(np.minimum(1, np.sqrt(h)))
+
+
+def spheroid_distance(
+    lon: float, lat: float, lons: np.ndarray, lats: np.ndarray
+) -> np.ndarray:
+    """Vincenty's inverse formula on WGS84, in meters."""
+    f = WGS84_F
+    L = np.radians(lons - lon)
+    u1 = math.atan((1 - f) * math.tan(math.radians(lat)))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(lats)))
+    sin_u1, cos_u1 = math.sin(u1), math.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+
+    lam = L
+    for _ in range(100):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(
+            cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam
+        )
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        # coincident points have sin_lam == 0 too, so alpha is 0 there
+        sin_alpha = cos_u1 * cos_u2 * sin_lam / np.where(sin_sigma == 0, 1, sin_sigma)
+        cos2_alpha = 1 - sin_alpha**2
+        equatorial = cos2_alpha == 0
+        cos_2sm = np.where(
+            equatorial,
+            0,
+            cos_sigma - 2 * sin_u1 * sin_u2 / np.where(equatorial, 1, cos2_alpha),
+        )
+        c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        previous, lam = lam, L + (1 - c) * f * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sm + c * cos_sigma * (-1 + 2 * cos_2sm**2))
+        )
+        if np.all(np.abs(lam - previous) < 1e-12):
+            break
+
+    u_sq = cos2_alpha * (WGS84_A**2 - WGS84_B**2) / WGS84_B**2
+    a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = (
+        b
+        * sin_sigma
+        * (
+            cos_2sm
+            + b
+            / 4
+            * (
+                cos_sigma * (-1 + 2 * cos_2sm**2)
+                - b / 6 * cos_2sm * (-3 + 4 * sin_sigma**2) * (-3 + 4 * cos_2sm**2)
+            )
+        )
+    )
+    return WGS84_B * a * (sigma - delta_sigma)
+
+
+def seek(
+    items: Sequence[T], key: Callable[[T], tuple[Any, ...]], params: KeysetParams
+) -> tuple[list[T], str | None]:
+    """`keyset` and `next_cursor` over items already sorted by `key`.
+
+    Keys use `str` ids, which sort the same as postgres' uuids.
+    """
+    if params.cursor is not None and items:
+        after = tuple(cursor_values(params, [type(v) for v in key(items[0])]))
+        items = [item for item in items if key(item) > after]
+    return next_cursor(list(items[: params.limit + 1]), params, key)
+
+
+async def load_indexed(
+    session: AsyncSession,
+    shops: list[IndexedShop],
+    fields: list[str] | None,
+    distances: Sequence[float] | None = None,
+) -> list[Any]:
+    """Rows for `shops`, in order; straight from the index if `fields` allows.
+
+    With `distances`, each row gets its `distance_m`.
+    """
+    if fields is not None and INDEX_FIELDS.issuperset(fields):
+        rows: list[Any] = [
+            SimpleNamespace(
+                id=shop.id,
+                name=shop.name,
+                coordinates=Coordinates.construct(lon=shop.lon, lat=shop.lat),
+            )
+            for shop in shops
+        ]
+        return _with_distances(rows, distances)
+    ids = [shop.id for shop in shops]
+    if fields is None:
+        statement = select(Shop).options(*ShopRepository.load_profiles["tags"])
+    else:
+        statement = ShopRepository.select_fields(fields)
+    result = await session.execute(statement.where(Shop.id.in_(ids)))
+    rows = list(result.scalars() if fields is None else result.all())
+    if fields is None:
+        for instance in rows:
+            session.expunge(instance)
+    by_id = {row.id: row for row in rows}
+    if distances is None:
+        return [by_id[shop_id] for shop_id in ids if shop_id in by_id]
+    # rows deleted since the index saw them drop out with their distance
+    kept = [(by_id[i], d) for i, d in zip(ids, distances) if i in by_id]
+    rows = [
+        row if fields is None else SimpleNamespace(**row._asdict()) for row, _ in kept
+    ]
+    return _with_distances(rows, [d for _, d in kept])
+
+
+def _with_distances(rows: list[Any], distances: Sequence[float] | None) -> list[Any]:
+    if distances is not None:
+        for row, distance in zip(rows, distances):
+            row.distance_m = distance
+    return rows
+
+
+shop_index = ShopIndex()
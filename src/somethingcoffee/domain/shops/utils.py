@@ -1,25 +1,322 @@
-from typing import Any
+import json
+import math
+from collections.abc import AsyncIterator, Sequence
+from typing import Any, Literal
 
+from geoalchemy2 import Geography, Geometry, WKTElement
+from markupsafe import Markup
+from pydantic import parse_obj_as
+from pydantic.json import pydantic_encoder
+from sqlalchemy import (
+    JSON,
+    ColumnElement,
+    Float,
+    Select,
+    cast,
+    func,
+    literal,
+    literal_column,
+    select,
+)
+from sqlalchemy.orm import with_expression
+
+from somethingcoffee.core.database import async_session_factory
+from somethingcoffee.core.timing import phase
+from somethingcoffee.core.pagination import CursorPage
 from somethingcoffee.domain.shops import schemas
+from somethingcoffee.domain.shops.dependencies import ShopRepository
+from somethingcoffee.domain.shops.models import SEARCH_CONFIG, Shop
+
+STREAM_BATCH_SIZE = 500
+GEOJSON_MAX_DIGITS = 15  # enough to round-trip a double
+
+# WGS84, as used by postgis for geography
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+SPHERE_RADIUS = (2 * WGS84_A + WGS84_B) / 3  # postgis' sphere for `<->`
+MIN_CURVATURE_RADIUS = WGS84_A * (1 - WGS84_F) ** 2  # meridional, at the equator
+MAX_CURVATURE_RADIUS = WGS84_A / (1 - WGS84_F)  # at the poles
+# spheroid and sphere distances differ by less than this factor, either way round
+SPHEROID_SLACK = MAX_CURVATURE_RADIUS / MIN_CURVATURE_RADIUS + 0.001
+
+# planar lon/lat of a shop, for filters that don't want great-circle edges;
+# `ix_shop_coordinates_geometry` indexes this exact expression
+shop_geometry = cast(Shop.coordinates, Geometry(srid=4326))
+
+StreamFormat = Literal["geojsonseq", "ndjson"]
+STREAM_MEDIA_TYPES: dict[str, str] = {
+    "geojsonseq": "application/geo+json-seq",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def parse_bbox(in_bbox: str) -> tuple[float, float, float, float]:
+    """Parse a `minx,miny,maxx,maxy` string."""
+    try:
+        p1x, p1y, p2x, p2y = (float(n) for n in in_bbox.split(","))
+    except ValueError:
+        raise ValueError(f"Invalid bbox string supplied for parameter {in_bbox}")
+    return p1x, p1y, p2x, p2y
+
+
+def bbox_to_polygon(in_bbox: str) -> WKTElement:
+    p1x, p1y, p2x, p2y = parse_bbox(in_bbox)
+    return WKTElement(
+        f"POLYGON(({p1x} {p1y},{p1x} {p2y},{p2x} {p2y},{p2x} {p1y},{p1x} {p1y}))",
+        srid=4326,
+    )
+
+
+def world_envelope(in_bbox: str) -> ColumnElement[Any]:
+    """The bbox as a planar lon/lat envelope, clamped to the world.
+
+    Zoomed out maps send boxes past the antimeridian, or wider than the world,
+    which as geography would wrap or get great-circle edges.
+    """
+    x1, y1, x2, y2 = parse_bbox(in_bbox)
+    return func.ST_MakeEnvelope(
+        max(x1, -180), max(y1, -90), min(x2, 180), min(y2, 90), 4326
+    )
+
+
+def encode_page(
+    shops: Sequence[Any],
+    limit: int,
+    cursor: str | None,
+    fields: list[str] | None,
+    near: bool = False,
+) -> bytes:
+    """Encode a page of full shops, or of `ShopSummary` rows with only `fields`.
+
+    With `near`, every shop also carries its `distance_m`.
+    """
+    if fields is None:
+        full = schemas.ShopDBNear if near else schemas.ShopDBFull
+        with phase("validate"):
+            page = CursorPage[full](
+                items=parse_obj_as(list[full], shops),
+                limit=limit,
+                next_cursor=cursor,
+            )
+        with phase("encode"):
+            return page.json().encode()
+    summary = schemas.ShopSummaryNear if near else schemas.ShopSummary
+    with phase("validate"):
+        page = CursorPage[summary](
+            items=parse_obj_as(list[summary], shops),
+            limit=limit,
+            next_cursor=cursor,
+        )
+    include = {
+        "items": {"__all__": {"id", *fields, *(["distance_m"] if near else [])}},
+        "limit": True,
+        "next_cursor": True,
+    }
+    with phase("encode"):
+        return page.json(include=include).encode()
+
+
+def tile_bounds(
+    z: int, x: int, y: int, buffer: float = 0
+) -> tuple[float, float, float, float]:
+    """Lon/lat extent of web mercator tile z/x/y, grown by `buffer` tile widths.
+
+    Mercator tiles are lon/lat rectangles, so this is exact as a planar envelope.
+    Longitudes are clamped to the world instead of wrapping around it.
+    """
+    n = 2**z
+
+    def lon(tx: float) -> float:
+        return min(max(tx / n * 360 - 180, -180), 180)
+
+    def lat(ty: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lon(x - buffer), lat(y + 1 + buffer), lon(x + 1 + buffer), lat(y - buffer)
+
+
+def geography_point(lon: float, lat: float) -> ColumnElement[Any]:
+    """A point typed as geography, so postgis picks the geography functions."""
+    return cast(WKTElement(f"Point({lon} {lat})", srid=4326), Geography(srid=4326))
+
+
+def distance_from(
+    point: ColumnElement[Any], use_spheroid: bool
+) -> ColumnElement[float]:
+    """Meters from `point`; on the sphere this is `<->`, which the GiST index orders by."""
+    if use_spheroid:
+        return func.ST_Distance(Shop.coordinates, point, True, type_=Float)
+    return Shop.coordinates.distance_centroid(point)
+
+
+def near_statement(fields: list[str] | None, distance: ColumnElement[float]) -> Select:
+    """Shops, or only `fields` of them, with `distance` as their `distance_m`."""
+    if fields is None:
+        return select(Shop).options(
+            *ShopRepository.load_profiles["tags"],
+            with_expression(Shop.distance_m, distance),
+        )
+    return ShopRepository.select_fields(fields).add_columns(
+        distance.label("distance_m")
+    )
+
+
+def nearest(
+    statement: Select, point: ColumnElement[Any], k: int, use_spheroid: bool
+) -> Select:
+    """The `k` shops of `statement` nearest to `point`, nearest first.
+
+    Ordering by `<->` lets an index scan on `idx_shop_coordinates` stop after `k`
+    rows, but `<->` on geography is sphere distance. For spheroid distances, the
+    k nearest on the sphere bound a radius that must hold the k nearest on the
+    spheroid, and only the shops within it (found through the same index) are
+    ranked by `ST_Distance`.
+    """
+    nearness = Shop.coordinates.distance_centroid(point)
+    if not use_spheroid:
+        return statement.order_by(nearness).limit(k)
+    knn = select(nearness.label("distance")).order_by(nearness).limit(k)
+    if statement.whereclause is not None:
+        knn = knn.where(statement.whereclause)
+    reach = select(func.max(knn.subquery().c.distance)).scalar_subquery()
+    return (
+        statement.where(
+            func.ST_DWithin(Shop.coordinates, point, reach * SPHEROID_SLACK, False)
+        )
+        .order_by(distance_from(point, True), Shop.id)
+        .limit(k)
+    )
+
+
+def search_terms(q: str) -> tuple[ColumnElement[bool], ColumnElement[float]]:
+    """Where clause and rank for searching shops for `q`.
+
+    Full-text over `Shop.search_vector`, or a trigram match against name/city to
+    catch typos; both are backed by GIN indexes.
+    """
+    tsquery = func.websearch_to_tsquery(
+        literal_column(f"'{SEARCH_CONFIG}'::regconfig"), q
+    )
+    matches = (
+        Shop.search_vector.bool_op("@@")(tsquery)
+        | literal(q).bool_op("<%")(Shop.name)
+        | literal(q).bool_op("<%")(Shop.city)
+    )
+    rank = func.ts_rank_cd(Shop.search_vector, tsquery, type_=Float) + func.greatest(
+        func.word_similarity(q, Shop.name, type_=Float),
+        func.word_similarity(q, Shop.city, type_=Float),
+        type_=Float,
+    )
+    return matches, rank
+
+
+def featurize(shop: schemas.ShopDB | schemas.ShopSummary) -> dict[str, Any]:
+    return {
+        "type": "Feature",
+        "properties": {
+            "id": shop.id,
+            "name": shop.name,
+        },  # perhaps add more attributes here?
+        "geometry": {
+            "type": "Point",
+            "coordinates": [shop.coordinates.lon, shop.coordinates.lat],
+        },
+    }
 
 
 # TODO: think about using geojson_pydantic; easier seralization
-def geojsonify(shops: list[schemas.ShopDBFull]):
+def geojsonify(shops: Sequence[schemas.ShopDB | schemas.ShopSummary]):
     geojson: dict[str, Any] = {"type": "FeatureCollection", "features": []}
-    for shop in shops:
-        feature: dict[str, Any] = {
-            "type": "Feature",
-            "properties": {
-                "id": shop.id,
-                "name": shop.name,
-            },  # perhaps add more attributes here?
-            "geometry": {
-                "type": "Point",
-                "coordinates": [shop.coordinates.lon, shop.coordinates.lat],
-            },
-        }
-        geojson["features"].append(feature)
+    with phase("geojson"):
+        for shop in shops:
+            geojson["features"].append(featurize(shop))
     return geojson
 
 
-# TODO: implement ungeojsonify function
+def feature_sql() -> ColumnElement[Any]:
+    """SQL expression building the same Feature as `featurize`, as json."""
+    return func.json_build_object(
+        "type",
+        "Feature",
+        "properties",
+        func.json_build_object("id", Shop.id, "name", Shop.name),
+        "geometry",
+        cast(func.ST_AsGeoJSON(Shop.coordinates, GEOJSON_MAX_DIGITS), JSON),
+    )
+
+
+def feature_collection_sql(statement: Select) -> Select:
+    """Aggregate the features selected by `statement` into one FeatureCollection.
+
+    `statement` must have a `feature` column, e.g. `feature_sql().label("feature")`.
+    """
+    features = statement.subquery("features")
+    return select(
+        func.json_build_object(
+            "type",
+            "FeatureCollection",
+            "features",
+            func.coalesce(
+                func.json_agg(features.c.feature), literal_column("'[]'::json")
+            ),
+        )
+    )
+
+
+def collect_features(features: list[str], **members: Any) -> bytes:
+    """Join already encoded features into a FeatureCollection document."""
+    extra = "".join(f',"{k}":{json.dumps(v)}' for k, v in members.items())
+    return (
+        '{"type":"FeatureCollection","features":['
+        + ",".join(features)
+        + "]"
+        + extra
+        + "}"
+    ).encode()
+
+
+def htmlsafe_json(raw: str) -> Markup:
+    """Make encoded JSON safe to embed in a <script>, as jinja's `tojson` does."""
+    return Markup(
+        raw.replace("<", "\\u003c")
+        .replace(">", "\\u003e")
+        .replace("&", "\\u0026")
+        .replace("'", "\\u0027")
+    )
+
+
+async def stream_shops(statement: Select, fmt: StreamFormat) -> AsyncIterator[str]:
+    """Encode shops one record at a time as they come off a server-side cursor.
+
+    `statement` selects `Shop` entities for ndjson, or projected columns
+    (`ShopRepository.select_fields`) for geojsonseq. Uses its own session, since
+    the request's session is closed once the response starts.
+    """
+    async with async_session_factory() as session:
+        result = await session.stream(
+            statement.execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        async for row in result:
+            if fmt == "geojsonseq":
+                shop = schemas.ShopSummary.from_orm(row)
+                # RFC 8142: record separator, JSON text, line feed
+                yield "\x1e" + json.dumps(
+                    featurize(shop), default=pydantic_encoder
+                ) + "\n"
+            else:
+                yield schemas.ShopDBFull.from_orm(row[0]).json() + "\n"
+
+
+def ungeojsonify(feature: dict[str, Any]) -> dict[str, Any]:
+    """Turn a Point Feature back into `ShopCreate` input; properties hold the fields."""
+    if feature.get("type") != "Feature" or feature["geometry"]["type"] != "Point":
+        raise ValueError("Expected a Point Feature")
+    lon, lat = feature["geometry"]["coordinates"][:2]
+    properties = dict(feature.get("properties") or {})
+    properties.pop("id", None)
+    return {
+        **properties,
+        "coordinates": {"lon": lon, "lat": lat},
+        "tag_names": properties.get("tag_names", []),
+    }
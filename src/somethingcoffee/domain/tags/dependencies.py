@@ -1,20 +1,52 @@
+from collections.abc import Sequence
 from litestar.contrib.sqlalchemy.repository import SQLAlchemyAsyncRepository
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from typing import Any
+from sqlalchemy import ColumnElement, Select, func, select
+from sqlalchemy.orm import noload, selectinload, with_expression
+from sqlalchemy.sql.base import ExecutableOption
+from somethingcoffee.domain.shops.models import Shop, shop_tag
 from somethingcoffee.domain.tags.models import Tag
 
 __all__ = [
+    "TAG_TABLE_COLUMNS",
     "TagRepository",
     "provide_tag_repo",
 ]
 
+_shop_count = select(func.count()).where(shop_tag.c.tag_id == Tag.id).scalar_subquery()
+
+# what the tag table can order and search on, by DataTables column `data`
+TAG_TABLE_COLUMNS: dict[str, ColumnElement[Any]] = {
+    "id": Tag.id,
+    "scope": Tag.scope,
+    "name": Tag.name,
+    "shop_count": _shop_count,
+}
+
 
 class TagRepository(SQLAlchemyAsyncRepository[Tag]):
     """Tag Repository"""
 
     model_type = Tag
 
+    # relationship loading per endpoint, instead of the models' recursive selectin
+    load_profiles: dict[str, Sequence[ExecutableOption]] = {
+        # TagDB
+        "bare": (noload(Tag.shops),),
+        # TagDBFull; shops come without their own tags
+        "shops": (selectinload(Tag.shops).noload(Shop.tags),),
+        # TagDBCount
+        "shop_count": (
+            noload(Tag.shops),
+            with_expression(Tag.shop_count, _shop_count),
+        ),
+    }
+
+    def profile(self, name: str) -> Select:
+        """The repository statement with the loading profile `name` applied."""
+        return self.statement.options(*self.load_profiles[name])
+
 
 async def provide_tag_repo(db_session: AsyncSession) -> TagRepository:
     return TagRepository(
@@ -2,7 +2,7 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 from litestar.contrib.sqlalchemy.base import UUIDBase
 from sqlalchemy import String
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, query_expression, relationship
 
 from somethingcoffee.domain.shops.models import shop_tag
 
@@ -21,3 +21,5 @@ class Tag(UUIDBase):
         back_populates="tags",
         lazy="selectin",
     )
+    # only populated by the `shop_count` loading profile
+    shop_count: Mapped[int | None] = query_expression()
@@ -6,7 +6,7 @@ from litestar.response import Template
 from pydantic import parse_obj_as
 
 from somethingcoffee.domain.tags.dependencies import TagRepository, provide_tag_repo
-from somethingcoffee.domain.tags.schemas import TagDBFull
+from somethingcoffee.domain.tags.schemas import TagDB
 
 
 class TagAdminController(Controller):
@@ -21,13 +21,9 @@ class TagAdminController(Controller):
     )
     async def admin_tags_table(
         self,
-        tag_repo: TagRepository,
     ) -> Template:
-        tags = parse_obj_as(list[TagDBFull], await tag_repo.list())
-        return Template(
-            template_name="admin/admin-tag-table.html.jinja",
-            context={"tags": tags},
-        )
+        # rows come from /api/tags/table
+        return Template(template_name="admin/admin-tag-table.html.jinja")
 
     @get(
         path="/create",
@@ -50,7 +46,9 @@ class TagAdminController(Controller):
             description="The tag to retrieve.",
         ),
     ) -> Template:
-        tag = parse_obj_as(TagDBFull, await tag_repo.get(tag_uuid))
+        tag = parse_obj_as(
+            TagDB, await tag_repo.get(tag_uuid, statement=tag_repo.profile("bare"))
+        )
         return Template(
             template_name="admin/admin-tag-edit.html.jinja",
             context={"tag": tag},
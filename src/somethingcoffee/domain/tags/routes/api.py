@@ -1,18 +1,33 @@
 from uuid import UUID
 
-from litestar import Controller, delete, get, patch, post
+from litestar import Controller, Request, Response, delete, get, patch, post
 from litestar.di import Provide
 from litestar.params import Parameter
 
 from pydantic import parse_obj_as
 
 
+from somethingcoffee.core.cache import cache, cached_response
+from somethingcoffee.core.datatables import DataTablesPage, query_table, table_response
+from somethingcoffee.core.pagination import (
+    CursorPage,
+    KeysetParams,
+    keyset,
+    next_cursor,
+    provide_keyset_params,
+)
 from somethingcoffee.domain.tags.dependencies import (
+    TAG_TABLE_COLUMNS,
     TagRepository,
     provide_tag_repo,
 )
 
-from somethingcoffee.domain.tags.schemas import TagCreate, TagUpdate, TagDBFull
+from somethingcoffee.domain.tags.schemas import (
+    TagCreate,
+    TagUpdate,
+    TagDBCount,
+    TagDBFull,
+)
 from somethingcoffee.domain.tags.models import Tag
 
 
@@ -22,6 +37,7 @@ class TagAPIController(Controller):
     path = "/api/tags"
     dependencies = {
         "tag_repo": Provide(provide_tag_repo),
+        "keyset_params": Provide(provide_keyset_params),
     }
 
     # list tags
@@ -34,9 +50,60 @@ class TagAPIController(Controller):
     )
     async def list_tags(
         self,
+        request: Request,
+        tag_repo: TagRepository,
+        keyset_params: KeysetParams,
+    ) -> Response[CursorPage[TagDBFull]]:
+        async def load() -> bytes:
+            query = keyset(tag_repo.profile("shops"), (Tag.name, Tag.id), keyset_params)
+            tags, cursor = next_cursor(
+                await tag_repo.list(statement=query),
+                keyset_params,
+                key=lambda tag: (tag.name, tag.id),
+            )
+            page = CursorPage[TagDBFull](
+                items=parse_obj_as(list[TagDBFull], tags),
+                limit=keyset_params.limit,
+                next_cursor=cursor,
+            )
+            return page.json().encode()
+
+        return await cached_response(
+            request,
+            "tags:list",
+            load,
+            scopes=("tags",),
+            params={"limit": keyset_params.limit, "cursor": keyset_params.cursor or ""},
+        )
+
+    # page through tags for a server-side DataTables table
+    @get(
+        path="/table",
+        operation_id="TagTable",
+        name="tags:table",
+        summary="Page, order and search tags, with their shop counts, for a DataTables table.",
+        description=(
+            "Implements the DataTables server-side processing protocol: `draw`, "
+            "`start`, `length`, `search[value]`, `order[i][column|dir]` and "
+            "`columns[i][data|searchable|orderable|search][value]`."
+        ),
+        tags=["tags"],
+    )
+    async def tag_table(
+        self,
+        request: Request,
         tag_repo: TagRepository,
-    ) -> list[TagDBFull]:
-        return parse_obj_as(list[TagDBFull], await tag_repo.list())
+    ) -> Response[DataTablesPage[TagDBCount]]:
+        async def load(params):
+            return await query_table(
+                tag_repo.session,
+                tag_repo.profile("shop_count"),
+                params,
+                TAG_TABLE_COLUMNS,
+                Tag.id,
+            )
+
+        return await table_response(request, TagDBCount, load)
 
     # get tag by id
     @get(
@@ -48,13 +115,21 @@ class TagAPIController(Controller):
     )
     async def get_tag(
         self,
+        request: Request,
         tag_repo: TagRepository,
         tag_id: UUID = Parameter(
             title="Tag ID",
             description="Tag to retrieve",
         ),
-    ) -> TagDBFull:
-        return parse_obj_as(TagDBFull, await tag_repo.get(tag_id))
+    ) -> Response[TagDBFull]:
+        async def load() -> bytes:
+            tag = await tag_repo.get(tag_id, statement=tag_repo.profile("shops"))
+            return parse_obj_as(TagDBFull, tag).json().encode()
+
+        # embedded shops change with shop writes, which all bump `tags`
+        return await cached_response(
+            request, "tags:get", load, scopes=("tags",), params={"id": tag_id}
+        )
 
     # create tag
     @post(
@@ -71,6 +146,8 @@ class TagAPIController(Controller):
     ) -> TagDBFull:
         obj = await tag_repo.add(Tag(**data.dict()))
         await tag_repo.session.commit()
+        await cache.invalidate("tags")
+        await _refresh_facets(obj.id)
         return parse_obj_as(TagDBFull, obj)
 
     # update tag
@@ -92,8 +169,13 @@ class TagAPIController(Controller):
     ) -> TagDBFull:
         dd = data.dict(exclude_unset=True)
         dd.update({"id": tag_id})
+        # load its shops without their own tags first, see `ShopAPIController.update_shop`
+        await tag_repo.get(tag_id, statement=tag_repo.profile("shops"))
         obj = await tag_repo.update(Tag(**dd))
         await tag_repo.session.commit()
+        # shops embed their tags
+        await cache.invalidate("tags", *_shop_scopes(obj))
+        await _refresh_facets(tag_id)
         return parse_obj_as(TagDBFull, obj)
 
     # delete tag
@@ -112,5 +194,22 @@ class TagAPIController(Controller):
             description="The tag to delete",
         ),
     ) -> None:
-        _ = await tag_repo.delete(tag_id)
+        await tag_repo.get(tag_id, statement=tag_repo.profile("shops"))
+        obj = await tag_repo.delete(tag_id)
         await tag_repo.session.commit()
+        await cache.invalidate("tags", *_shop_scopes(obj))
+        await _refresh_facets(tag_id)
+
+
+def _shop_scopes(tag: Tag) -> list[str]:
+    """Cache scopes of the shops rendering `tag`."""
+    if not tag.shops:
+        return []
+    return ["shops", *(f"shop:{shop.id}" for shop in tag.shops)]
+
+
+async def _refresh_facets(tag_id: UUID) -> None:
+    # imported late, the shops domain imports this package
+    from somethingcoffee.domain.shops.facets import facet_index
+
+    await facet_index.refresh_tags([tag_id])
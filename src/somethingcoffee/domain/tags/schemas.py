@@ -2,7 +2,7 @@ from __future__ import annotations
 from pydantic import BaseModel, UUID4
 
 
-__all__ = ["TagBase", "TagCreate", "TagUpdate", "TagDB", "TagDBFull"]
+__all__ = ["TagBase", "TagCreate", "TagUpdate", "TagDB", "TagDBCount", "TagDBFull"]
 
 
 class TagBase(BaseModel):
@@ -26,6 +26,10 @@ class TagDB(TagBase):
         orm_mode = True
 
 
+class TagDBCount(TagDB):
+    shop_count: int
+
+
 from somethingcoffee.domain.shops.schemas import ShopDB  # noqa: E402
 
 
@@ -1,14 +1,27 @@
+import hashlib
+from collections.abc import Awaitable, Callable, Mapping, Sequence
 from pathlib import Path
-from typing import Final
+from typing import Any, Final
 
+from jinja2 import FileSystemBytecodeCache, Template
+from litestar import Request, Response
 from litestar.contrib.jinja import JinjaTemplateEngine
+from litestar.enums import MediaType
 from litestar.static_files import StaticFilesConfig
 from litestar.template.config import TemplateConfig
 from pydantic.json import pydantic_encoder
 
+from somethingcoffee.core import settings
+from somethingcoffee.core.cache import cached_response
+from somethingcoffee.core.timing import phase
 from somethingcoffee.core.utils import module_to_os_path
 
-__all__ = ["template_config", "static_files_config"]
+__all__ = [
+    "template_config",
+    "static_files_config",
+    "cached_page",
+    "precompile_templates",
+]
 
 DEFAULT_MODULE_NAME = "somethingcoffee"
 BASE_DIR: Final = module_to_os_path(DEFAULT_MODULE_NAME)
@@ -23,9 +36,68 @@ template_config = TemplateConfig(
     engine=JinjaTemplateEngine,
 )
 
-template_config.engine_instance.engine.policies["json.dumps_kwargs"] = {
-    "default": pydantic_encoder
-}
+
+class TimedTemplate(Template):
+    """Jinja template that times rendering as the "render" phase."""
+
+    def render(self, *args: Any, **kwargs: Any) -> str:
+        with phase("render"):
+            return super().render(*args, **kwargs)
+
+
+environment = template_config.engine_instance.engine
+environment.policies["json.dumps_kwargs"] = {"default": pydantic_encoder}
+environment.template_class = TimedTemplate
+if settings.app.TEMPLATE_BYTECODE_CACHE:
+    # compiled templates survive restarts; None picks a private temp directory
+    environment.bytecode_cache = FileSystemBytecodeCache(
+        settings.app.TEMPLATE_CACHE_DIR
+    )
+
+# part of every cached page's key, so pages don't outlive a template change
+TEMPLATES_VERSION = hashlib.sha1(
+    b"".join(
+        path.relative_to(TEMPLATES_DIR).as_posix().encode() + path.read_bytes()
+        for path in sorted(TEMPLATES_DIR.rglob("*.jinja"))
+    )
+).hexdigest()[:16]
+
+
+def precompile_templates() -> None:
+    """Compile every template at startup rather than on its first request."""
+    for name in environment.list_templates(extensions=["jinja"]):
+        environment.get_template(name)
+
+
+async def cached_page(
+    request: Request,
+    name: str,
+    template_name: str,
+    load_context: Callable[[], Awaitable[Mapping[str, Any]]],
+    *,
+    scopes: Sequence[str],
+    params: Mapping[str, Any] | None = None,
+) -> Response[bytes]:
+    """Serve a rendered page through the response cache.
+
+    On a hit neither `load_context` (and its queries) nor the template run. Like
+    any cached response, the page is keyed by its `scopes`' versions, which the
+    write handlers bump.
+    """
+
+    async def render() -> bytes:
+        context = await load_context()
+        template = environment.get_template(template_name)
+        return template.render(request=request, **context).encode()
+
+    return await cached_response(
+        request,
+        name,
+        render,
+        scopes=scopes,
+        params={**(params or {}), "templates": TEMPLATES_VERSION},
+        media_type=MediaType.HTML,
+    )
 
 
 static_files_config = [
@@ -0,0 +1,31 @@
+from collections.abc import AsyncIterator
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from somethingcoffee.core.settings import db
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    return "asyncio"
+
+
+@pytest.fixture
+async def db_session() -> AsyncIterator[AsyncSession]:
+    """Session against `DB_URL`, rolled back afterwards; skips if there's no database."""
+    engine = create_async_engine(db.URL, poolclass=NullPool)
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except (OSError, SQLAlchemyError) as e:
+        await engine.dispose()
+        pytest.skip(f"database not available: {e}")
+
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+        await session.rollback()
+    await engine.dispose()
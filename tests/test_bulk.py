@@ -0,0 +1,97 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from somethingcoffee.domain.shops.bulk import (
+    EXPORT_FIELDS,
+    export_statement,
+    import_shops,
+    parse_records,
+)
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.tags.models import Tag
+
+CSV = b"""name,country,city,address,lon,lat,website,tag_names
+bulk test a,Japan,Tokyo,1-1,139.76,35.68,,bulk test wifi;bulk test oatmilk
+bulk test b,Japan,Osaka,2-2,not a number,34.69,,
+"""
+
+
+def test_parse_csv():
+    (row_a, a), (row_b, b) = parse_records(CSV, "csv")
+    assert row_a == 2 and row_b == 3
+    assert a["coordinates"] == {"lon": "139.76", "lat": "35.68"}
+    assert a["tag_names"] == ["bulk test wifi", "bulk test oatmilk"]
+    assert "website" not in a
+
+
+def test_parse_ndjson_and_geojson_errors():
+    rows = list(parse_records(b'{"name": "x"}\n\nnot json\n', "ndjson"))
+    assert [row for row, _ in rows] == [1, 3]
+    assert isinstance(rows[1][1], ValueError)
+
+    collection = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [2.35, 48.85]},
+                "properties": {"name": "x", "tag_names": ["wifi"]},
+            },
+            {"type": "Feature", "geometry": {"type": "LineString"}},
+            "not a feature",
+        ],
+    }
+    (_, shop), (_, error), (_, other) = parse_records(
+        json.dumps(collection).encode(), "geojson"
+    )
+    assert shop["coordinates"] == {"lon": 2.35, "lat": 48.85}
+    assert shop["tag_names"] == ["wifi"]
+    assert isinstance(error, ValueError)
+    assert isinstance(other, AttributeError)
+
+
+@pytest.mark.parametrize(
+    "content, fmt",
+    [
+        (b"\xff\xfe", "csv"),
+        (b"not json", "geojson"),
+        (b"[1, 2]", "geojson"),
+        (b'{"type": "Feature"}', "geojson"),
+        (b'{"type": "FeatureCollection", "features": 1}', "geojson"),
+    ],
+)
+def test_unreadable_files_fail_before_any_row(content, fmt):
+    with pytest.raises(ValueError):
+        parse_records(content, fmt)
+
+
+@pytest.mark.anyio
+async def test_import_shops(db_session):
+    db_session.add_all(
+        [
+            Tag(scope="bulk test", name="bulk test wifi"),
+            Tag(scope="bulk test", name="bulk test oatmilk"),
+        ]
+    )
+    await db_session.flush()
+
+    result = await import_shops(db_session, parse_records(CSV, "csv"))
+    assert result.inserted == 1
+    assert [e.row for e in result.errors] == [3]
+    shop = await db_session.scalar(select(Shop).where(Shop.name == "bulk test a"))
+    assert {tag.name for tag in shop.tags} == {"bulk test wifi", "bulk test oatmilk"}
+
+    again = await import_shops(db_session, parse_records(CSV, "csv"))
+    assert (again.inserted, again.skipped) == (0, 1)
+
+
+def test_export_columns_read_back_as_csv():
+    columns = [c.name for c in export_statement().selected_columns]
+    assert columns == list(EXPORT_FIELDS)
+    header = ",".join(columns).encode()
+    row = b"\n00000000-0000-0000-0000-000000000000,a,b,c,d,1.5,2.5,,,,,,x;y\n"
+    ((_, record),) = parse_records(header + row, "csv")
+    assert record["coordinates"] == {"lon": "1.5", "lat": "2.5"}
+    assert record["tag_names"] == ["x", "y"]
@@ -0,0 +1,127 @@
+from typing import Any
+
+import anyio
+import pytest
+from litestar import Litestar, Request, Response, get
+from litestar.testing import TestClient
+
+from somethingcoffee.core import cache as cache_module
+from somethingcoffee.core.cache import (
+    CacheStats,
+    MemoryBackend,
+    ResponseCache,
+    cache,
+    cached_response,
+)
+from somethingcoffee.ui.configs import cached_page, static_files_config, template_config
+
+
+def make_cache(max_bytes: int = 1024) -> ResponseCache:
+    stats = CacheStats()
+    return ResponseCache(MemoryBackend(max_bytes, stats), stats, ttl=60)
+
+
+@pytest.mark.anyio
+async def test_read_through_and_invalidate():
+    cache = make_cache()
+    calls = []
+
+    async def load() -> bytes:
+        calls.append(1)
+        return b"shop"
+
+    for _ in range(2):
+        assert await cache.get_or_set("shops:get", load, scopes=("shop:1",)) == b"shop"
+    assert len(calls) == 1
+
+    await cache.invalidate("shop:2")
+    await cache.get_or_set("shops:get", load, scopes=("shop:1",))
+    assert len(calls) == 1
+
+    await cache.invalidate("shop:1")
+    await cache.get_or_set("shops:get", load, scopes=("shop:1",))
+    assert len(calls) == 2
+    assert (cache.stats.hits, cache.stats.misses) == (2, 2)
+
+
+@pytest.mark.anyio
+async def test_lru_eviction_respects_budget():
+    cache = make_cache(max_bytes=10)
+    for i in range(3):
+
+        async def load() -> bytes:
+            return b"12345"
+
+        await cache.get_or_set("page", load, scopes=(), params={"i": i})
+    assert cache.stats.bytes <= 10
+    assert cache.stats.evictions == 1
+
+
+@pytest.mark.anyio
+async def test_invalidations_reach_other_workers(monkeypatch):
+    this, other = make_cache(), make_cache()
+    published = []
+
+    async def publish(channel: str, payload: str) -> None:
+        published.append(payload)
+        await other._on_notify(payload)
+
+    monkeypatch.setattr(cache_module.notifier, "publish", publish)
+    scopes = [f"shop:{i:036}" for i in range(400)]
+    await this.invalidate("tags", *scopes)
+    # split to fit pg_notify's payload limit
+    assert len(published) > 1
+    assert all(len(payload) < 8000 for payload in published)
+    assert await other.backend.versions(["tags", *scopes]) == [1] * 401
+
+
+def test_conditional_get_skips_loader():
+    calls = []
+
+    @get("/thing")
+    async def thing(request: Request) -> bytes:
+        async def load() -> bytes:
+            calls.append(1)
+            return b'{"ok":true}'
+
+        return await cached_response(request, "thing", load, scopes=("things",))
+
+    with TestClient(Litestar([thing])) as client:
+        etag = client.get("/thing").headers["etag"]
+        response = client.get("/thing", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert len(calls) == 1
+
+        anyio.run(cache.invalidate, "things")
+        response = client.get("/thing", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+
+def test_cached_page_skips_loading_and_rendering():
+    calls = []
+
+    @get("/page")
+    async def page(request: Request) -> Response[bytes]:
+        async def load() -> dict[str, Any]:
+            calls.append(1)
+            shop = {"name": "kissa", "coordinates": {"lon": 25, "lat": 60}, "tags": []}
+            return {"shop": shop}
+
+        return await cached_page(
+            request, "page", "views/shop-details.html.jinja", load, scopes=("shop:1",)
+        )
+
+    app = Litestar(
+        [page], template_config=template_config, static_files_config=static_files_config
+    )
+    with TestClient(app) as client:
+        first = client.get("/page")
+        assert first.headers["content-type"].startswith("text/html")
+        assert "Shop Details: kissa" in first.text
+        assert client.get("/page").text == first.text
+        assert len(calls) == 1
+
+        anyio.run(cache.invalidate, "shop:1")
+        client.get("/page")
+        assert len(calls) == 2
@@ -0,0 +1,29 @@
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.util import greenlet_spawn
+
+from somethingcoffee.core.database import MeteredPool
+
+
+@pytest.mark.anyio
+async def test_pool_counts_checkouts_waits_and_timeouts():
+    pool = MeteredPool(MagicMock, pool_size=1, max_overflow=0, timeout=0.05)
+
+    def use_pool():
+        held = pool.connect()
+        assert pool.snapshot()["checked_out"] == 1
+        with pytest.raises(PoolTimeoutError):
+            pool.connect()
+        held.close()
+        pool.connect().close()
+
+    await greenlet_spawn(use_pool)
+    stats = pool.snapshot()
+    assert stats["checkouts"] == 2
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_ms"] >= 50
+    assert stats["checked_out"] == 0
+    assert stats["checked_in"] == 1
+    assert pool.recreate().stats is pool.stats
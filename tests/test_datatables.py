@@ -0,0 +1,144 @@
+import pytest
+from litestar import Litestar, Request, Response, get
+from litestar.testing import TestClient
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from somethingcoffee.core.datatables import (
+    DataTablesParams,
+    query_table,
+    table_response,
+)
+from somethingcoffee.core.pagination import MAX_LIMIT
+from somethingcoffee.domain.shops.dependencies import (
+    SHOP_TABLE_COLUMNS,
+    ShopRepository,
+    TagFilter,
+)
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.tags.models import Tag
+
+
+def request(**params: str) -> dict[str, str]:
+    query = {
+        "draw": "3",
+        "start": "20",
+        "length": "10",
+        "search[value]": "",
+        "order[0][column]": "2",
+        "order[0][dir]": "desc",
+        "order[1][column]": "0",
+        "order[1][dir]": "asc",
+    }
+    for i, data in enumerate(["name", "country", "city", "tags"]):
+        query[f"columns[{i}][data]"] = data
+        query[f"columns[{i}][searchable]"] = "false" if data == "tags" else "true"
+        query[f"columns[{i}][orderable]"] = "false" if data == "tags" else "true"
+        query[f"columns[{i}][search][value]"] = ""
+        query[f"columns[{i}][search][regex]"] = "false"
+    return {**query, **params}
+
+
+def test_parse():
+    params = DataTablesParams.parse(request(**{"columns[2][search][value]": " Tok "}))
+    assert (params.draw, params.start, params.length) == (3, 20, 10)
+    assert [c.data for c in params.columns] == ["name", "country", "city", "tags"]
+    assert params.columns[2].search == "Tok"
+    assert not params.columns[3].orderable
+    assert params.order == [(2, "desc"), (0, "asc")]
+    assert DataTablesParams.parse(request(length="-1")).length == MAX_LIMIT
+
+    for bad in ({"length": "0"}, {"start": "x"}, {"order[0][dir]": "sideways"}):
+        with pytest.raises(ValueError):
+            DataTablesParams.parse(request(**bad))
+
+
+def test_filter_and_page_sql():
+    params = DataTablesParams.parse(
+        request(**{"search[value]": "blue 100%", "columns[1][search][value]": "jap"})
+    )
+    statement = params.page(
+        params.filter(ShopRepository.select_fields(()), SHOP_TABLE_COLUMNS),
+        SHOP_TABLE_COLUMNS,
+        Shop.id,
+    )
+    sql = str(
+        statement.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+    )
+    # each word somewhere in the text columns, with wildcards escaped
+    assert sql.count("ILIKE") == 7
+    assert "%100/%%" in statement.compile().params.values()
+    assert "ORDER BY shop.city DESC, shop.name ASC, shop.id" in sql
+    assert "LIMIT 10 OFFSET 20" in sql
+
+    for bad in ({"order[0][column]": "3"}, {"columns[3][search][value]": "wifi"}):
+        params = DataTablesParams.parse(request(**bad))
+        with pytest.raises(ValueError):
+            params.page(
+                params.filter(Shop.__table__.select(), SHOP_TABLE_COLUMNS),
+                SHOP_TABLE_COLUMNS,
+                Shop.id,
+            )
+
+
+def test_errors_are_reported_to_the_table():
+    class Row(BaseModel):
+        name: str
+
+    @get("/table")
+    async def table(request: Request) -> Response[bytes]:
+        async def load(params):
+            return 2, 1, [{"name": "one"}]
+
+        return await table_response(request, Row, load)
+
+    with TestClient(Litestar([table])) as client:
+        ok = client.get("/table", params=request()).json()
+        bad = client.get("/table", params=request(**{"order[0][dir]": "up"})).json()
+    assert ok == {
+        "draw": 3,
+        "recordsTotal": 2,
+        "recordsFiltered": 1,
+        "data": [{"name": "one"}],
+        "error": None,
+    }
+    assert bad["draw"] == 3 and bad["data"] == [] and "direction" in bad["error"]
+
+
+@pytest.mark.anyio
+async def test_query_table(db_session):
+    wifi = Tag(scope="datatables test", name="datatables test wifi")
+    db_session.add_all(
+        Shop(
+            name=f"datatables test {i}",
+            country="Japan",
+            city="Tokyo" if i % 2 else "Osaka",
+            address=str(i),
+            coordinates=f"Point(139.{i} 35.68)",
+            tags=[wifi] if i < 3 else [],
+        )
+        for i in range(6)
+    )
+    await db_session.flush()
+
+    params = DataTablesParams.parse(
+        request(
+            start="0",
+            **{"search[value]": "datatables test", "columns[2][search][value]": "tok"},
+        )
+    )
+    total, filtered, rows = await query_table(
+        db_session,
+        select(Shop).options(*ShopRepository.load_profiles["tags"]),
+        params,
+        SHOP_TABLE_COLUMNS,
+        Shop.id,
+        narrow=TagFilter(names=[wifi.name], match="any").apply,
+    )
+    assert total >= 6
+    assert filtered == 1
+    assert [shop.name for shop in rows] == ["datatables test 1"]
+    assert [tag.name for tag in rows[0].tags] == [wifi.name]
@@ -0,0 +1,104 @@
+import random
+from uuid import uuid4
+
+import pytest
+
+from somethingcoffee.domain.shops.dependencies import TagFilter
+from somethingcoffee.domain.shops.facets import FacetIndex
+
+CITIES = ["Tokyo", "Osaka", "Kyoto"]
+TAGS = [("amenity", "wifi"), ("amenity", "outlets"), ("offering", "oatmilk")]
+
+
+def test_facets_match_brute_force_after_writes():
+    rng = random.Random(0)
+    tags = {uuid4(): tag for tag in TAGS}
+    shops = {
+        uuid4(): (
+            rng.choice(CITIES),
+            rng.uniform(139, 141),
+            rng.uniform(35, 36),
+            {t for t in tags if rng.random() < 0.4},
+        )
+        for _ in range(500)
+    }
+    index = FacetIndex()
+    index.load(
+        [(shop_id, *shop[:3]) for shop_id, shop in shops.items()],
+        [(tag_id, *tag) for tag_id, tag in tags.items()],
+        [(shop_id, t) for shop_id, (*_, tag_ids) in shops.items() for t in tag_ids],
+    )
+
+    # deletes free ordinals that later inserts reuse; updates move shops around
+    for shop_id in list(shops)[:50]:
+        index.discard_shop(shop_id)
+        del shops[shop_id]
+    for shop_id in list(shops)[:50]:
+        shops[shop_id] = ("Tokyo", 139.5, 35.5, set(tags))
+        index.set_shop(shop_id, *shops[shop_id])
+    for _ in range(20):
+        shop_id = uuid4()
+        shops[shop_id] = ("Kyoto", 140.5, 35.2, set())
+        index.set_shop(shop_id, *shops[shop_id])
+    wifi = next(t for t, (_, name) in tags.items() if name == "wifi")
+    members = [s for s, (*_, tag_ids) in shops.items() if wifi in tag_ids]
+    index.set_tag(wifi, "amenity", "wi-fi", members)
+    tags[wifi] = ("amenity", "wi-fi")
+    assert len(index) == len(shops)
+
+    def expected(keep):
+        matching = {s: v for s, v in shops.items() if keep(*v)}
+        counts = {
+            t: sum(t in tag_ids for *_, tag_ids in matching.values()) for t in tags
+        }
+        scopes = {
+            scope: sum(
+                any(tags[t][0] == scope for t in tag_ids)
+                for *_, tag_ids in matching.values()
+            )
+            for scope, _ in tags.values()
+        }
+        return len(matching), counts, scopes
+
+    oatmilk = next(t for t, (_, name) in tags.items() if name == "oatmilk")
+    cases = [
+        ({}, lambda city, lon, lat, t: True),
+        ({"city": "Tokyo"}, lambda city, lon, lat, t: city == "Tokyo"),
+        # every shop is well clear of the bowed north and south edges
+        ({"in_bbox": "139,34,140,37"}, lambda city, lon, lat, t: lon <= 140),
+        (
+            {"tag_filter": TagFilter(names=["wi-fi", "oatmilk"], match="any")},
+            lambda city, lon, lat, t: bool({wifi, oatmilk} & t),
+        ),
+        (
+            {
+                "city": "Tokyo",
+                "tag_filter": TagFilter(names=["wi-fi", "oatmilk"], match="all"),
+            },
+            lambda city, lon, lat, t: city == "Tokyo" and {wifi, oatmilk} <= t,
+        ),
+        (
+            {"tag_filter": TagFilter(names=["nope"], match="any")},
+            lambda city, lon, lat, t: False,
+        ),
+        # shops a bbox matched in SQL; unknown ids are ignored
+        (
+            {
+                "city": "Osaka",
+                "shop_ids": [s for s, v in shops.items() if v[1] > 140] + [uuid4()],
+            },
+            lambda city, lon, lat, t: city == "Osaka" and lon > 140,
+        ),
+    ]
+    for kwargs, keep in cases:
+        facets = index.counts(**kwargs)
+        total, counts, scopes = expected(keep)
+        assert facets.total == total
+        assert {tag.id: tag.count for tag in facets.tags} == counts
+        assert facets.scopes == scopes
+        assert [tag.name for tag in facets.tags] == ["outlets", "wi-fi", "oatmilk"]
+
+
+def test_facets_reject_wide_bbox():
+    with pytest.raises(ValueError):
+        FacetIndex().counts(in_bbox="-170,0,170,10")
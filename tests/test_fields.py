@@ -0,0 +1,50 @@
+import json
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+from geoalchemy2.shape import from_shape
+from litestar import Litestar, get
+from litestar.di import Provide
+from litestar.testing import TestClient
+from shapely.geometry import Point
+
+from somethingcoffee.domain.shops.dependencies import (
+    ShopRepository,
+    provide_shop_fields,
+)
+from somethingcoffee.domain.shops.utils import encode_page
+
+
+def test_select_fields_columns():
+    statement = ShopRepository.select_fields(["city", "name"])
+    assert [c.name for c in statement.selected_columns] == ["id", "name", "city"]
+    with pytest.raises(ValueError):
+        ShopRepository.select_fields(["tags"])
+
+
+def test_unknown_fields_are_client_errors():
+    @get("/shops", dependencies={"shop_fields": Provide(provide_shop_fields)})
+    async def shops(shop_fields: list[str] | None) -> list[str] | None:
+        return shop_fields
+
+    with TestClient(Litestar([shops])) as client:
+        ok = client.get("/shops", params={"fields": "city, name"})
+        bad = client.get("/shops", params={"fields": "name,bogus"})
+    assert ok.json() == ["city", "name"]
+    assert bad.status_code == 400
+    assert "bogus" in bad.text and "coordinates" in bad.text
+
+
+def test_encode_page_only_requested_fields():
+    row = SimpleNamespace(
+        id=uuid4(),
+        name="Sey",
+        city="Brooklyn",
+        coordinates=from_shape(Point(-73.93, 40.70), srid=4326),
+    )
+    page = json.loads(encode_page([row], 10, None, ["coordinates"]))
+    assert page["items"] == [
+        {"id": str(row.id), "coordinates": {"lon": -73.93, "lat": 40.7}}
+    ]
+    assert page["next_cursor"] is None
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+from pydantic import parse_obj_as
+from pydantic.json import pydantic_encoder
+from sqlalchemy import select
+
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.shops.schemas import ShopDBFull
+from somethingcoffee.domain.shops.utils import (
+    feature_collection_sql,
+    feature_sql,
+    geojsonify,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_feature_collection_sql_matches_geojsonify(db_session):
+    db_session.add_all(
+        [
+            Shop(
+                name="geojson test a",
+                country="Japan",
+                city="Tokyo",
+                address="1-1",
+                coordinates="Point(139.76432229104455 35.68174407122783)",
+                tags=[],
+            ),
+            Shop(
+                name="geojson test b",
+                country="Japan",
+                city="Osaka",
+                address="2-2",
+                coordinates="Point(135.5023 34.6937)",
+                tags=[],
+            ),
+        ]
+    )
+    await db_session.flush()
+    db_session.expunge_all()
+
+    statement = select(Shop).where(Shop.name.like("geojson test %"))
+    shops = parse_obj_as(list[ShopDBFull], (await db_session.scalars(statement)).all())
+    expected = json.loads(json.dumps(geojsonify(shops), default=pydantic_encoder))
+
+    query = feature_collection_sql(
+        select(feature_sql().label("feature")).where(Shop.name.like("geojson test %"))
+    )
+    actual = json.loads((await db_session.execute(query)).scalar_one())
+
+    def by_id(collection):
+        return sorted(collection["features"], key=lambda f: f["properties"]["id"])
+
+    for a, e in zip(by_id(actual), by_id(expected), strict=True):
+        assert a["properties"] == e["properties"]
+        assert a["geometry"]["type"] == e["geometry"]["type"]
+        assert a["geometry"]["coordinates"] == pytest.approx(
+            e["geometry"]["coordinates"]
+        )
@@ -0,0 +1,107 @@
+import random
+
+import pytest
+from sqlalchemy import ClauseElement, Executable, func, select, text
+from sqlalchemy.ext.compiler import compiles
+
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.shops.utils import (
+    distance_from,
+    geography_point,
+    near_statement,
+    nearest,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _explain(element, compiler, **kw):
+    return "EXPLAIN " + compiler.process(element.statement, **kw)
+
+
+async def plan(session, query) -> str:
+    rows = (await session.execute(Explain(query))).scalars()
+    return "\n".join(rows)
+
+
+@pytest.fixture
+async def shops(db_session):
+    rng = random.Random(2)
+    db_session.add_all(
+        Shop(
+            name=f"nearest test {i}",
+            country="Japan",
+            city="Tokyo",
+            address="-",
+            coordinates=f"Point({rng.uniform(139, 140)} {rng.uniform(35, 36)})",
+        )
+        for i in range(300)
+    )
+    await db_session.flush()
+    await db_session.execute(text("ANALYZE shop"))
+    # a handful of rows would otherwise be cheaper to scan whole
+    await db_session.execute(text("SET LOCAL enable_seqscan = off"))
+    return db_session
+
+
+@pytest.mark.parametrize("fields", [None, ["name"]])
+async def test_knn_on_sphere_is_an_ordered_index_scan(shops, fields):
+    point = geography_point(139.5, 35.5)
+    statement = near_statement(fields, distance_from(point, False))
+    explained = await plan(shops, nearest(statement, point, 10, False))
+    assert "Index Scan using idx_shop_coordinates" in explained
+    assert "Order By: (coordinates <-> " in explained
+
+
+async def test_knn_on_spheroid_uses_the_index_twice(shops):
+    point = geography_point(139.5, 35.5)
+    statement = near_statement(None, distance_from(point, True))
+    explained = await plan(shops, nearest(statement, point, 10, True))
+    # the sphere KNN bounding the radius, then the radius search
+    assert "Order By: (coordinates <-> " in explained
+    assert explained.count("idx_shop_coordinates") >= 2
+
+
+@pytest.mark.parametrize("use_spheroid", [True, False])
+async def test_dwithin_uses_the_index(shops, use_spheroid):
+    point = geography_point(139.5, 35.5)
+    query = near_statement(None, distance_from(point, use_spheroid)).where(
+        func.ST_DWithin(Shop.coordinates, point, 5000, use_spheroid)
+    )
+    explained = await plan(shops, query)
+    assert "idx_shop_coordinates" in explained
+    assert "Seq Scan on shop" not in explained
+
+
+async def test_knn_distances_and_cutoff(shops):
+    point = geography_point(139.5, 35.5)
+    ours = Shop.name.startswith("nearest test")
+    for use_spheroid in (True, False):
+        distance = distance_from(point, use_spheroid)
+        query = nearest(
+            near_statement(["name"], distance).where(
+                ours, func.ST_DWithin(Shop.coordinates, point, 20000, use_spheroid)
+            ),
+            point,
+            50,
+            use_spheroid,
+        )
+        rows = (await shops.execute(query)).all()
+        everything = (
+            await shops.execute(
+                select(Shop.id, distance.label("d")).where(ours).order_by("d")
+            )
+        ).all()
+        expected = [row for row in everything if row.d <= 20000][:50]
+        assert [row.id for row in rows] == [row.id for row in expected]
+        assert [row.distance_m for row in rows] == pytest.approx(
+            [row.d for row in expected]
+        )
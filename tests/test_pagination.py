@@ -0,0 +1,49 @@
+from uuid import uuid4
+
+import pytest
+from litestar import Litestar, get
+from litestar.di import Provide
+from litestar.testing import TestClient
+
+from somethingcoffee.core.pagination import (
+    KeysetParams,
+    decode_cursor,
+    encode_cursor,
+    keyset,
+    next_cursor,
+    provide_keyset_params,
+)
+from somethingcoffee.domain.shops.models import Shop
+
+
+def test_cursor_roundtrip():
+    shop_id = uuid4()
+    cursor = encode_cursor((12.5, shop_id))
+    assert decode_cursor(cursor) == [12.5, str(shop_id)]
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_next_cursor_trims_lookahead():
+    params = KeysetParams(limit=2, cursor=None)
+    rows, cursor = next_cursor([1, 2, 3], params, key=lambda r: (r,))
+    assert rows == [1, 2]
+    assert decode_cursor(cursor) == [2]
+    assert next_cursor([1, 2], params, key=lambda r: (r,)) == ([1, 2], None)
+
+
+def test_bad_cursors_are_client_errors():
+    @get("/page", dependencies={"keyset_params": Provide(provide_keyset_params)})
+    async def page(keyset_params: KeysetParams) -> str:
+        return str(keyset(Shop.__table__.select(), (Shop.name, Shop.id), keyset_params))
+
+    with TestClient(Litestar([page])) as client:
+        assert client.get("/page", params={"cursor": "zzz"}).status_code == 400
+        for values in (["a"], ["a", "not a uuid"], [1, 2, 3]):
+            cursor = encode_cursor(values)
+            assert client.get("/page", params={"cursor": cursor}).status_code == 400
+        cursor = encode_cursor(["a", uuid4()])
+        assert client.get("/page", params={"cursor": cursor}).status_code == 200
@@ -0,0 +1,58 @@
+import pytest
+from litestar import Litestar, get
+from litestar.testing import TestClient
+from sqlalchemy import create_engine, select, text
+
+from somethingcoffee.core import settings
+from somethingcoffee.core.profiler import (
+    QueryProfiler,
+    QueryProfilerMiddleware,
+    profiler,
+    shape,
+)
+from somethingcoffee.domain.shops.models import Shop
+
+
+def test_shape_ignores_parameters_and_list_lengths():
+    assert shape("SELECT * FROM shop WHERE id IN ($1, $2)\n AND x = $3") == shape(
+        "SELECT * FROM shop WHERE id IN ($4) AND x = $5"
+    )
+    assert shape("SELECT 1 FROM shop") != shape("SELECT 1 FROM tag")
+
+
+def test_repeated_statements_are_flagged_per_route(monkeypatch):
+    monkeypatch.setattr(settings.app, "PROFILE_QUERIES", True)
+    engine = create_engine("sqlite://")
+    profiler.instrument(engine)
+
+    @get("/loop", name="test:loop")
+    async def loop() -> None:
+        with engine.connect() as conn:
+            for i in range(profiler.repeat_threshold):
+                conn.execute(text("SELECT :i"), {"i": i})
+            conn.execute(text("SELECT 'once'"))
+
+    profiler.clear()
+    app = Litestar([loop], middleware=[QueryProfilerMiddleware])
+    with TestClient(app) as client:
+        client.get("/loop")
+        client.get("/loop")
+    (route,) = profiler.snapshot()["routes"]
+    assert route["route"] == "test:loop"
+    assert route["requests"] == 2
+    assert route["queries_per_request"] == profiler.repeat_threshold + 1
+    assert route["repeated"] == {"SELECT ?": profiler.repeat_threshold}
+
+
+@pytest.mark.anyio
+async def test_slow_reads_are_explained(db_session):
+    slow = QueryProfiler(slow_ms=0, repeat_threshold=5, log_size=2)
+    slow.instrument(db_session.bind.sync_engine)
+    await db_session.execute(select(Shop.id).where(Shop.name == "x"))
+    await db_session.execute(select(Shop.id).where(Shop.name == "y"))  # same shape
+    await db_session.execute(text("CREATE TEMPORARY TABLE profiled AS SELECT 1"))
+    (query,) = slow.slow
+    assert "FROM shop" in query.statement
+    assert "actual time=" in query.plan
+    # and the transaction carries on after the savepoint
+    await db_session.execute(text("SELECT 1"))
@@ -0,0 +1,88 @@
+import pytest
+from litestar.contrib.repository.filters import CollectionFilter
+from pydantic import parse_obj_as
+from sqlalchemy import event
+
+from somethingcoffee.domain.shops.dependencies import ShopRepository
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.tags.dependencies import TagRepository
+from somethingcoffee.domain.tags.models import Tag
+from somethingcoffee.domain.tags.schemas import TagDBCount, TagDBFull
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_tag_profiles_bound_round_trips(db_session):
+    tags = [Tag(scope="profile test", name=f"profile test {i}") for i in range(3)]
+    db_session.add_all(
+        Shop(
+            name=f"profile test shop {i}",
+            country="Japan",
+            city="Tokyo",
+            address=f"{i}-1",
+            coordinates=f"Point(139.76 35.{i})",
+            tags=tags,
+        )
+        for i in range(5)
+    )
+    await db_session.flush()
+    db_session.expunge_all()
+
+    statements = []
+    event.listen(
+        db_session.bind.sync_engine,
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+    tag_repo = TagRepository(session=db_session)
+    ids = [tag.id for tag in tags]
+
+    full = await tag_repo.list(
+        CollectionFilter("id", ids), statement=tag_repo.profile("shops")
+    )
+    assert len(statements) == 2  # tags, then one selectin for their shops
+    assert all(len(tag.shops) == 5 for tag in parse_obj_as(list[TagDBFull], full))
+
+    db_session.expunge_all()
+    statements.clear()
+    counted = await tag_repo.list(
+        CollectionFilter("id", ids), statement=tag_repo.profile("shop_count")
+    )
+    assert len(statements) == 1
+    assert [tag.shop_count for tag in parse_obj_as(list[TagDBCount], counted)] == [
+        5
+    ] * 3
+
+
+async def test_shop_writes_dont_load_other_shops(db_session):
+    tags = [Tag(scope="profile test", name=f"profile write test {i}") for i in range(3)]
+    shops = [
+        Shop(
+            name=f"profile write test shop {i}",
+            country="Japan",
+            city="Tokyo",
+            address=f"{i}-1",
+            coordinates=f"Point(139.76 35.{i})",
+            tags=tags,
+        )
+        for i in range(5)
+    ]
+    db_session.add_all(shops)
+    await db_session.flush()
+    shop_id = shops[0].id
+    db_session.expunge_all()
+
+    # as `update_shop` loads things
+    shop_repo = ShopRepository(session=db_session)
+    tag_repo = TagRepository(session=db_session)
+    await shop_repo.get(shop_id, statement=shop_repo.profile("tags"))
+    names = [tag.name for tag in tags[:2]]
+    new_tags = await tag_repo.list(
+        CollectionFilter("name", names), statement=tag_repo.profile("bare")
+    )
+    obj = await shop_repo.update(Shop(id=shop_id, tags=new_tags))
+    await db_session.flush()
+
+    assert sorted(tag.name for tag in obj.tags) == names
+    loaded = [o for o in db_session.identity_map.values() if isinstance(o, Shop)]
+    assert [shop.id for shop in loaded] == [shop_id]
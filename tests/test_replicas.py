@@ -0,0 +1,121 @@
+import pytest
+from litestar import Litestar, get, post
+from litestar.testing import TestClient
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from somethingcoffee.core import cache as cache_module, database
+from somethingcoffee.core.cache import CacheStats, MemoryBackend, ResponseCache
+from somethingcoffee.core.database import (
+    PIN_COOKIE,
+    ReplicaRoutingMiddleware,
+    RoutingSession,
+    reads_from_replica,
+)
+from somethingcoffee.core.settings import db
+from somethingcoffee.domain.tags.models import Tag
+
+
+def test_session_reads_from_replica_until_it_writes():
+    primary, replica = create_engine("sqlite://"), create_engine("sqlite://")
+
+    class Routed(RoutingSession):
+        replicas = [replica]
+
+    session = Routed(bind=primary)
+    assert session.get_bind() is primary
+    token = reads_from_replica.set(True)
+    try:
+        assert session.get_bind(clause=select(Tag)) is replica
+        assert session.get_bind(clause=insert(Tag)) is primary
+        # and stays there, to read its own write
+        assert session.get_bind(clause=select(Tag)) is primary
+    finally:
+        reads_from_replica.reset(token)
+
+
+def test_middleware_pins_clients_after_writes(monkeypatch):
+    monkeypatch.setattr(database, "replica_engines", [object()])
+
+    @get("/read")
+    async def read() -> bool:
+        return reads_from_replica.get()
+
+    @post("/write")
+    async def write() -> bool:
+        return reads_from_replica.get()
+
+    app = Litestar([read, write], middleware=[ReplicaRoutingMiddleware])
+    with TestClient(app) as client:
+        assert client.get("/read").json() is True
+        response = client.post("/write")
+        assert response.json() is False
+        assert PIN_COOKIE in response.cookies
+        assert client.get("/read").json() is False
+        client.cookies.clear()
+        assert client.get("/read").json() is True
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("enabled", [True, False])
+async def test_fills_of_fresh_writes_read_from_the_primary(enabled, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now)
+    stats = CacheStats()
+    cache = ResponseCache(
+        MemoryBackend(1024, stats), stats, ttl=60, enabled=enabled, pin_seconds=5
+    )
+    routed = []
+
+    async def load() -> bytes:
+        routed.append(reads_from_replica.get())
+        return b"shops"
+
+    async def fill(page: int) -> None:
+        await cache.get_or_set(
+            "shops:list", load, scopes=("shops",), params={"page": page}
+        )
+
+    token = reads_from_replica.set(True)
+    try:
+        await fill(1)  # a version this worker hasn't seen before
+        now += 10
+        await cache.invalidate("shops")
+        await fill(1)
+        assert reads_from_replica.get() is True
+        now += 10
+        await cache.invalidate("tags")
+        await fill(2)
+    finally:
+        reads_from_replica.reset(token)
+    assert routed == [False, False, True]
+
+
+@pytest.mark.anyio
+async def test_reads_reach_the_replica():
+    """Needs `DB_REPLICA_URLS`, e.g. a second local postgres with the same schema."""
+    if not database.replica_engines:
+        pytest.skip("no replicas configured")
+    port = text("SELECT inet_server_port()")
+    factory = async_sessionmaker(
+        database.engine, expire_on_commit=False, sync_session_class=RoutingSession
+    )
+    try:
+        async with database.engine.connect() as conn:
+            primary_port = (await conn.execute(port)).scalar_one()
+        token = reads_from_replica.set(True)
+        try:
+            async with factory() as session:
+                replica_port = (await session.execute(port)).scalar_one()
+                session.add(Tag(scope="replica test", name="replica test"))
+                await session.flush()
+                after_write = (await session.execute(port)).scalar_one()
+                await session.rollback()
+        finally:
+            reads_from_replica.reset(token)
+    except (OSError, SQLAlchemyError) as e:
+        pytest.skip(f"database not available: {e}")
+    replica_ports = {url.port for url in db.REPLICA_URLS}
+    assert str(replica_port) in replica_ports
+    assert after_write == primary_port
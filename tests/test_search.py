@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import select
+
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.shops.utils import search_terms
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_search_ranks_and_tolerates_typos(db_session):
+    db_session.add_all(
+        [
+            Shop(
+                name="search test bottle",
+                country="Japan",
+                city="Kiyosumi",
+                address="1-4-8",
+                coordinates="Point(139.79 35.68)",
+                description="single origin pour over",
+            ),
+            Shop(
+                name="search test roastery",
+                country="Japan",
+                city="Kiyosumi",
+                address="2-2",
+                coordinates="Point(139.80 35.68)",
+                description="we roast a bottle of cold brew daily",
+            ),
+        ]
+    )
+    await db_session.flush()
+
+    async def search(q):
+        matches, rank = search_terms(q)
+        query = (
+            select(Shop.name)
+            .where(matches, Shop.name.startswith("search test"))
+            .order_by(rank.desc())
+        )
+        return list((await db_session.execute(query)).scalars())
+
+    # a name hit outranks a description hit
+    assert await search("bottle") == ["search test bottle", "search test roastery"]
+    assert set(await search("kiyosumy")) == {
+        "search test bottle",
+        "search test roastery",
+    }
+    assert await search("pour-over -roast") == ["search test bottle"]
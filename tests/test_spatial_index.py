@@ -0,0 +1,150 @@
+import random
+from uuid import uuid4
+
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+
+from somethingcoffee.core.pagination import KeysetParams
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.shops.spatial_index import (
+    IndexedShop,
+    ShopIndex,
+    seek,
+    sphere_distance,
+    spheroid_distance,
+)
+from somethingcoffee.domain.shops.utils import (
+    bbox_to_polygon,
+    distance_from,
+    geography_point,
+    nearest,
+)
+
+# Tokyo-ish, spread over ~100km
+LON, LAT = 139.7, 35.7
+
+
+def random_shops(n: int, seed: int = 0) -> list[IndexedShop]:
+    rng = random.Random(seed)
+    return [
+        IndexedShop(
+            uuid4(),
+            f"index test {rng.choice('abcABC')}{i}",
+            LON + rng.uniform(-0.5, 0.5),
+            LAT + rng.uniform(-0.5, 0.5),
+        )
+        for i in range(n)
+    ]
+
+
+def test_spheroid_distance():
+    # a degree of longitude on the equator, and paris to london
+    assert spheroid_distance(0, 0, np.array([1.0]), np.array([0.0]))[
+        0
+    ] == pytest.approx(111319.491, abs=1e-3)
+    d = spheroid_distance(2.3522, 48.8566, np.array([-0.1276]), np.array([51.5072]))
+    assert d[0] == pytest.approx(343923, rel=1e-3)
+
+
+def test_index_matches_brute_force_after_writes():
+    shops = random_shops(2000)
+    index = ShopIndex()
+    index.load(shops[:1500])
+    for shop in shops[1500:]:
+        index.upsert(shop)  # still unpacked
+    for shop in shops[:100]:
+        index.discard(shop.id)
+    live = shops[100:]
+    lon = np.array([s.lon for s in live])
+    lat = np.array([s.lat for s in live])
+
+    distances = spheroid_distance(LON, LAT, lon, lat)
+    expected = sorted((d, s.id) for d, s in zip(distances, live) if d <= 20000)
+    assert [(d, s.id) for d, s in index.dwithin(LON, LAT, 20000)] == pytest.approx(
+        expected
+    )
+
+    order = np.argsort(sphere_distance(LON, LAT, lon, lat), kind="stable")
+    assert [s.id for _, s in index.knn(LON, LAT, 25, use_spheroid=False)] == [
+        live[i].id for i in order[:25]
+    ]
+    expected = sorted((d, s.id) for d, s in zip(distances, live))
+    assert [(d, s.id) for d, s in index.knn(LON, LAT, 25)] == pytest.approx(
+        expected[:25]
+    )
+    # the cutoff wins over k
+    near = [pair for pair in expected if pair[0] <= 5000]
+    assert [(d, s.id) for d, s in index.knn(LON, LAT, 500, 5000)] == pytest.approx(near)
+
+    # small enough that the great circle edges don't matter
+    hits = index.bbox(f"{LON - 0.1},{LAT - 0.1},{LON + 0.1},{LAT + 0.1}")
+    expected = sorted(
+        (s.name, s.id)
+        for s in live
+        if abs(s.lon - LON) <= 0.1 and abs(s.lat - LAT) <= 0.1
+    )
+    assert [(s.name, s.id) for s in hits] == expected
+
+
+def test_seek_pages():
+    index = ShopIndex()
+    index.load(random_shops(300))
+    hits = index.dwithin(LON, LAT, 30000)
+    key = lambda hit: (hit[0], str(hit[1].id))  # noqa: E731
+    seen, cursor = [], None
+    while True:
+        page, cursor = seek(hits, key, KeysetParams(limit=50, cursor=cursor))
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert seen == hits
+
+
+@pytest.mark.anyio
+async def test_index_matches_postgis(db_session):
+    shops = random_shops(500, seed=1)
+    db_session.add_all(
+        Shop(
+            id=s.id,
+            name=s.name,
+            country="Japan",
+            city="Tokyo",
+            address="-",
+            coordinates=f"Point({s.lon} {s.lat})",
+        )
+        for s in shops
+    )
+    await db_session.flush()
+    ours = Shop.name.startswith("index test")
+    rows = (await db_session.execute(ShopIndex.statement().where(ours))).all()
+    index = ShopIndex()
+    index.load(IndexedShop(*row) for row in rows)
+
+    async def ids(query):
+        return list((await db_session.execute(query.where(ours))).scalars())
+
+    for in_bbox in ("139.5,35.5,139.9,35.9", "139.0,35.2,140.3,36.3"):
+        query = (
+            select(Shop.id)
+            .where(Shop.coordinates.intersects(bbox_to_polygon(in_bbox)))
+            .order_by(Shop.name.collate("C"), Shop.id)
+        )
+        assert [s.id for s in index.bbox(in_bbox)] == await ids(query)
+
+    point = geography_point(LON, LAT)
+    for use_spheroid in (True, False):
+        distance = distance_from(point, use_spheroid)
+        query = (
+            select(Shop.id)
+            .where(func.ST_DWithin(Shop.coordinates, point, 15000, use_spheroid))
+            .order_by(distance, Shop.id)
+        )
+        hits = index.dwithin(LON, LAT, 15000, use_spheroid)
+        assert [s.id for _, s in hits] == await ids(query)
+
+        query = nearest(select(Shop.id).where(ours), point, 20, use_spheroid)
+        hits = index.knn(LON, LAT, 20, use_spheroid=use_spheroid)
+        assert [s.id for _, s in hits] == await ids(query)
+        distances = (await db_session.execute(query.add_columns(distance))).all()
+        assert [d for _, d in hits] == pytest.approx([d for _, d in distances])
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import select
+
+from somethingcoffee.domain.shops.dependencies import TagFilter
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.tags.models import Tag
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_tag_filter_any_all(db_session):
+    wifi = Tag(scope="tag filter test", name="tag filter test wifi")
+    oat = Tag(scope="tag filter test", name="tag filter test oatmilk")
+    db_session.add_all(
+        Shop(
+            name=f"tag filter test {name}",
+            country="Japan",
+            city="Tokyo",
+            address=name,
+            coordinates="Point(139.76 35.68)",
+            tags=tags,
+        )
+        for name, tags in (("both", [wifi, oat]), ("wifi", [wifi]), ("none", []))
+    )
+    await db_session.flush()
+
+    async def names(match):
+        tag_filter = TagFilter(names=[wifi.name, oat.name], match=match)
+        query = tag_filter.apply(select(Shop.name)).order_by(Shop.name)
+        return list((await db_session.execute(query)).scalars())
+
+    assert await names("any") == ["tag filter test both", "tag filter test wifi"]
+    assert await names("all") == ["tag filter test both"]
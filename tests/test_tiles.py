@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import select
+
+from somethingcoffee.domain.shops.models import Shop
+from somethingcoffee.domain.shops.routes.api import cluster_query, tile_query
+from somethingcoffee.domain.shops.utils import tile_bounds, world_envelope
+
+
+def shop(name: str, lon: float, lat: float) -> Shop:
+    return Shop(
+        name=name,
+        country="-",
+        city="-",
+        address="-",
+        coordinates=f"Point({lon} {lat})",
+    )
+
+
+def test_tile_bounds():
+    x1, y1, x2, y2 = tile_bounds(2, 1, 0)
+    assert (x1, x2) == (-90, 0)
+    assert (y1, y2) == (
+        pytest.approx(66.5133, abs=1e-4),
+        pytest.approx(85.0511, abs=1e-4),
+    )
+    # the world tile doesn't wrap around, buffer or not
+    x1, y1, x2, y2 = tile_bounds(0, 0, 0, 0.25)
+    assert (x1, x2) == (-180, 180)
+    assert -90 < y1 < -85.06 and 85.06 < y2 < 90
+
+
+@pytest.mark.anyio
+async def test_tile_keeps_shops_inside_its_equator_side_edge(db_session):
+    # as a geography polygon, this tile's south edge bows up to ~72.3 mid-tile
+    db_session.add_all(
+        [
+            shop("tile test inside", -45, 66.6),
+            shop("tile test outside", -45, 65.5),
+        ]
+    )
+    await db_session.flush()
+    mvt = bytes((await db_session.execute(tile_query(2, 1, 0))).scalar_one() or b"")
+    assert b"tile test inside" in mvt
+    assert b"tile test outside" not in mvt
+
+
+def test_world_envelope_is_clamped():
+    envelope = world_envelope("-400,-95,250.5,95")
+    assert list(envelope.compile().params.values()) == [-180, -90, 180, 90, 4326]
+
+
+@pytest.mark.anyio
+async def test_clusters_of_a_box_wider_than_the_world(db_session):
+    db_session.add_all(
+        [
+            shop("cluster test west", -179.5, -60.25),
+            shop("cluster test east", 179.5, -60.25),
+        ]
+    )
+    await db_session.flush()
+    # a zoomed out map's unwrapped bounds, over 360 degrees wide
+    query = cluster_query("-300,-60.5,300,-60", zoom=10).subquery()
+    rows = (await db_session.execute(select(query.c.count, query.c.lon))).all()
+    assert sorted(rows) == [(1, -179.5), (1, 179.5)]
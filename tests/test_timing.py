@@ -0,0 +1,62 @@
+import re
+
+import pytest
+from litestar import Litestar, get
+from litestar.testing import TestClient
+from sqlalchemy import create_engine, text
+
+from somethingcoffee.core.database import RoutingSession
+from somethingcoffee.core.timing import (
+    TimingMiddleware,
+    mark_handled,
+    metrics,
+    phase,
+    time_engine,
+)
+
+COUNT_TO = """
+WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 10000)
+SELECT count(*) FROM c
+"""
+
+
+def test_server_timing_and_metrics():
+    engine = create_engine("sqlite://")
+    time_engine(engine)
+
+    @get("/slow", name="test:slow")
+    async def slow() -> dict[str, int]:
+        with RoutingSession(bind=engine) as session:
+            session.execute(text(COUNT_TO))
+        with phase("validate"):
+            pass
+        return {"ok": 1}
+
+    metrics.clear()
+    app = Litestar([slow], middleware=[TimingMiddleware], after_request=mark_handled)
+    with TestClient(app) as client:
+        response = client.get("/slow")
+        client.get("/slow")
+    header = response.headers["server-timing"]
+    durations = {
+        name: float(ms) for name, ms in re.findall(r"(\w+);dur=([\d.]+)", header)
+    }
+    assert {"sql", "orm", "validate", "app", "encode", "total"} <= set(durations)
+    assert durations["sql"] > 0
+    # the phases partition the request, up to rounding
+    total = durations.pop("total")
+    assert sum(durations.values()) == pytest.approx(total, abs=0.01 * len(durations))
+
+    exposition = metrics.render()
+    labels = 'method="GET",route="test:slow",status="200"'
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in exposition
+    assert f"http_request_duration_seconds_count{{{labels}}} 2" in exposition
+    phase_labels = 'route="test:slow",phase="sql"'
+    assert (
+        f"http_request_phase_duration_seconds_count{{{phase_labels}}} 2" in exposition
+    )
+
+
+def test_phases_are_free_outside_requests():
+    with phase("validate"):
+        pass  # nothing to record into, and nothing raised
@@ -0,0 +1,27 @@
+import shapely
+from geoalchemy2 import WKBElement
+from geoalchemy2.shape import from_shape
+from shapely.geometry import LineString, Point
+
+from somethingcoffee.domain.shops.schemas import decode_wkb_point, wkb_to_coords
+
+
+def test_decode_wkb_point():
+    point = shapely.set_srid(Point(-73.93, 40.7), 4326)
+    ewkb = shapely.to_wkb(point, hex=True, include_srid=True)
+    assert decode_wkb_point(ewkb) == (-73.93, 40.7)
+    assert decode_wkb_point(shapely.to_wkb(point, byte_order=0)) == (-73.93, 40.7)
+    assert decode_wkb_point(shapely.to_wkb(LineString([(0, 0), (1, 1)]))) is None
+
+
+def test_wkb_to_coords_matches_shapely():
+    element = WKBElement(
+        shapely.to_wkb(
+            shapely.set_srid(Point(2.35, 48.85), 4326), hex=True, include_srid=True
+        ),
+        srid=4326,
+        extended=True,
+    )
+    coords = wkb_to_coords(element)
+    assert (coords.lon, coords.lat) == (2.35, 48.85)
+    assert wkb_to_coords(from_shape(Point(2.35, 48.85))) == coords